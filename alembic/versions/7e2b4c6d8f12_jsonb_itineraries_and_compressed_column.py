@@ -0,0 +1,89 @@
+"""Store itinerary JSON as JSONB, index interests, add compressed itinerary column
+
+Revision ID: 7e2b4c6d8f12
+Revises: 3f6a8b2c9d01
+Create Date: 2026-10-17 14:05:31.640219
+
+"""
+
+from typing import Sequence, Union
+
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+from alembic import op
+from travelitinerarybackend.compression import decompress_json
+
+revision: str = "7e2b4c6d8f12"
+down_revision: Union[str, Sequence[str], None] = "3f6a8b2c9d01"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column(
+        "itineraries",
+        sa.Column("generated_itinerary_compressed", sa.LargeBinary(), nullable=True),
+    )
+    if op.get_bind().dialect.name != "postgresql":
+        # SQLite keeps JSON as text either way
+        return
+
+    # rewrites the table, run it in a maintenance window on large databases
+    for column in ("interests", "generated_itinerary"):
+        op.alter_column(
+            "itineraries",
+            column,
+            type_=postgresql.JSONB(),
+            existing_type=sa.JSON(),
+            postgresql_using=f"{column}::jsonb",
+        )
+    with op.get_context().autocommit_block():
+        op.create_index(
+            "ix_itineraries_interests",
+            "itineraries",
+            ["interests"],
+            unique=False,
+            postgresql_using="gin",
+            postgresql_concurrently=True,
+        )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    if op.get_bind().dialect.name == "postgresql":
+        with op.get_context().autocommit_block():
+            op.drop_index(
+                "ix_itineraries_interests",
+                table_name="itineraries",
+                postgresql_concurrently=True,
+            )
+        for column in ("interests", "generated_itinerary"):
+            op.alter_column(
+                "itineraries",
+                column,
+                type_=sa.JSON(),
+                existing_type=postgresql.JSONB(),
+                postgresql_using=f"{column}::json",
+            )
+    # compressed itineraries only live in the column being dropped, move them back
+    itineraries = sa.table(
+        "itineraries",
+        sa.column("id", sa.Integer),
+        sa.column("generated_itinerary", sa.JSON),
+        sa.column("generated_itinerary_compressed", sa.LargeBinary),
+    )
+    bind = op.get_bind()
+    compressed = bind.execute(
+        sa.select(itineraries.c.id, itineraries.c.generated_itinerary_compressed).where(
+            itineraries.c.generated_itinerary_compressed.is_not(None)
+        )
+    ).all()
+    for id, blob in compressed:
+        bind.execute(
+            itineraries.update()
+            .where(itineraries.c.id == id)
+            .values(generated_itinerary=decompress_json(bytes(blob)))
+        )
+    op.drop_column("itineraries", "generated_itinerary_compressed")
@@ -0,0 +1,41 @@
+"""Add index for listing itineraries per user
+
+Revision ID: 9c1d2e7f4a10
+Revises: 5b69b5671cb1
+Create Date: 2026-10-17 10:12:04.118202
+
+"""
+
+from typing import Sequence, Union
+
+import sqlalchemy as sa
+
+from alembic import op
+
+revision: str = "9c1d2e7f4a10"
+down_revision: Union[str, Sequence[str], None] = "5b69b5671cb1"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # build without locking writes on Postgres, CONCURRENTLY can't run in a transaction
+    with op.get_context().autocommit_block():
+        op.create_index(
+            "ix_itineraries_user_id_created_at_id",
+            "itineraries",
+            ["user_id", sa.text("created_at DESC"), sa.text("id DESC")],
+            unique=False,
+            postgresql_concurrently=True,
+        )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    with op.get_context().autocommit_block():
+        op.drop_index(
+            "ix_itineraries_user_id_created_at_id",
+            table_name="itineraries",
+            postgresql_concurrently=True,
+        )
@@ -0,0 +1,127 @@
+"""
+Latency of the GET /api/itinerary query before and after the listing index.
+
+Seeds a scratch database with `--rows` itineraries spread over `--users` users,
+times the endpoint's first-page query without the index, creates the index
+declared in database.py and times it again:
+
+    python -m benchmarks.bench_itinerary_list --rows 1000000
+    python -m benchmarks.bench_itinerary_list --database-url postgresql://...
+
+The database must be empty, tables are created and dropped by the script.
+"""
+
+import argparse
+import datetime
+import os
+import random
+import statistics
+import tempfile
+import time
+
+os.environ.setdefault("ENV_STATE", "test")
+
+import sqlalchemy  # noqa: E402
+
+from travelitinerarybackend.database import (  # noqa: E402
+    itinerary_list_index,
+    itinerary_table,
+    metadata,
+    user_table,
+)
+
+ITINERARY = [{"day": 1, "activities": ["Walk around", "Lunch", "Museum"]}]
+
+
+def seed(engine, rows: int, users: int, batch: int = 20000):
+    with engine.begin() as conn:
+        conn.execute(
+            user_table.insert(),
+            [{"id": i, "email": f"user{i}@bench.com"} for i in range(1, users + 1)],
+        )
+        start = datetime.datetime(2024, 1, 1)
+        for offset in range(0, rows, batch):
+            conn.execute(
+                itinerary_table.insert(),
+                [
+                    {
+                        "user_id": random.randint(1, users),
+                        "destination": "Paris",
+                        "start_date": datetime.date(2025, 8, 1),
+                        "end_date": datetime.date(2025, 8, 3),
+                        "days_count": 3,
+                        "interests": ["food", "art"],
+                        "generated_itinerary": ITINERARY,
+                        "created_at": start + datetime.timedelta(seconds=i),
+                    }
+                    for i in range(offset, min(offset + batch, rows))
+                ],
+            )
+
+
+def list_query(user_id: int, limit: int):
+    # same shape as the first page of GET /api/itinerary
+    return (
+        sqlalchemy.select(itinerary_table)
+        .where(itinerary_table.c.user_id == user_id)
+        .order_by(itinerary_table.c.created_at.desc(), itinerary_table.c.id.desc())
+        .limit(limit + 1)
+    )
+
+
+def time_queries(engine, users: int, queries: int, limit: int) -> list[float]:
+    latencies = []
+    with engine.connect() as conn:
+        for _ in range(queries):
+            query = list_query(random.randint(1, users), limit)
+            start = time.perf_counter()
+            conn.execute(query).fetchall()
+            latencies.append(time.perf_counter() - start)
+    return latencies
+
+
+def report(label: str, latencies: list[float]):
+    ordered = sorted(latencies)
+    p99 = ordered[min(len(ordered) - 1, int(len(ordered) * 0.99))]
+    print(
+        f"{label}: p50={statistics.median(latencies) * 1000:.2f}ms "
+        f"p99={p99 * 1000:.2f}ms (n={len(latencies)})"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument(
+        "--database-url",
+        default=f"sqlite:///{tempfile.gettempdir()}/bench_itinerary.db",
+    )
+    parser.add_argument("--rows", type=int, default=1_000_000)
+    parser.add_argument("--users", type=int, default=10_000)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--limit", type=int, default=50)
+    args = parser.parse_args()
+
+    random.seed(0)
+    engine = sqlalchemy.create_engine(args.database_url)
+    metadata.drop_all(engine)
+    # the tables without the listing index
+    metadata.create_all(engine, tables=[user_table, itinerary_table])
+    itinerary_list_index.drop(engine)
+    try:
+        start = time.perf_counter()
+        seed(engine, args.rows, args.users)
+        print(f"seeded {args.rows} rows in {time.perf_counter() - start:.1f}s")
+
+        latencies = time_queries(engine, args.users, args.queries, args.limit)
+        report("without index", latencies)
+        start = time.perf_counter()
+        itinerary_list_index.create(engine)
+        print(f"created index in {time.perf_counter() - start:.1f}s")
+        latencies = time_queries(engine, args.users, args.queries, args.limit)
+        report("with index", latencies)
+    finally:
+        metadata.drop_all(engine)
+
+
+if __name__ == "__main__":
+    main()
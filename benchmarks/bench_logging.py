@@ -0,0 +1,115 @@
+"""
+What logging costs in request latency.
+
+Runs the app in-process with a benchmark-only route logging its request body,
+a 30 day itinerary, the way create_itinerary used to log every saved itinerary:
+
+    python -m benchmarks.bench_logging --mode none     # logging not configured
+    python -m benchmarks.bench_logging --mode direct   # handlers on the event loop
+    python -m benchmarks.bench_logging --mode queued   # handlers on the listener thread
+
+Set TEST_LOG_PROFILE=production to measure the production profile (JSON console,
+truncated messages). Console output goes to /dev/null while requests run, the
+rendering is still paid for.
+"""
+
+import argparse
+import asyncio
+import contextlib
+import logging
+import os
+import statistics
+import time
+
+os.environ["ENV_STATE"] = "test"
+
+from httpx import ASGITransport, AsyncClient  # noqa: E402
+
+from travelitinerarybackend.config import config  # noqa: E402
+from travelitinerarybackend.logging_conf import (  # noqa: E402
+    configure_logging,
+    stop_logging,
+)
+from travelitinerarybackend.main import app  # noqa: E402
+
+logger = logging.getLogger("travelitinerarybackend.bench")
+
+
+@app.post("/bench/log")
+async def log_payload(payload: dict):
+    logger.info(f"Received: {payload}")
+    return {"ok": True}
+
+
+def itinerary_payload(days: int) -> dict:
+    return {
+        "destination": "Rome",
+        "start_date": "2025-08-01",
+        "end_date": "2025-08-30",
+        "days_count": days,
+        "interests": ["food", "history"],
+        "generated_itinerary": [
+            {
+                "day": day,
+                "activities": [
+                    f"Morning: Walking tour of the historic centre, day {day}",
+                    f"Afternoon: Lunch at a trattoria and a museum visit, day {day}",
+                    f"Evening: Dinner and a stroll along the river, day {day}",
+                ],
+            }
+            for day in range(1, days + 1)
+        ],
+    }
+
+
+def percentile(samples: list[float], pct: float) -> float:
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+
+async def run(mode: str, requests: int, concurrency: int, days: int):
+    if mode != "none":
+        configure_logging(queued=mode == "queued")
+    payload = itinerary_payload(days)
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies = []
+
+    async with AsyncClient(
+        transport=ASGITransport(app=app), base_url="http://bench"
+    ) as client:
+
+        async def send():
+            async with semaphore:
+                start = time.perf_counter()
+                response = await client.post("/bench/log", json=payload)
+                latencies.append(time.perf_counter() - start)
+                assert response.status_code == 200, response.text
+
+        with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+            start = time.perf_counter()
+            await asyncio.gather(*[send() for _ in range(requests)])
+            elapsed = time.perf_counter() - start
+            stop_logging()
+
+    print(
+        f"mode={mode} profile={config.LOG_PROFILE} requests={requests} "
+        f"concurrency={concurrency} days={days}"
+    )
+    print(f"throughput: {requests / elapsed:.1f}/s ({elapsed:.2f}s total)")
+    print(
+        f"latency: p50={statistics.median(latencies) * 1000:.2f}ms "
+        f"p99={percentile(latencies, 99) * 1000:.2f}ms "
+        f"max={max(latencies) * 1000:.2f}ms"
+    )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument(
+        "--mode", choices=["none", "direct", "queued"], default="queued"
+    )
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--days", type=int, default=30)
+    args = parser.parse_args()
+    asyncio.run(run(args.mode, args.requests, args.concurrency, args.days))
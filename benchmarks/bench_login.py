@@ -0,0 +1,101 @@
+"""
+Login throughput and tail latency of non-auth requests during a login burst.
+
+Runs the app in-process against the test SQLite database:
+
+    python -m benchmarks.bench_login --mode inline    # Argon2 on the event loop
+    python -m benchmarks.bench_login --mode offload   # Argon2 on the thread pool
+
+Use production cost parameters to get realistic numbers, e.g.
+TEST_ARGON2_TIME_COST=2 TEST_ARGON2_MEMORY_COST=102400 TEST_ARGON2_PARALLELISM=8
+"""
+
+import argparse
+import asyncio
+import os
+import statistics
+import time
+
+os.environ["ENV_STATE"] = "test"
+
+import sqlalchemy  # noqa: E402
+from httpx import ASGITransport, AsyncClient  # noqa: E402
+
+from travelitinerarybackend import security  # noqa: E402
+from travelitinerarybackend.config import config  # noqa: E402
+from travelitinerarybackend.database import database, metadata  # noqa: E402
+from travelitinerarybackend.main import app  # noqa: E402
+
+USER = {"email": "bench.login@dummy.com", "password": "123456"}
+
+
+def percentile(samples: list[float], pct: float) -> float:
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+
+async def run(mode: str, logins: int, concurrency: int):
+    if mode == "inline":
+        # the pre-offload behaviour: hash on the event loop thread
+        async def verify_inline(plain_password, hashed_password):
+            return security.verify_password(plain_password, hashed_password)
+
+        security.verify_password_async = verify_inline
+
+    if config.DATABASE_URL.startswith("sqlite"):
+        metadata.create_all(sqlalchemy.create_engine("sqlite:///test.db"))
+    await database.connect()
+
+    async with AsyncClient(
+        transport=ASGITransport(app=app), base_url="http://bench"
+    ) as client:
+        await client.post("/register", json=USER)
+        form = {"username": USER["email"], "password": USER["password"]}
+
+        semaphore = asyncio.Semaphore(concurrency)
+        done = asyncio.Event()
+
+        async def login():
+            async with semaphore:
+                response = await client.post("/token", data=form)
+                assert response.status_code == 200, response.text
+
+        health_latencies = []
+
+        async def ping_health(interval: float = 0.01):
+            # measure from the intended send time, so time spent waiting for a
+            # blocked event loop is counted instead of silently skipped
+            intended = time.perf_counter()
+            while not done.is_set():
+                await client.get("/health")
+                health_latencies.append(time.perf_counter() - intended)
+                intended = max(intended + interval, time.perf_counter())
+                await asyncio.sleep(max(0.0, intended - time.perf_counter()))
+
+        pinger = asyncio.create_task(ping_health())
+        start = time.perf_counter()
+        await asyncio.gather(*[login() for _ in range(logins)])
+        elapsed = time.perf_counter() - start
+        done.set()
+        await pinger
+
+    await database.disconnect()
+
+    print(f"mode={mode} logins={logins} concurrency={concurrency}")
+    print(f"login throughput: {logins / elapsed:.1f}/s ({elapsed:.2f}s total)")
+    print(
+        "/health latency during burst: "
+        f"p50={statistics.median(health_latencies) * 1000:.1f}ms "
+        f"p99={percentile(health_latencies, 99) * 1000:.1f}ms "
+        f"max={max(health_latencies) * 1000:.1f}ms "
+        f"(n={len(health_latencies)})"
+    )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--mode", choices=["inline", "offload"], default="offload")
+    parser.add_argument("--logins", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=32)
+    args = parser.parse_args()
+    asyncio.run(run(args.mode, args.logins, args.concurrency))
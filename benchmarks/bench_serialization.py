@@ -0,0 +1,151 @@
+"""
+Cost of turning a page of saved itineraries into a JSON response body.
+
+Times FastAPI's own response path (serialize_response, then the response class)
+on `--rows` 30 day itineraries, the way GET /api/itinerary returns them:
+
+    python -m benchmarks.bench_serialization
+    python -m benchmarks.bench_serialization --rows 50 --days 30
+
+legacy        dates turned into strings, rows validated against the old model,
+              jsonable Python, then json.dumps in JSONResponse
+validated     rows with native dates validated, serialized to JSON by Pydantic
+constructed   UserItinerary.model_construct, serialized to JSON by Pydantic
+orjson        from_record rows in an ORJSONResponse, no validation (current)
+"""
+
+import argparse
+import asyncio
+import datetime
+import os
+import statistics
+import time
+
+os.environ.setdefault("ENV_STATE", "test")
+
+from fastapi.responses import JSONResponse, Response  # noqa: E402
+from fastapi.routing import serialize_response  # noqa: E402
+from fastapi.utils import create_model_field  # noqa: E402
+
+from travelitinerarybackend.models.itinerary import (  # noqa: E402
+    UserItinerary,
+    UserItineraryIn,
+)
+from travelitinerarybackend.responses import ORJSONResponse, from_record  # noqa: E402
+
+
+class LegacyUserItinerary(UserItineraryIn):
+    """UserItinerary as it was, string dates checked by the input validators"""
+
+    id: int
+    days_count: int
+    generated_itinerary: list[dict] | None = None
+    created_at: datetime.datetime
+
+
+def make_rows(rows: int, days: int) -> list[dict]:
+    itinerary = [
+        {
+            "day": day,
+            "activities": [
+                f"Morning: Walking tour of the historic centre, day {day}",
+                f"Midday: Lunch at a trattoria near the market, day {day}",
+                f"Afternoon: Museum visit and a gelato stop, day {day}",
+                f"Evening: Dinner and a stroll along the river, day {day}",
+            ],
+        }
+        for day in range(1, days + 1)
+    ]
+    start = datetime.date(2025, 8, 1)
+    return [
+        {
+            "id": i,
+            "user_id": 1,
+            "destination": "Rome",
+            "start_date": start,
+            "end_date": start + datetime.timedelta(days=days - 1),
+            "days_count": days,
+            "interests": ["food", "history"],
+            "generated_itinerary": itinerary,
+            "created_at": datetime.datetime(2025, 7, 1, 12, 0, i % 60),
+        }
+        for i in range(rows)
+    ]
+
+
+def legacy_dates(row: dict) -> dict:
+    return {
+        **row,
+        "start_date": row["start_date"].strftime("%Y-%m-%d"),
+        "end_date": row["end_date"].strftime("%Y-%m-%d"),
+    }
+
+
+# built once per route by FastAPI, once here too
+LEGACY_FIELD = create_model_field("response", list[LegacyUserItinerary])
+FIELD = create_model_field("response", list[UserItinerary])
+
+
+async def legacy(rows: list[dict]) -> bytes:
+    content = await serialize_response(
+        field=LEGACY_FIELD, response_content=[legacy_dates(row) for row in rows]
+    )
+    return JSONResponse(content).body
+
+
+async def validated(rows: list[dict]) -> bytes:
+    content = await serialize_response(
+        field=FIELD, response_content=rows, dump_json=True
+    )
+    return Response(content).body
+
+
+async def constructed(rows: list[dict]) -> bytes:
+    content = await serialize_response(
+        field=FIELD,
+        response_content=[UserItinerary.model_construct(**row) for row in rows],
+        dump_json=True,
+    )
+    return Response(content).body
+
+
+async def orjson_response(rows: list[dict]) -> bytes:
+    return ORJSONResponse([from_record(UserItinerary, row) for row in rows]).body
+
+
+async def time_path(path, rows: list[dict], runs: int) -> list[float]:
+    await path(rows)  # warm up, builds the serializers
+    timings = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        await path(rows)
+        timings.append(time.perf_counter() - start)
+    return timings
+
+
+async def run(rows: int, days: int, runs: int):
+    data = make_rows(rows, days)
+    paths = {
+        "legacy": legacy,
+        "validated": validated,
+        "constructed": constructed,
+        "orjson": orjson_response,
+    }
+
+    body = await orjson_response(data)
+    print(f"rows={rows} days={days} runs={runs} body={len(body)} bytes")
+    for name, path in paths.items():
+        timings = await time_path(path, data, runs)
+        print(
+            f"{name:<12} median={statistics.median(timings) * 1000:.3f}ms "
+            f"min={min(timings) * 1000:.3f}ms"
+        )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--rows", type=int, default=50)
+    parser.add_argument("--days", type=int, default=30)
+    parser.add_argument("--runs", type=int, default=200)
+    args = parser.parse_args()
+    asyncio.run(run(args.rows, args.days, args.runs))
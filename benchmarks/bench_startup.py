@@ -0,0 +1,74 @@
+"""
+Cold start time: from process start to the first 200 from GET /health.
+
+Starts uvicorn in a fresh process `--runs` times and polls /health until it answers:
+
+    python -m benchmarks.bench_startup
+    python -m benchmarks.bench_startup --import-vertex   # pay the SDK import upfront
+
+--import-vertex imports the Vertex SDK before the app, like every start did while
+gemini_service imported it at module level. Runs against the test config by
+default, set ENV_STATE to measure another one.
+"""
+
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+import httpx
+
+APP = "travelitinerarybackend.main:app"
+
+
+def server_command(port: int, import_vertex: bool) -> list[str]:
+    code = "import uvicorn; uvicorn.run({app!r}, port={port}, log_level='warning')"
+    if import_vertex:
+        code = "import vertexai.preview.generative_models; " + code
+    return [sys.executable, "-c", code.format(app=APP, port=port)]
+
+
+def time_to_healthy(port: int, import_vertex: bool, timeout: float) -> float:
+    env = {**os.environ, "ENV_STATE": os.environ.get("ENV_STATE", "test")}
+    start = time.perf_counter()
+    process = subprocess.Popen(server_command(port, import_vertex), env=env)
+    try:
+        while time.perf_counter() - start < timeout:
+            try:
+                response = httpx.get(f"http://127.0.0.1:{port}/health", timeout=1)
+                if response.status_code == 200:
+                    return time.perf_counter() - start
+            except httpx.TransportError:
+                pass
+            if process.poll() is not None:
+                raise RuntimeError(f"server exited with {process.returncode}")
+            time.sleep(0.01)
+        raise RuntimeError(f"no healthy answer within {timeout}s")
+    finally:
+        process.terminate()
+        process.wait()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--timeout", type=float, default=60)
+    parser.add_argument("--import-vertex", action="store_true")
+    args = parser.parse_args()
+
+    timings = [
+        time_to_healthy(args.port, args.import_vertex, args.timeout)
+        for _ in range(args.runs)
+    ]
+    print(f"import_vertex={args.import_vertex} runs={args.runs}")
+    print(
+        f"time to first /health 200: median={statistics.median(timings):.2f}s "
+        f"min={min(timings):.2f}s max={max(timings):.2f}s"
+    )
+
+
+if __name__ == "__main__":
+    main()
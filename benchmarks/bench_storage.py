@@ -0,0 +1,61 @@
+"""
+Bytes stored and sent per generated itinerary, plain JSON against the
+ITINERARY_COMPRESSION codecs, and the time to compress and read one back:
+
+    python -m benchmarks.bench_storage
+    python -m benchmarks.bench_storage --days 14
+
+Uses the 30 day itinerary of bench_serialization, whose activities repeat
+from day to day, so it compresses better than real Gemini output does.
+zstd is skipped when the zstandard package is not installed.
+"""
+
+import argparse
+import os
+import statistics
+import time
+
+os.environ.setdefault("ENV_STATE", "test")
+
+import orjson  # noqa: E402
+
+from benchmarks.bench_serialization import make_rows  # noqa: E402
+from travelitinerarybackend.compression import (  # noqa: E402
+    compress_json,
+    decompress_json,
+)
+
+
+def median_ms(fn, runs: int) -> float:
+    timings = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - start)
+    return statistics.median(timings) * 1000
+
+
+def run(days: int, runs: int):
+    itinerary = make_rows(1, days)[0]["generated_itinerary"]
+    raw = orjson.dumps(itinerary)
+    print(f"days={days} runs={runs}")
+    print(f"{'json':<6} bytes={len(raw)}")
+    for codec in ("zlib", "zstd"):
+        try:
+            blob = compress_json(itinerary, codec)
+        except RuntimeError as e:
+            print(f"{codec:<6} skipped: {e}")
+            continue
+        print(
+            f"{codec:<6} bytes={len(blob)} ratio={len(raw) / len(blob):.1f}x "
+            f"compress={median_ms(lambda: compress_json(itinerary, codec), runs):.3f}ms "
+            f"decompress={median_ms(lambda: decompress_json(blob), runs):.3f}ms"
+        )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--days", type=int, default=30)
+    parser.add_argument("--runs", type=int, default=1000)
+    args = parser.parse_args()
+    run(args.days, args.runs)
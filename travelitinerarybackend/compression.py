@@ -0,0 +1,58 @@
+import zlib
+from typing import Any
+
+import orjson
+import sqlalchemy
+
+# first byte of every stored blob, so rows written with either codec stay readable
+ZLIB = b"\x01"
+ZSTD = b"\x02"
+
+
+def _zstd():
+    try:
+        import zstandard
+    except ImportError as e:
+        raise RuntimeError("zstd compression requires the zstandard package") from e
+    return zstandard
+
+
+def compress(raw: bytes, codec: str) -> bytes:
+    if codec == "zlib":
+        return ZLIB + zlib.compress(raw, 6)
+    if codec == "zstd":
+        return ZSTD + _zstd().ZstdCompressor(level=3).compress(raw)
+    raise ValueError(f"Invalid codec: {codec}. Must be one of ['zlib', 'zstd']")
+
+
+def compress_json(value: Any, codec: str) -> bytes:
+    return compress(orjson.dumps(value), codec)
+
+
+def decompress_json(blob: bytes) -> Any:
+    header, payload = blob[:1], blob[1:]
+    if header == ZLIB:
+        return orjson.loads(zlib.decompress(payload))
+    if header == ZSTD:
+        return orjson.loads(_zstd().ZstdDecompressor().decompress(payload))
+    raise ValueError(f"Unknown compression header: {header!r}")
+
+
+class CompressedJSON(sqlalchemy.types.TypeDecorator):
+    """
+    JSON stored as a compressed blob, decompressed on read.
+    Bound values may be compressed already (bytes), other values are zlib compressed.
+    """
+
+    impl = sqlalchemy.LargeBinary
+    cache_ok = True
+
+    def process_bind_param(self, value, dialect):
+        if value is None or isinstance(value, bytes):
+            return value
+        return compress_json(value, "zlib")
+
+    def process_result_value(self, value, dialect):
+        if value is None:
+            return None
+        return decompress_json(bytes(value))
@@ -13,8 +13,105 @@ class BaseConfig(BaseSettings):
 class GlobalConfig(BaseConfig):
     DATABASE_URL: Optional[str] = None
     DB_FORCE_ROLL_BACK: bool = False
+    # asyncpg pool settings, ignored for SQLite
+    DB_POOL_MIN_SIZE: int = 1
+    DB_POOL_MAX_SIZE: int = 10
+    DB_STATEMENT_CACHE_SIZE: int = 100
+    # idle connections are closed and reopened after this long
+    DB_POOL_RECYCLE_SECONDS: float = 300
+    DB_POOL_ACQUIRE_TIMEOUT_SECONDS: float = 10
     SECRET_KEY: str
     ALGORITHM: str
+    GEMINI_MODEL_NAME: str = "gemini-2.5-flash"
+    # max number of Gemini calls in flight per worker
+    GEMINI_MAX_CONCURRENCY: int = 8
+    # models tried in order when the previous one fails, and targets of hedges
+    GEMINI_FALLBACK_MODELS: list[str] = []
+    # when a call is slower than the model's recent GENERATION_HEDGE_PERCENTILE
+    # latency, send a second one (to the next model in the chain) and keep the first
+    # answer; GENERATION_HEDGE_DELAY_SECONDS applies until MIN_SAMPLES are recorded
+    GENERATION_HEDGE_ENABLED: bool = False
+    GENERATION_HEDGE_PERCENTILE: float = 95.0
+    GENERATION_HEDGE_MIN_SAMPLES: int = 20
+    GENERATION_HEDGE_DELAY_SECONDS: float = 10.0
+    # circuit breaker on Gemini calls: opens when GEMINI_BREAKER_FAILURE_RATE of the
+    # last GEMINI_BREAKER_WINDOW calls (at least MIN_CALLS) failed or took longer
+    # than GEMINI_BREAKER_SLOW_CALL_SECONDS, probes again after OPEN_SECONDS
+    GEMINI_BREAKER_WINDOW: int = 20
+    GEMINI_BREAKER_MIN_CALLS: int = 10
+    GEMINI_BREAKER_FAILURE_RATE: float = 0.5
+    GEMINI_BREAKER_SLOW_CALL_SECONDS: float = 30.0
+    GEMINI_BREAKER_OPEN_SECONDS: float = 30.0
+    GEMINI_BREAKER_HALF_OPEN_PROBES: int = 1
+    # build the generator in the background at startup instead of on first use
+    GENERATOR_WARMUP: bool = False
+    # "vertex" or "local", the offline generator for load tests and CI
+    ITINERARY_GENERATOR: str = "vertex"
+    # simulated time to first token and writing speed of the local generator
+    LOCAL_GENERATOR_LATENCY_SECONDS: float = 0.5
+    LOCAL_GENERATOR_TOKENS_PER_SECOND: float = 200.0
+    # ask for JSON matching the itinerary schema instead of relying on the prompt
+    GEMINI_STRUCTURED_OUTPUT: bool = True
+    # trips longer than the threshold are generated as concurrent day ranges
+    GENERATION_CHUNK_THRESHOLD_DAYS: int = 10
+    GENERATION_CHUNK_DAYS: int = 7
+    # longer trips get longer segments rather than more concurrent calls
+    GENERATION_MAX_SEGMENTS: int = 4
+    # POST /api/itinerary/generate/batch limits
+    GENERATION_BATCH_MAX_ITEMS: int = 20
+    GENERATION_BATCH_CONCURRENCY: int = 4
+    # per user token bucket on generation, a batch takes one token per item
+    RATE_LIMIT_PER_MINUTE: float = 10.0
+    RATE_LIMIT_BURST: int = 20
+    # "memory" (per worker) or "redis" (shared, needs REDIS_URL)
+    RATE_LIMIT_BACKEND: str = "memory"
+    # generation requests served at once per worker, the rest get a 429
+    GENERATION_MAX_IN_FLIGHT: int = 32
+    # background generation jobs
+    JOB_WORKER_ENABLED: bool = True
+    JOB_WORKER_CONCURRENCY: int = 2
+    JOB_POLL_INTERVAL_SECONDS: float = 1.0
+    JOB_MAX_ATTEMPTS: int = 3
+    JOB_RETRY_BASE_SECONDS: float = 5
+    JOB_RETRY_MAX_SECONDS: float = 300
+    # running jobs not finished after this long are assumed lost and requeued
+    JOB_STUCK_AFTER_SECONDS: float = 600
+    JOB_CALLBACK_TIMEOUT_SECONDS: float = 10
+    # callbacks go to public https hosts only, and these hosts (or their
+    # subdomains) when the list is not empty
+    JOB_CALLBACK_ALLOWED_HOSTS: list[str] = []
+    # signs callback bodies with HMAC-SHA256 when set, see post_callback
+    JOB_CALLBACK_SECRET: Optional[str] = None
+    # generated itinerary cache: "memory", "redis" or "none"
+    GENERATION_CACHE_BACKEND: str = "memory"
+    GENERATION_CACHE_TTL_SECONDS: int = 24 * 60 * 60
+    GENERATION_CACHE_MAX_ENTRIES: int = 1024
+    REDIS_URL: Optional[str] = None
+    # Argon2 cost parameters (passlib defaults)
+    ARGON2_TIME_COST: int = 2
+    ARGON2_MEMORY_COST: int = 102400  # KiB
+    ARGON2_PARALLELISM: int = 8
+    # password hashing runs on its own thread pool
+    PASSWORD_HASH_WORKERS: int = 4
+    # hash/verify calls allowed to queue before new ones are rejected with 503
+    PASSWORD_HASH_MAX_PENDING: int = 64
+    # user records cached by email for authenticated requests
+    USER_CACHE_TTL_SECONDS: int = 60
+    USER_CACHE_MAX_ENTRIES: int = 10000
+    # put the user id in access tokens so itinerary routes skip the user lookup
+    JWT_EMBED_USER_ID: bool = False
+    # compress generated itineraries in the database: None, "zlib" or "zstd"
+    # (needs zstandard), for those of at least ITINERARY_COMPRESSION_MIN_BYTES as JSON
+    ITINERARY_COMPRESSION: Optional[str] = None
+    ITINERARY_COMPRESSION_MIN_BYTES: int = 4096
+    # request tracing: None (off), "memory", "log" or "otel" (needs opentelemetry-api)
+    TRACING_EXPORTER: Optional[str] = None
+    # "dev" (Rich console) or "production" (JSON console, long messages cut short)
+    LOG_PROFILE: str = "dev"
+    # production only: longer messages are truncated
+    LOG_MAX_MESSAGE_CHARS: int = 2000
+    # production only: share of debug and info records kept, warnings always are
+    LOG_SAMPLE_RATE: float = 1.0
 
 
 class DevConfig(GlobalConfig):
@@ -27,12 +124,27 @@ class ProdConfig(GlobalConfig):
     model_config = {"env_file": ".env", "env_prefix": "PROD_", "extra": "ignore"}
     GCP_PROJECT_ID: str
     GCP_REGION: str
+    LOG_PROFILE: str = "production"
 
 
 class TestConfig(GlobalConfig):
     model_config = {"env_file": ".env.test", "env_prefix": "TEST_", "extra": "ignore"}
     GCP_PROJECT_ID: Optional[str] = "dummy"
     GCP_REGION: Optional[str] = "us-central1"
+    # tests drive the job worker by hand
+    JOB_WORKER_ENABLED: bool = False
+    # tests generate far more often than a user would
+    RATE_LIMIT_BURST: int = 1000
+    # no GCP from tests
+    ITINERARY_GENERATOR: str = "local"
+    LOCAL_GENERATOR_LATENCY_SECONDS: float = 0.0
+    LOCAL_GENERATOR_TOKENS_PER_SECOND: float = 0.0
+    # cheap hashes keep the test suite fast
+    ARGON2_TIME_COST: int = 1
+    ARGON2_MEMORY_COST: int = 8192
+    ARGON2_PARALLELISM: int = 1
+    # tests assert on the recorded spans
+    TRACING_EXPORTER: Optional[str] = "memory"
 
 
 def get_config(env_state: str):
@@ -1,16 +1,175 @@
+import asyncio
+import sqlite3
+import time
+from contextlib import contextmanager
+from typing import Iterator, Optional
+
 import databases
+import orjson
 import sqlalchemy
+from sqlalchemy.dialects import postgresql, sqlite
 
+from travelitinerarybackend.compression import CompressedJSON, compress
 from travelitinerarybackend.config import config
+from travelitinerarybackend.metrics import registry, stage_timer
+from travelitinerarybackend.tracing import span
+
+
+def pool_options(database_url: str) -> dict:
+    if databases.DatabaseURL(database_url).dialect != "postgresql":
+        return {}
+    return {
+        "min_size": config.DB_POOL_MIN_SIZE,
+        "max_size": config.DB_POOL_MAX_SIZE,
+        "statement_cache_size": config.DB_STATEMENT_CACHE_SIZE,
+        "max_inactive_connection_lifetime": config.DB_POOL_RECYCLE_SECONDS,
+    }
+
+
+class InstrumentedDatabase(databases.Database):
+    """Times every query as the db_query stage, and traces it as a db.<method> span"""
+
+    @contextmanager
+    def _instrument(self, operation: str) -> Iterator[None]:
+        with (
+            stage_timer("db_query"),
+            span(
+                f"db.{operation}",
+                **{"db.system": self.url.dialect, "db.operation": operation},
+            ),
+        ):
+            yield
 
-engine = sqlalchemy.create_engine(config.DATABASE_URL)
+    async def fetch_all(self, *args, **kwargs):
+        with self._instrument("fetch_all"):
+            return await super().fetch_all(*args, **kwargs)
 
-database = databases.Database(
-    config.DATABASE_URL, force_rollback=config.DB_FORCE_ROLL_BACK
+    async def fetch_one(self, *args, **kwargs):
+        with self._instrument("fetch_one"):
+            return await super().fetch_one(*args, **kwargs)
+
+    async def fetch_val(self, *args, **kwargs):
+        with self._instrument("fetch_val"):
+            return await super().fetch_val(*args, **kwargs)
+
+    async def execute(self, *args, **kwargs):
+        with self._instrument("execute"):
+            return await super().execute(*args, **kwargs)
+
+    async def execute_many(self, *args, **kwargs):
+        with self._instrument("execute_many"):
+            return await super().execute_many(*args, **kwargs)
+
+
+database = InstrumentedDatabase(
+    config.DATABASE_URL,
+    force_rollback=config.DB_FORCE_ROLL_BACK,
+    **pool_options(config.DATABASE_URL),
 )
 
+
+class InstrumentedPool:
+    """
+    Wraps the connection pool of the `databases` backend to bound and time acquire().
+    Everything else is passed through to the wrapped pool.
+    """
+
+    def __init__(self, pool, acquire_timeout: float):
+        self._pool = pool
+        self.acquire_timeout = acquire_timeout
+        self.waiting = 0
+        self.acquired = 0
+        self.timeouts = 0
+        self.wait_seconds_total = 0.0
+        self.wait_seconds_max = 0.0
+
+    async def acquire(self):
+        self.waiting += 1
+        start = time.perf_counter()
+        try:
+            connection = await asyncio.wait_for(
+                self._pool.acquire(), self.acquire_timeout
+            )
+        except asyncio.TimeoutError:
+            self.timeouts += 1
+            raise
+        finally:
+            self.waiting -= 1
+            waited = time.perf_counter() - start
+            self.wait_seconds_total += waited
+            self.wait_seconds_max = max(self.wait_seconds_max, waited)
+        self.acquired += 1
+        return connection
+
+    def __getattr__(self, name):
+        return getattr(self._pool, name)
+
+    def stats(self) -> dict:
+        # only asyncpg pools know their size, SQLite opens a connection per acquire
+        size = idle = None
+        if hasattr(self._pool, "get_size"):
+            size = self._pool.get_size()
+            idle = self._pool.get_idle_size()
+        return {
+            "size": size,
+            "in_use": size - idle if size is not None else None,
+            "idle": idle,
+            "waiting": self.waiting,
+            "acquired": self.acquired,
+            "timeouts": self.timeouts,
+            "wait_seconds_total": round(self.wait_seconds_total, 6),
+            "wait_seconds_max": round(self.wait_seconds_max, 6),
+        }
+
+
+async def connect_database():
+    await database.connect()
+    backend = database._backend
+    if not isinstance(backend._pool, InstrumentedPool):
+        backend._pool = InstrumentedPool(
+            backend._pool, config.DB_POOL_ACQUIRE_TIMEOUT_SECONDS
+        )
+
+
+def pool_stats() -> Optional[dict]:
+    pool = getattr(database._backend, "_pool", None)
+    if isinstance(pool, InstrumentedPool):
+        return pool.stats()
+    return None
+
+
+def collect_pool_metrics():
+    stats = pool_stats() or {}
+    series = {
+        "db_pool_size": ("size", "Connections in the pool"),
+        "db_pool_in_use": ("in_use", "Connections checked out"),
+        "db_pool_waiting": ("waiting", "Acquires waiting for a connection"),
+        "db_pool_acquire_timeouts_total": ("timeouts", "Acquires that timed out"),
+        "db_pool_wait_seconds_total": ("wait_seconds_total", "Time spent in acquire"),
+    }
+    for name, (key, help) in series.items():
+        if stats.get(key) is not None:
+            kind = "counter" if name.endswith("_total") else "gauge"
+            yield name, kind, help, {}, stats[key]
+
+
+registry.add_collector(collect_pool_metrics)
+
 metadata = sqlalchemy.MetaData()
 
+# SQLite fills created_at from CURRENT_TIMESTAMP (second precision), bind values
+# in the same format so comparisons in keyset pagination match stored rows
+timestamp_type = sqlalchemy.DateTime().with_variant(
+    sqlite.DATETIME(
+        storage_format="%(year)04d-%(month)02d-%(day)02d "
+        "%(hour)02d:%(minute)02d:%(second)02d"
+    ),
+    "sqlite",
+)
+
+# JSONB on Postgres: parsed once on write, indexable, no re-parse on read
+json_type = sqlalchemy.JSON().with_variant(postgresql.JSONB(), "postgresql")
+
 user_table = sqlalchemy.Table(
     "users",
     metadata,
@@ -29,7 +188,102 @@ itinerary_table = sqlalchemy.Table(
     sqlalchemy.Column("start_date", sqlalchemy.Date),
     sqlalchemy.Column("end_date", sqlalchemy.Date),
     sqlalchemy.Column("days_count", sqlalchemy.Integer),
-    sqlalchemy.Column("interests", sqlalchemy.JSON),  # ["art", "food"]
-    sqlalchemy.Column("generated_itinerary", sqlalchemy.JSON),  # Full Gemini response
-    sqlalchemy.Column("created_at", sqlalchemy.DateTime, default=sqlalchemy.func.now()),
+    sqlalchemy.Column("interests", json_type),  # ["art", "food"]
+    sqlalchemy.Column("generated_itinerary", json_type),  # Full Gemini response
+    # the same, compressed, for itineraries written with ITINERARY_COMPRESSION on.
+    # One of the two columns is set, see itinerary_columns and itinerary_row
+    sqlalchemy.Column("generated_itinerary_compressed", CompressedJSON),
+    sqlalchemy.Column("created_at", timestamp_type, default=sqlalchemy.func.now()),
+)
+
+# serves the per-user, newest first listing in GET /api/itinerary
+itinerary_list_index = sqlalchemy.Index(
+    "ix_itineraries_user_id_created_at_id",
+    itinerary_table.c.user_id,
+    itinerary_table.c.created_at.desc(),
+    itinerary_table.c.id.desc(),
 )
+
+# serves the interest filter (interests @> '["food"]'), Postgres only
+itinerary_interests_index = sqlalchemy.Index(
+    "ix_itineraries_interests",
+    itinerary_table.c.interests,
+    postgresql_using="gin",
+).ddl_if(dialect="postgresql")
+
+generation_job_table = sqlalchemy.Table(
+    "generation_jobs",
+    metadata,
+    sqlalchemy.Column("id", sqlalchemy.Integer, primary_key=True),
+    sqlalchemy.Column("user_id", sqlalchemy.ForeignKey("users.id"), nullable=False),
+    # pending -> running -> succeeded | failed, back to pending on retry
+    sqlalchemy.Column("status", sqlalchemy.String, nullable=False),
+    sqlalchemy.Column("request", sqlalchemy.JSON, nullable=False),  # UserItineraryIn
+    sqlalchemy.Column(
+        "result", sqlalchemy.JSON
+    ),  # {"days_count": .., "itinerary": [..]}
+    sqlalchemy.Column("error", sqlalchemy.String),
+    sqlalchemy.Column("attempts", sqlalchemy.Integer, nullable=False, default=0),
+    sqlalchemy.Column("callback_url", sqlalchemy.String),
+    sqlalchemy.Column("run_after", sqlalchemy.DateTime, nullable=False),
+    sqlalchemy.Column("locked_at", sqlalchemy.DateTime),
+    sqlalchemy.Column("created_at", timestamp_type, default=sqlalchemy.func.now()),
+    sqlalchemy.Column("updated_at", timestamp_type, default=sqlalchemy.func.now()),
+)
+
+# lets workers find the next due job without scanning finished ones
+generation_job_queue_index = sqlalchemy.Index(
+    "ix_generation_jobs_status_run_after",
+    generation_job_table.c.status,
+    generation_job_table.c.run_after,
+)
+
+
+def supports_returning() -> bool:
+    """INSERT/UPDATE/DELETE ... RETURNING needs SQLite 3.35+, Postgres always has it"""
+    if database.url.dialect == "sqlite":
+        return sqlite3.sqlite_version_info >= (3, 35, 0)
+    return True
+
+
+def has_interest(interest: str):
+    """WHERE clause keeping itineraries whose interests include interest"""
+    if database.url.dialect == "postgresql":
+        # the JSONB variant only changes DDL, expressions still get JSON's
+        # comparator, JSONB's gives @>
+        interests = sqlalchemy.type_coerce(
+            itinerary_table.c.interests, postgresql.JSONB
+        )
+        return interests.contains([interest])
+    # SQLite has no containment operator, look through the array with json_each
+    values = sqlalchemy.func.json_each(itinerary_table.c.interests).table_valued(
+        "value"
+    )
+    return sqlalchemy.exists().where(values.c.value == interest)
+
+
+def itinerary_columns(itinerary: Optional[list]) -> dict:
+    """
+    Column values storing a generated itinerary. With ITINERARY_COMPRESSION set,
+    itineraries of ITINERARY_COMPRESSION_MIN_BYTES or more go to the compressed
+    column, others stay plain JSON.
+    """
+    if itinerary is not None and config.ITINERARY_COMPRESSION:
+        raw = orjson.dumps(itinerary)
+        if len(raw) >= config.ITINERARY_COMPRESSION_MIN_BYTES:
+            return {
+                "generated_itinerary": None,
+                "generated_itinerary_compressed": compress(
+                    raw, config.ITINERARY_COMPRESSION
+                ),
+            }
+    return {"generated_itinerary": itinerary, "generated_itinerary_compressed": None}
+
+
+def itinerary_row(record) -> dict:
+    """An itineraries row as a dict, generated_itinerary read from either column"""
+    row = dict(record)
+    compressed = row.pop("generated_itinerary_compressed", None)
+    if compressed is not None:
+        row["generated_itinerary"] = compressed
+    return row
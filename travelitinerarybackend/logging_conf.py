@@ -1,59 +1,155 @@
+import logging
+import queue
+import random
+import sys
 from logging.config import dictConfig
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+from typing import List, Optional, Sequence
+
+from asgi_correlation_id import CorrelationIdFilter
+from pythonjsonlogger.jsonlogger import JsonFormatter
+from rich.logging import RichHandler
 
 from travelitinerarybackend.config import DevConfig, config
 
+DATE_FORMAT = "%Y-%m-%dT%H:%M:%S"
+CONSOLE_FORMAT = "(%(correlation_id)s) %(name)s:%(lineno)d - %(message)s"
+JSON_FORMAT = "%(asctime)s %(msecs)03d %(levelname)s %(correlation_id)s %(name)s %(lineno)d %(message)s"
+LOG_FILE = "ai-travel-itinerary-generator.log"
+# errors from these libraries go to the console only, not the log file
+CONSOLE_ONLY_LOGGERS = ("databases", "asyncpg")
+
+# records go from the request handlers to the listener thread through this queue
+log_queue: queue.SimpleQueue = queue.SimpleQueue()
+_listener: Optional[QueueListener] = None
+
+
+class PayloadLimitFilter(logging.Filter):
+    """Cuts messages longer than max_chars, noting how much was dropped"""
+
+    def __init__(self, max_chars: int):
+        super().__init__()
+        self.max_chars = max_chars
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        message = record.getMessage()
+        if len(message) > self.max_chars:
+            dropped = len(message) - self.max_chars
+            record.msg = f"{message[: self.max_chars]}... [{dropped} chars truncated]"
+            record.args = None
+        return True
+
+
+class SamplingFilter(logging.Filter):
+    """Keeps a share of the records below WARNING, and every warning and error"""
+
+    def __init__(self, rate: float):
+        super().__init__()
+        self.rate = rate
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        return record.levelno >= logging.WARNING or random.random() < self.rate
+
+
+class ExcludeLoggersFilter(logging.Filter):
+    """Drops records from the named loggers and their children"""
+
+    def __init__(self, names: Sequence[str]):
+        super().__init__()
+        self.names = tuple(names)
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        return not any(
+            record.name == name or record.name.startswith(f"{name}.")
+            for name in self.names
+        )
+
+
+def build_output_handlers(production: bool) -> List[logging.Handler]:
+    """The handlers doing the formatting and I/O: console and rotating file"""
+    if production:
+        # one JSON object per line on stdout, what log collectors expect
+        console = logging.StreamHandler(sys.stdout)
+        console.setFormatter(JsonFormatter(JSON_FORMAT, datefmt=DATE_FORMAT))
+    else:
+        console = RichHandler()
+        console.setFormatter(logging.Formatter(CONSOLE_FORMAT, datefmt=DATE_FORMAT))
+    rotating_file = RotatingFileHandler(
+        LOG_FILE,
+        maxBytes=1024 * 1024,  # 1 MB
+        backupCount=2,
+        encoding="utf8",
+    )
+    rotating_file.setFormatter(JsonFormatter(JSON_FORMAT, datefmt=DATE_FORMAT))
+    rotating_file.addFilter(ExcludeLoggersFilter(CONSOLE_ONLY_LOGGERS))
+    return [console, rotating_file]
+
 
-def configure_logging() -> None:
+def configure_logging(queued: bool = True) -> None:
+    """
+    Loggers hand their records to a QueueHandler, and a listener thread formats
+    and writes them, so Rich rendering and file I/O stay off the event loop.
+    Filters run before the queue: the correlation id is only known on the
+    request's thread. LOG_PROFILE=production logs JSON to stdout instead of Rich,
+    and samples and truncates records.
+    queued=False attaches the output handlers to the loggers directly.
+    """
+    global _listener
+    stop_logging()
+    production = config.LOG_PROFILE == "production"
+
+    # levels only, this also clears the handlers of an earlier configuration
     dictConfig(
         {
             "version": 1,
             "disable_existing_loggers": False,
-            "filters": {
-                "correlation_id": {
-                    "()": "asgi_correlation_id.CorrelationIdFilter",
-                    "uuid_length": 8 if isinstance(config, DevConfig) else 32,
-                    "default_value": "-",
-                },
-            },
-            "formatters": {
-                "console": {
-                    "class": "logging.Formatter",
-                    "datefmt": "%Y-%m-%dT%H:%M:%S",
-                    "format": "(%(correlation_id)s) %(name)s:%(lineno)d - %(message)s",
-                },
-                "file": {
-                    "class": "pythonjsonlogger.jsonlogger.JsonFormatter",
-                    "datefmt": "%Y-%m-%dT%H:%M:%S",
-                    "format": "%(asctime)s %(msecs)03d %(levelname)s %(correlation_id)s %(name)s %(lineno)d %(message)s",
-                },
-            },
-            "handlers": {
-                "default": {
-                    "class": "rich.logging.RichHandler",
-                    "level": "DEBUG",
-                    "formatter": "console",
-                    "filters": ["correlation_id"],
-                },
-                "rotating_file": {
-                    "class": "logging.handlers.RotatingFileHandler",
-                    "level": "DEBUG",
-                    "formatter": "file",
-                    "filters": ["correlation_id"],
-                    "filename": "ai-travel-itinerary-generator.log",
-                    "maxBytes": 1024 * 1024,  # 1 MB
-                    "backupCount": 2,
-                    "encoding": "utf8",
-                },
-            },
             "loggers": {
-                "uvicorn": {"handlers": ["default", "rotating_file"], "level": "INFO"},
+                "uvicorn": {"level": "INFO"},
                 "travelitinerarybackend": {
-                    "handlers": ["default", "rotating_file"],
                     "level": "DEBUG" if isinstance(config, DevConfig) else "INFO",
                     "propagate": False,
                 },
-                "databases": {"handlers": ["default"], "level": "ERROR"},
-                "asyncpg": {"handlers": ["default"], "level": "ERROR"},
+                "databases": {"level": "ERROR"},
+                "asyncpg": {"level": "ERROR"},
             },
         }
     )
+
+    filters: List[logging.Filter] = [
+        CorrelationIdFilter(
+            uuid_length=8 if isinstance(config, DevConfig) else 32,
+            default_value="-",
+        )
+    ]
+    if production:
+        filters += [
+            SamplingFilter(config.LOG_SAMPLE_RATE),
+            PayloadLimitFilter(config.LOG_MAX_MESSAGE_CHARS),
+        ]
+
+    outputs = build_output_handlers(production)
+    if queued:
+        # built here rather than in dictConfig, which from Python 3.12 on
+        # rejects a QueueHandler without its own listener, or a SimpleQueue
+        handlers: List[logging.Handler] = [QueueHandler(log_queue)]
+        _listener = QueueListener(log_queue, *outputs, respect_handler_level=True)
+        _listener.start()
+    else:
+        # formatting and I/O on the logging thread, as before the queue
+        handlers = outputs
+
+    for handler in handlers:
+        for log_filter in filters:
+            handler.addFilter(log_filter)
+    for name in ("uvicorn", "travelitinerarybackend", "databases", "asyncpg"):
+        logger = logging.getLogger(name)
+        for handler in handlers:
+            logger.addHandler(handler)
+
+
+def stop_logging() -> None:
+    """Stop the listener thread, once the records already queued are written"""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
@@ -1,3 +1,4 @@
+import asyncio
 import logging
 from contextlib import asynccontextmanager
 
@@ -6,26 +7,51 @@ from fastapi import FastAPI, HTTPException
 from fastapi.exception_handlers import http_exception_handler
 from fastapi.middleware.cors import CORSMiddleware
 
-from travelitinerarybackend.database import database
-from travelitinerarybackend.logging_conf import configure_logging
+from travelitinerarybackend.config import config
+from travelitinerarybackend.database import connect_database, database
+from travelitinerarybackend.logging_conf import configure_logging, stop_logging
+from travelitinerarybackend.metrics import MetricsMiddleware
 from travelitinerarybackend.routers.itinerary import router as itinerary_router
+from travelitinerarybackend.routers.jobs import router as jobs_router
 from travelitinerarybackend.routers.user import router as user_router
+from travelitinerarybackend.services.gemini_service import get_gemini_service
+from travelitinerarybackend.services.generation_jobs import GenerationJobWorker
+from travelitinerarybackend.tracing import TracingMiddleware
 
 logger = logging.getLogger(__name__)
 
 
+async def warm_up_generator():
+    try:
+        await asyncio.to_thread(get_gemini_service)
+        logger.info("Itinerary generator ready")
+    except Exception as e:
+        logger.error(f"Itinerary generator warmup failed: {e}")
+
+
 # conext manager to do setup and teardown
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     # setup
     configure_logging()
-    await database.connect()
+    await connect_database()
+    if config.GENERATOR_WARMUP:
+        # off the event loop and not awaited, /health answers while the SDK loads
+        app.state.generator_warmup = asyncio.create_task(warm_up_generator())
+    worker = GenerationJobWorker()
+    if config.JOB_WORKER_ENABLED:
+        worker.start()
     yield
     # teardown
+    await worker.stop()
     await database.disconnect()
+    stop_logging()
 
 
 app = FastAPI(lifespan=lifespan)
+# innermost, the correlation id is set by the time the request span starts
+app.add_middleware(TracingMiddleware)
+app.add_middleware(MetricsMiddleware)
 app.add_middleware(CorrelationIdMiddleware)
 app.add_middleware(
     CORSMiddleware,
@@ -36,8 +62,10 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor"],
 )
 app.include_router(itinerary_router, prefix="/api")
+app.include_router(jobs_router, prefix="/api")
 app.include_router(user_router)
 
 
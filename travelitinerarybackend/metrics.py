@@ -0,0 +1,226 @@
+import bisect
+import time
+from collections import deque
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterable, Iterator, Optional, Sequence, Tuple
+
+# seconds, sized for model calls from sub-second cache-like answers to slow outliers
+DEFAULT_LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 20.0, 30.0, 60.0)
+# seconds, for HTTP requests and the stages inside them
+REQUEST_LATENCY_BUCKETS = (
+    0.001,
+    0.0025,
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1.0,
+    2.5,
+    5.0,
+    10.0,
+    30.0,
+)
+
+
+class LatencyHistogram:
+    """
+    Cumulative latency histogram, plus a window of recent samples for quantiles.
+    Not thread-safe; meant to be used from the event loop thread.
+    """
+
+    def __init__(
+        self, buckets: Sequence[float] = DEFAULT_LATENCY_BUCKETS, window: int = 1000
+    ):
+        self.buckets = tuple(sorted(buckets))
+        # one count per bucket, the last one is +Inf
+        self.bucket_counts = [0] * (len(self.buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self._recent: deque = deque(maxlen=window)
+
+    def observe(self, seconds: float) -> None:
+        self.bucket_counts[bisect.bisect_left(self.buckets, seconds)] += 1
+        self.count += 1
+        self.sum += seconds
+        self._recent.append(seconds)
+
+    def quantile(self, q: float) -> Optional[float]:
+        """q-quantile (0..1) of the recent samples, None before the first one"""
+        if not self._recent:
+            return None
+        ordered = sorted(self._recent)
+        return ordered[min(len(ordered) - 1, int(len(ordered) * q))]
+
+    def cumulative_counts(self) -> list:
+        """(upper bound, samples at or below it) pairs, ending with +Inf"""
+        pairs, total = [], 0
+        for bound, count in zip(self.buckets + (float("inf"),), self.bucket_counts):
+            total += count
+            pairs.append((bound, total))
+        return pairs
+
+    def snapshot(self) -> dict:
+        return {
+            "count": self.count,
+            "sum": round(self.sum, 6),
+            "p50": self.quantile(0.5),
+            "p99": self.quantile(0.99),
+        }
+
+
+class Counter:
+    def __init__(self):
+        self.value = 0.0
+
+    def inc(self, amount: float = 1) -> None:
+        self.value += amount
+
+
+# (name, type, help, labels, value), value is a number or a LatencyHistogram
+Sample = Tuple[str, str, str, Dict[str, str], object]
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(labels: Dict[str, str]) -> str:
+    if not labels:
+        return ""
+    pairs = (f'{key}="{_escape(str(value))}"' for key, value in sorted(labels.items()))
+    return "{" + ",".join(pairs) + "}"
+
+
+def _format_bound(bound: float) -> str:
+    return "+Inf" if bound == float("inf") else repr(float(bound))
+
+
+class MetricsRegistry:
+    """
+    Process-wide counters and histograms, rendered in the Prometheus text format.
+    Collectors add samples read from elsewhere (pool, breaker...) at render time.
+    """
+
+    def __init__(self):
+        self._families: Dict[str, Tuple[str, str, Dict[tuple, object]]] = {}
+        self._collectors: list = []
+
+    def _child(self, name: str, kind: str, help: str, labels: dict, factory):
+        _, _, children = self._families.setdefault(name, (kind, help, {}))
+        key = tuple(sorted(labels.items()))
+        if key not in children:
+            children[key] = factory()
+        return children[key]
+
+    def counter(self, name: str, help: str, **labels: str) -> Counter:
+        return self._child(name, "counter", help, labels, Counter)
+
+    def histogram(
+        self,
+        name: str,
+        help: str,
+        buckets: Sequence[float] = REQUEST_LATENCY_BUCKETS,
+        **labels: str,
+    ) -> LatencyHistogram:
+        return self._child(
+            name, "histogram", help, labels, lambda: LatencyHistogram(buckets)
+        )
+
+    def add_collector(self, collector: Callable[[], Iterable[Sample]]) -> None:
+        self._collectors.append(collector)
+
+    def samples(self) -> Iterator[Sample]:
+        for name, (kind, help, children) in self._families.items():
+            for key, child in children.items():
+                value = child if kind == "histogram" else child.value
+                yield name, kind, help, dict(key), value
+        for collector in self._collectors:
+            yield from collector()
+
+    def render(self) -> str:
+        families: Dict[str, list] = {}
+        headers: Dict[str, Tuple[str, str]] = {}
+        for name, kind, help, labels, value in self.samples():
+            headers.setdefault(name, (kind, help))
+            families.setdefault(name, []).append((labels, value))
+
+        lines = []
+        for name, samples in families.items():
+            kind, help = headers[name]
+            lines.append(f"# HELP {name} {help}")
+            lines.append(f"# TYPE {name} {kind}")
+            for labels, value in samples:
+                if kind != "histogram":
+                    lines.append(f"{name}{_format_labels(labels)} {float(value)}")
+                    continue
+                for bound, count in value.cumulative_counts():
+                    bucket_labels = {**labels, "le": _format_bound(bound)}
+                    lines.append(
+                        f"{name}_bucket{_format_labels(bucket_labels)} {count}"
+                    )
+                lines.append(f"{name}_sum{_format_labels(labels)} {value.sum}")
+                lines.append(f"{name}_count{_format_labels(labels)} {value.count}")
+        return "\n".join(lines) + "\n"
+
+
+registry = MetricsRegistry()
+
+
+@contextmanager
+def stage_timer(stage: str) -> Iterator[None]:
+    """Time a stage of request handling (auth, db_query, gemini_call...)"""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        registry.histogram(
+            "app_stage_duration_seconds",
+            "Time spent per stage of request handling",
+            stage=stage,
+        ).observe(time.perf_counter() - start)
+
+
+def route_template(scope) -> str:
+    """The matched route's path template, prefix included, "unmatched" for 404s"""
+    # FastAPI >= 0.140 leaves the router prefix out of scope["route"].path and
+    # keeps the prefixed route in its own part of the scope
+    context = scope.get("fastapi", {}).get("effective_route_context")
+    if getattr(context, "path_format", None):
+        return context.path_format
+    return getattr(scope.get("route"), "path", "unmatched")
+
+
+class MetricsMiddleware:
+    """ASGI middleware recording request latency per route template and status"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        start = time.perf_counter()
+        status_code = 500
+
+        async def send_wrapper(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            # the template, raw paths would give one series per itinerary id
+            registry.histogram(
+                "http_request_duration_seconds",
+                "HTTP request latency",
+                method=scope["method"],
+                route=route_template(scope),
+                status=str(status_code),
+            ).observe(time.perf_counter() - start)
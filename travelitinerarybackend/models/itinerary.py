@@ -1,7 +1,7 @@
-from datetime import datetime
+from datetime import date, datetime
 from typing import Optional
 
-from pydantic import BaseModel, field_validator
+from pydantic import BaseModel, HttpUrl, field_validator
 
 
 class UserItineraryIn(BaseModel):
@@ -32,6 +32,31 @@ class UserItineraryIn(BaseModel):
         return v
 
 
+class ItineraryDay(BaseModel):
+    """One day of a generated itinerary"""
+
+    model_config = {"extra": "allow"}
+
+    day: int
+    activities: list[str]
+
+    @field_validator("activities", mode="before")
+    @classmethod
+    def flatten_activities(cls, v):
+        # models sometimes answer {"time": "Morning", "activity": "..."} objects
+        if not isinstance(v, list):
+            return v
+        flattened = []
+        for activity in v:
+            if isinstance(activity, dict) and "activity" in activity:
+                time = activity.get("time")
+                activity = (
+                    f"{time}: {activity['activity']}" if time else activity["activity"]
+                )
+            flattened.append(activity)
+        return flattened
+
+
 class SaveItineraryRequest(UserItineraryIn):
     """Model for saving generated itinerary to database"""
 
@@ -39,15 +64,52 @@ class SaveItineraryRequest(UserItineraryIn):
     generated_itinerary: list[dict]
 
 
-class UserItinerary(UserItineraryIn):
-    """Model for itinerary stored in database"""
+class UserItinerary(BaseModel):
+    """Model for itinerary stored in database, dates are serialized as YYYY-MM-DD"""
 
     id: int
+    destination: str
+    start_date: date
+    end_date: date
+    interests: list[str]
     days_count: int
     generated_itinerary: Optional[list[dict]] = None
     created_at: datetime
 
 
+class BatchItineraryResult(BaseModel):
+    """One entry of a batch generation, in the same position as its request"""
+
+    index: int
+    days_count: Optional[int] = None
+    itinerary: Optional[list[dict]] = None
+    error: Optional[str] = None
+    latency_ms: float
+
+
+class BatchItineraryResponse(BaseModel):
+    results: list[BatchItineraryResult]
+    latency_ms: float
+
+
+class GenerationJobIn(UserItineraryIn):
+    """Generation request to run in the background"""
+
+    # POSTed the finished job once it succeeds or finally fails
+    callback_url: Optional[HttpUrl] = None
+
+
+class GenerationJob(BaseModel):
+    id: int
+    status: str
+    attempts: int
+    days_count: Optional[int] = None
+    itinerary: Optional[list[dict]] = None
+    error: Optional[str] = None
+    created_at: datetime
+    updated_at: datetime
+
+
 def calculate_days(start_date_str: str, end_date_str: str) -> int:
     """Calculate number of days between start and end dates (inclusive)"""
     start = datetime.strptime(start_date_str, "%Y-%m-%d").date()
@@ -0,0 +1,223 @@
+import logging
+import math
+import time
+from functools import lru_cache
+from typing import Callable, Dict, Optional, Protocol, Tuple
+
+from fastapi import HTTPException, status
+
+from travelitinerarybackend.cache import LRUTTLCache
+from travelitinerarybackend.config import config
+from travelitinerarybackend.metrics import registry
+
+logger = logging.getLogger(__name__)
+
+
+def take_tokens(
+    state: Optional[Tuple[float, float]],
+    now: float,
+    rate: float,
+    capacity: float,
+    cost: float,
+) -> Tuple[Tuple[float, float], float]:
+    """
+    Token bucket step. state is (tokens, updated_at), None for a full bucket.
+    Returns the new state and the seconds to wait, 0 when the tokens were taken.
+    """
+    tokens, updated_at = state or (capacity, now)
+    tokens = min(capacity, tokens + max(0.0, now - updated_at) * rate)
+    if tokens >= cost:
+        return (tokens - cost, now), 0.0
+    return (tokens, now), (cost - tokens) / rate
+
+
+class RateLimitStore(Protocol):
+    async def take(
+        self, key: str, now: float, rate: float, capacity: float, cost: float
+    ) -> float:
+        """Take cost tokens from the bucket at key, returns the seconds to wait"""
+        ...
+
+
+class InMemoryRateLimitStore:
+    """Buckets of this worker only, each worker enforces its own limit"""
+
+    def __init__(self, max_entries: int = 100_000):
+        # a bucket left alone long enough is full again, and can be forgotten
+        self._buckets = LRUTTLCache(max_entries=max_entries, ttl_seconds=3600)
+
+    async def take(
+        self, key: str, now: float, rate: float, capacity: float, cost: float
+    ) -> float:
+        state, wait = take_tokens(self._buckets.get(key), now, rate, capacity, cost)
+        self._buckets.set(key, state, ttl_seconds=capacity / rate)
+        return wait
+
+
+# same step as take_tokens, atomic on the Redis server
+TAKE_TOKENS_SCRIPT = """
+local now = tonumber(ARGV[1])
+local rate = tonumber(ARGV[2])
+local capacity = tonumber(ARGV[3])
+local cost = tonumber(ARGV[4])
+local state = redis.call('HMGET', KEYS[1], 'tokens', 'updated_at')
+local tokens = tonumber(state[1]) or capacity
+local updated_at = tonumber(state[2]) or now
+tokens = math.min(capacity, tokens + math.max(0, now - updated_at) * rate)
+local wait = 0
+if tokens >= cost then
+  tokens = tokens - cost
+else
+  wait = (cost - tokens) / rate
+end
+redis.call('HSET', KEYS[1], 'tokens', tostring(tokens), 'updated_at', tostring(now))
+redis.call('EXPIRE', KEYS[1], math.ceil(capacity / rate) + 1)
+return tostring(wait)
+"""
+
+
+class RedisRateLimitStore:
+    """Buckets shared by every worker through Redis"""
+
+    def __init__(self, client):
+        self.client = client
+
+    async def take(
+        self, key: str, now: float, rate: float, capacity: float, cost: float
+    ) -> float:
+        wait = await self.client.eval(
+            TAKE_TOKENS_SCRIPT, 1, key, now, rate, capacity, cost
+        )
+        return float(wait)
+
+
+class RateLimiter:
+    """
+    Admission control for generation requests: a token bucket per user
+    (RATE_LIMIT_PER_MINUTE, bursts of RATE_LIMIT_BURST) and a cap of
+    GENERATION_MAX_IN_FLIGHT requests per worker. Rejections are 429s with
+    Retry-After, cheaper for everyone than a request queued until it times out.
+    """
+
+    def __init__(
+        self,
+        store: RateLimitStore,
+        per_minute: float,
+        burst: int,
+        max_in_flight: int,
+        clock: Callable[[], float] = time.time,
+    ):
+        self.store = store
+        self.rate = per_minute / 60
+        self.capacity = burst
+        self.max_in_flight = max_in_flight
+        self.in_flight = 0
+        self.rejected: Dict[str, int] = {"rate": 0, "concurrency": 0}
+        self._clock = clock
+
+    def _reject(self, reason: str, retry_after: float) -> HTTPException:
+        self.rejected[reason] += 1
+        return HTTPException(
+            status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+            detail="Too many generation requests, try again later",
+            headers={"Retry-After": str(max(1, math.ceil(retry_after)))},
+        )
+
+    async def check(self, user_id: int, cost: int = 1) -> None:
+        """Take cost tokens from the user's bucket, 429 when it runs dry"""
+        # a batch larger than the bucket could never pass otherwise
+        cost = min(cost, self.capacity)
+        try:
+            wait = await self.store.take(
+                f"ratelimit:generate:{user_id}",
+                self._clock(),
+                self.rate,
+                self.capacity,
+                cost,
+            )
+        except Exception as e:
+            # an unreachable shared store must not take generation down with it
+            logger.warning(f"Rate limit store failed, letting request through: {e}")
+            return
+        if wait > 0:
+            logger.warning(f"User {user_id} is over the generation rate limit")
+            raise self._reject("rate", wait)
+
+    async def acquire(self, user_id: int, cost: int = 1) -> Callable[[], None]:
+        """
+        check() plus a slot under the in-flight cap.
+        Returns the function giving the slot back, safe to call more than once.
+        """
+        if self.in_flight >= self.max_in_flight:
+            logger.warning("Generation capacity exhausted, shedding request")
+            raise self._reject("concurrency", 1)
+        # taken before awaiting check(), so concurrent requests see each other
+        self.in_flight += 1
+        try:
+            await self.check(user_id, cost)
+        except BaseException:
+            self.in_flight -= 1
+            raise
+        released = False
+
+        def release() -> None:
+            nonlocal released
+            if not released:
+                released = True
+                self.in_flight -= 1
+
+        return release
+
+    def stats(self) -> dict:
+        return {
+            "in_flight": self.in_flight,
+            "max_in_flight": self.max_in_flight,
+            "rejected": dict(self.rejected),
+        }
+
+
+@lru_cache()
+def get_rate_limiter() -> RateLimiter:
+    if config.RATE_LIMIT_BACKEND == "memory":
+        store = InMemoryRateLimitStore()
+    elif config.RATE_LIMIT_BACKEND == "redis":
+        try:
+            import redis.asyncio as redis
+        except ImportError as e:
+            raise RuntimeError(
+                "RATE_LIMIT_BACKEND=redis requires the redis package"
+            ) from e
+        store = RedisRateLimitStore(redis.from_url(config.REDIS_URL))
+    else:
+        raise ValueError(
+            f"Invalid RATE_LIMIT_BACKEND: {config.RATE_LIMIT_BACKEND}. "
+            "Must be one of ['memory', 'redis']"
+        )
+    return RateLimiter(
+        store,
+        per_minute=config.RATE_LIMIT_PER_MINUTE,
+        burst=config.RATE_LIMIT_BURST,
+        max_in_flight=config.GENERATION_MAX_IN_FLIGHT,
+    )
+
+
+def collect_rate_limit_metrics():
+    stats = get_rate_limiter().stats()
+    yield (
+        "generation_in_flight",
+        "gauge",
+        "Generation requests in flight",
+        {},
+        stats["in_flight"],
+    )
+    for reason, count in stats["rejected"].items():
+        yield (
+            "generation_rejected_total",
+            "counter",
+            "Generation requests rejected with 429",
+            {"reason": reason},
+            count,
+        )
+
+
+registry.add_collector(collect_rate_limit_metrics)
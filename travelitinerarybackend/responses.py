@@ -0,0 +1,30 @@
+from typing import Any, Type
+
+import orjson
+from fastapi.responses import JSONResponse
+from pydantic import BaseModel
+
+from travelitinerarybackend.metrics import stage_timer
+
+
+class ORJSONResponse(JSONResponse):
+    """
+    JSON rendered by orjson, which handles dates, datetimes and nested
+    lists and dicts natively, several times faster than json.dumps.
+    Returned from a route, it also skips FastAPI's response_model validation.
+    """
+
+    def render(self, content: Any) -> bytes:
+        with stage_timer("serialize"):
+            return orjson.dumps(content, option=orjson.OPT_NON_STR_KEYS)
+
+
+def from_record(model: Type[BaseModel], record) -> dict:
+    """
+    The fields of model read from a database row, without validating them again:
+    rows were validated on their way in. Other columns (user_id...) are left out.
+    """
+    row = dict(record)
+    return {
+        name: row.get(name, field.default) for name, field in model.model_fields.items()
+    }
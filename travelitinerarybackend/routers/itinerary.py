@@ -1,42 +1,78 @@
+import asyncio
+import base64
+import json
 import logging
+import math
+import time
 from datetime import datetime
+from typing import Optional
 
-from fastapi import APIRouter, Depends, HTTPException
+import sqlalchemy
+from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi.responses import StreamingResponse
+from starlette.background import BackgroundTask
 from typing_extensions import Annotated
 
-from travelitinerarybackend.database import database, itinerary_table
+from travelitinerarybackend.config import config
+from travelitinerarybackend.database import (
+    database,
+    has_interest,
+    itinerary_columns,
+    itinerary_row,
+    itinerary_table,
+    supports_returning,
+)
 from travelitinerarybackend.models.itinerary import (
+    BatchItineraryResponse,
     SaveItineraryRequest,
     UserItinerary,
     UserItineraryIn,
     calculate_days,
 )
 from travelitinerarybackend.models.user import User
-from travelitinerarybackend.security import get_current_user
+from travelitinerarybackend.rate_limit import RateLimiter, get_rate_limiter
+from travelitinerarybackend.responses import ORJSONResponse, from_record
+from travelitinerarybackend.security import get_current_token_user
+from travelitinerarybackend.services.circuit_breaker import CircuitOpenError
 from travelitinerarybackend.services.gemini_service import (
     GeminiService,
     get_gemini_service,
 )
+from travelitinerarybackend.services.itinerary_cache import make_cache_key
 
 router = APIRouter()
 
 logger = logging.getLogger(__name__)
 
 
-def convert_dates_to_strings(record_dict):
-    """Helper function to convert date objects to strings"""
-    if "start_date" in record_dict and record_dict["start_date"]:
-        record_dict["start_date"] = record_dict["start_date"].strftime("%Y-%m-%d")
-    if "end_date" in record_dict and record_dict["end_date"]:
-        record_dict["end_date"] = record_dict["end_date"].strftime("%Y-%m-%d")
-    return record_dict
+def service_unavailable(e: CircuitOpenError) -> HTTPException:
+    """503 telling the client when the circuit breaker lets calls through again"""
+    return HTTPException(
+        status_code=503,
+        detail=str(e),
+        headers={"Retry-After": str(max(1, math.ceil(e.retry_after)))},
+    )
+
+
+def encode_cursor(created_at: datetime, id: int) -> str:
+    """Opaque keyset cursor pointing just after the given row"""
+    raw = json.dumps([created_at.isoformat(), id])
+    return base64.urlsafe_b64encode(raw.encode("utf8")).decode("ascii")
+
+
+def decode_cursor(cursor: str) -> tuple[datetime, int]:
+    try:
+        created_at, id = json.loads(base64.urlsafe_b64decode(cursor.encode("ascii")))
+        return datetime.fromisoformat(created_at), int(id)
+    except (ValueError, TypeError) as e:
+        raise HTTPException(status_code=400, detail="Invalid cursor") from e
 
 
 # Save a new itinerary
 @router.post("/itinerary", response_model=UserItinerary)
 async def create_itinerary(
     request: SaveItineraryRequest,
-    current_user: Annotated[User, Depends(get_current_user)],
+    current_user: Annotated[User, Depends(get_current_token_user)],
 ):
     """
     Save the generated itinerary to database.
@@ -54,24 +90,29 @@ async def create_itinerary(
             "end_date": end_date,
             "days_count": request.days_count,
             "interests": request.interests,
-            "generated_itinerary": request.generated_itinerary,
+            **itinerary_columns(request.generated_itinerary),
         }
 
         # Save to database
         query = itinerary_table.insert().values(**save_data, user_id=current_user.id)
-        last_record_id = await database.execute(query)
-
-        # Fetch the saved record
-        fetch_query = itinerary_table.select().where(
-            itinerary_table.c.id == last_record_id
+        if supports_returning():
+            saved_record = await database.fetch_one(query.returning(*itinerary_table.c))
+        else:
+            last_record_id = await database.execute(query)
+
+            # Fetch the saved record
+            fetch_query = itinerary_table.select().where(
+                itinerary_table.c.id == last_record_id
+            )
+            saved_record = await database.fetch_one(fetch_query)
+
+        saved = from_record(UserItinerary, itinerary_row(saved_record))
+        # not the itinerary itself, a 30 day trip is tens of KB of log line
+        logger.info(
+            f"Saved itinerary {saved['id']} for user {current_user.id}: "
+            f"{saved['destination']}, {saved['days_count']} days"
         )
-        saved_record = await database.fetch_one(fetch_query)
-
-        # Convert Date objects back to strings for response
-        response_data = dict(saved_record)
-        response_data = convert_dates_to_strings(response_data)
-        logger.info(f"Saved itinerary: {response_data}")
-        return response_data
+        return ORJSONResponse(saved)
 
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error saving itinerary: {str(e)}")
@@ -79,21 +120,81 @@ async def create_itinerary(
 
 # Get all itineraries
 @router.get("/itinerary", response_model=list[UserItinerary])
-async def get_itineraries(current_user: Annotated[User, Depends(get_current_user)]):
+async def get_itineraries(
+    current_user: Annotated[User, Depends(get_current_token_user)],
+    limit: Annotated[int, Query(ge=1, le=100)] = 50,
+    cursor: Optional[str] = None,
+    summary: bool = False,
+    interest: Optional[str] = None,
+):
+    """
+    List saved itineraries, newest first, one page at a time.
+    When there are more, the X-Next-Cursor header holds the `cursor` for the next page.
+    With `summary=true` the generated_itinerary field is left out.
+    With `interest`, only itineraries planned around that interest are listed.
+    """
+    after = decode_cursor(cursor) if cursor else None
     try:
-        query = itinerary_table.select().where(
-            itinerary_table.c.user_id == current_user.id
+        columns = [
+            column
+            for column in itinerary_table.c
+            if not (summary and column.name.startswith("generated_itinerary"))
+        ]
+        query = (
+            sqlalchemy.select(*columns)
+            .where(itinerary_table.c.user_id == current_user.id)
+            .order_by(itinerary_table.c.created_at.desc(), itinerary_table.c.id.desc())
+            .limit(limit + 1)
         )
+        if interest:
+            query = query.where(has_interest(interest))
+        if after:
+            created_at, last_id = after
+            query = query.where(
+                sqlalchemy.or_(
+                    itinerary_table.c.created_at < created_at,
+                    sqlalchemy.and_(
+                        itinerary_table.c.created_at == created_at,
+                        itinerary_table.c.id < last_id,
+                    ),
+                )
+            )
         results = await database.fetch_all(query)
 
-        # Convert Date objects to strings for all records
-        converted_results = []
-        for row in results:
-            row_dict = dict(row)
-            row_dict = convert_dates_to_strings(row_dict)
-            converted_results.append(row_dict)
+        # the extra row only tells us there is a next page
+        next_cursor = None
+        if len(results) > limit:
+            results = results[:limit]
+            last = results[-1]
+            next_cursor = encode_cursor(last.created_at, last.id)
+
+        response = ORJSONResponse(
+            [from_record(UserItinerary, itinerary_row(row)) for row in results]
+        )
+        if next_cursor:
+            response.headers["X-Next-Cursor"] = next_cursor
+        return response
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Database error: {str(e)}")
+
 
-        return converted_results
+# Get one saved itinerary with its full generated itinerary
+@router.get("/itinerary/{id}", response_model=UserItinerary)
+async def get_itinerary(
+    id: int, current_user: Annotated[User, Depends(get_current_token_user)]
+):
+    try:
+        query = itinerary_table.select().where(
+            itinerary_table.c.id == id, itinerary_table.c.user_id == current_user.id
+        )
+        record = await database.fetch_one(query)
+        if not record:
+            raise HTTPException(status_code=404, detail="Itinerary not found")
+
+        return ORJSONResponse(from_record(UserItinerary, itinerary_row(record)))
+
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Database error: {str(e)}")
 
@@ -101,20 +202,28 @@ async def get_itineraries(current_user: Annotated[User, Depends(get_current_user
 # Delete a saved itinerary
 @router.delete("/itinerary/{id}")
 async def delete_itinerary(
-    id: int, current_user: Annotated[User, Depends(get_current_user)]
+    id: int, current_user: Annotated[User, Depends(get_current_token_user)]
 ):
     try:
-        # First, check if the record exists
-        check_query = itinerary_table.select().where(itinerary_table.c.id == id)
-        existing_record = await database.fetch_one(check_query)
-
-        if not existing_record:
+        # only the owner may delete, anyone else gets the same 404 as a missing id
+        owned = sqlalchemy.and_(
+            itinerary_table.c.id == id, itinerary_table.c.user_id == current_user.id
+        )
+        if supports_returning():
+            delete_query = (
+                itinerary_table.delete().where(owned).returning(itinerary_table.c.id)
+            )
+            deleted = await database.fetch_one(delete_query)
+        else:
+            # First, check if the record exists
+            check_query = itinerary_table.select().where(owned)
+            deleted = await database.fetch_one(check_query)
+            if deleted:
+                await database.execute(itinerary_table.delete().where(owned))
+
+        if not deleted:
             raise HTTPException(status_code=404, detail="Itinerary not found")
 
-        # If exists, delete it
-        delete_query = itinerary_table.delete().where(itinerary_table.c.id == id)
-        await database.execute(delete_query)
-
         return {"message": f"Itinerary {id} deleted successfully"}
 
     except HTTPException:
@@ -127,19 +236,13 @@ async def delete_itinerary(
 async def update_itinerary(
     id: int,
     updates: SaveItineraryRequest,
-    current_user: Annotated[User, Depends(get_current_user)],
+    current_user: Annotated[User, Depends(get_current_token_user)],
 ):
     """
     Update itinerary - always regenerates with new parameters
     Same input as generate endpoint
     """
     try:
-        # Check if exists
-        check_query = itinerary_table.select().where(itinerary_table.c.id == id)
-        existing = await database.fetch_one(check_query)
-        if not existing:
-            raise HTTPException(status_code=404, detail="Itinerary not found")
-
         # Convert dates for database
         start_date_obj = datetime.strptime(updates.start_date, "%Y-%m-%d").date()
         end_date_obj = datetime.strptime(updates.end_date, "%Y-%m-%d").date()
@@ -151,24 +254,30 @@ async def update_itinerary(
             "end_date": end_date_obj,
             "days_count": updates.days_count,
             "interests": updates.interests,
-            "generated_itinerary": updates.generated_itinerary,
-            "user_id": current_user.id,
+            **itinerary_columns(updates.generated_itinerary),
         }
 
-        update_query = (
-            itinerary_table.update()
-            .where(itinerary_table.c.id == id)
-            .values(**update_data)
+        # only the owner may update, anyone else gets the same 404 as a missing id
+        owned = sqlalchemy.and_(
+            itinerary_table.c.id == id, itinerary_table.c.user_id == current_user.id
         )
-        await database.execute(update_query)
-
-        # Return updated record
-        fetch_query = itinerary_table.select().where(itinerary_table.c.id == id)
-        updated_record = await database.fetch_one(fetch_query)
-        response_data = dict(updated_record)
-        response_data = convert_dates_to_strings(response_data)
+        update_query = itinerary_table.update().where(owned).values(**update_data)
+        if supports_returning():
+            updated_record = await database.fetch_one(
+                update_query.returning(*itinerary_table.c)
+            )
+        else:
+            # Check if exists
+            check_query = itinerary_table.select().where(owned)
+            updated_record = await database.fetch_one(check_query)
+            if updated_record:
+                await database.execute(update_query)
+                updated_record = await database.fetch_one(check_query)
+
+        if not updated_record:
+            raise HTTPException(status_code=404, detail="Itinerary not found")
 
-        return response_data
+        return ORJSONResponse(from_record(UserItinerary, itinerary_row(updated_record)))
 
     except HTTPException:
         raise
@@ -181,24 +290,152 @@ async def update_itinerary(
 async def generate_itinerary(
     request: UserItineraryIn,
     gemini_service: Annotated[GeminiService, Depends(get_gemini_service)],
-    current_user: Annotated[User, Depends(get_current_user)],
+    limiter: Annotated[RateLimiter, Depends(get_rate_limiter)],
+    current_user: Annotated[User, Depends(get_current_token_user)],
 ):
     """
     Generate itinerary for preview - NO database save.
     User can review before deciding to save.
     """
+    release = await limiter.acquire(current_user.id)
     try:
         days_count = calculate_days(request.start_date, request.end_date)
 
         # Generate actual itinerary
-        generated_itinerary = gemini_service.generate_itinerary(
+        generated_itinerary = await gemini_service.generate_itinerary_async(
             request.destination, request.start_date, request.end_date, request.interests
         )
-        return {"days_count": days_count, "itinerary": generated_itinerary}
+        return ORJSONResponse(
+            {"days_count": days_count, "itinerary": generated_itinerary}
+        )
 
     except ValueError as e:
         raise HTTPException(status_code=400, detail=str(e))
+    except CircuitOpenError as e:
+        raise service_unavailable(e)
     except Exception as e:
         raise HTTPException(
             status_code=500, detail=f"Error generating itinerary: {str(e)}"
         )
+    finally:
+        release()
+
+
+# Generate several itineraries at once
+@router.post("/itinerary/generate/batch", response_model=BatchItineraryResponse)
+async def generate_itinerary_batch(
+    requests: list[UserItineraryIn],
+    gemini_service: Annotated[GeminiService, Depends(get_gemini_service)],
+    limiter: Annotated[RateLimiter, Depends(get_rate_limiter)],
+    current_user: Annotated[User, Depends(get_current_token_user)],
+):
+    """
+    Generate previews for many trips concurrently - NO database save.
+    Identical entries are generated once. Results keep the order of the request,
+    a failed entry carries an error instead of failing the whole batch.
+    """
+    if len(requests) > config.GENERATION_BATCH_MAX_ITEMS:
+        raise HTTPException(
+            status_code=400,
+            detail=f"A batch can hold at most {config.GENERATION_BATCH_MAX_ITEMS} items",
+        )
+
+    release = await limiter.acquire(current_user.id, cost=len(requests))
+    batch_start = time.perf_counter()
+    semaphore = asyncio.Semaphore(config.GENERATION_BATCH_CONCURRENCY)
+
+    async def generate_one(request: UserItineraryIn) -> dict:
+        async with semaphore:
+            start = time.perf_counter()
+            result = {
+                "days_count": calculate_days(request.start_date, request.end_date)
+            }
+            try:
+                result["itinerary"] = await gemini_service.generate_itinerary_async(
+                    request.destination,
+                    request.start_date,
+                    request.end_date,
+                    request.interests,
+                )
+            except Exception as e:
+                logger.error(f"Error generating batch item: {e}")
+                result["error"] = f"Error generating itinerary: {str(e)}"
+            result["latency_ms"] = (time.perf_counter() - start) * 1000
+            return result
+
+    # one task per distinct trip, duplicates point at the same task
+    keys = [
+        make_cache_key(r.destination, r.start_date, r.end_date, r.interests)
+        for r in requests
+    ]
+    tasks = {}
+    for key, request in zip(keys, requests):
+        if key not in tasks:
+            tasks[key] = asyncio.ensure_future(generate_one(request))
+    try:
+        await asyncio.gather(*tasks.values())
+    finally:
+        release()
+
+    results = [
+        {"index": index, **tasks[key].result()} for index, key in enumerate(keys)
+    ]
+    return {
+        "results": results,
+        "latency_ms": (time.perf_counter() - batch_start) * 1000,
+    }
+
+
+# Stream a generated itinerary day by day
+@router.post("/itinerary/generate/stream")
+async def stream_itinerary(
+    request: UserItineraryIn,
+    gemini_service: Annotated[GeminiService, Depends(get_gemini_service)],
+    limiter: Annotated[RateLimiter, Depends(get_rate_limiter)],
+    current_user: Annotated[User, Depends(get_current_token_user)],
+):
+    """
+    Streaming variant of the generate endpoint, as NDJSON.
+    Emits a "meta" line, one "day" line per completed day, then "done" or "error".
+    """
+    days_count = calculate_days(request.start_date, request.end_date)
+    release = await limiter.acquire(current_user.id)
+    try:
+        # once the stream starts the status is sent, fail fast while it can be a 503
+        await gemini_service.check_available(
+            request.destination, request.start_date, request.end_date, request.interests
+        )
+    except CircuitOpenError as e:
+        release()
+        raise service_unavailable(e)
+
+    async def ndjson_lines():
+        yield json.dumps({"type": "meta", "days_count": days_count}) + "\n"
+        try:
+            async for day in gemini_service.stream_itinerary(
+                request.destination,
+                request.start_date,
+                request.end_date,
+                request.interests,
+            ):
+                yield json.dumps({"type": "day", "day": day}) + "\n"
+        except Exception as e:
+            # the status line is already sent, report the failure in-band
+            logger.error(f"Error streaming itinerary: {e}")
+            yield (
+                json.dumps(
+                    {"type": "error", "detail": f"Error generating itinerary: {str(e)}"}
+                )
+                + "\n"
+            )
+            return
+        finally:
+            release()
+        yield json.dumps({"type": "done"}) + "\n"
+
+    # the background task frees the slot if the stream never started
+    return StreamingResponse(
+        ndjson_lines(),
+        media_type="application/x-ndjson",
+        background=BackgroundTask(release),
+    )
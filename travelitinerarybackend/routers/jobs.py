@@ -0,0 +1,68 @@
+import logging
+
+from fastapi import APIRouter, Depends, HTTPException, status
+from typing_extensions import Annotated
+
+from travelitinerarybackend.models.itinerary import GenerationJob, GenerationJobIn
+from travelitinerarybackend.models.user import User
+from travelitinerarybackend.rate_limit import RateLimiter, get_rate_limiter
+from travelitinerarybackend.security import get_current_token_user
+from travelitinerarybackend.services.generation_jobs import (
+    CallbackURLError,
+    check_callback_url,
+    enqueue_job,
+    get_job,
+    job_to_dict,
+)
+
+router = APIRouter()
+
+logger = logging.getLogger(__name__)
+
+
+# Queue an itinerary generation
+@router.post(
+    "/itinerary/jobs",
+    response_model=GenerationJob,
+    status_code=status.HTTP_202_ACCEPTED,
+)
+async def create_generation_job(
+    request: GenerationJobIn,
+    limiter: Annotated[RateLimiter, Depends(get_rate_limiter)],
+    current_user: Annotated[User, Depends(get_current_token_user)],
+):
+    """
+    Generate an itinerary in the background, for trips too long to wait on.
+    Poll GET /api/itinerary/jobs/{id}, or pass callback_url to be notified.
+    Counts against the generation rate limit like a direct generate call.
+    """
+    callback_url = str(request.callback_url) if request.callback_url else None
+    if callback_url:
+        try:
+            check_callback_url(callback_url)
+        except CallbackURLError as e:
+            raise HTTPException(status_code=422, detail=str(e))
+    await limiter.check(current_user.id)
+    try:
+        job = await enqueue_job(current_user.id, request, callback_url)
+        logger.info(f"Queued generation job {job.id}")
+        return job_to_dict(job)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Database error: {str(e)}")
+
+
+# Get the state (and result) of a generation job
+@router.get("/itinerary/jobs/{id}", response_model=GenerationJob)
+async def get_generation_job(
+    id: int, current_user: Annotated[User, Depends(get_current_token_user)]
+):
+    try:
+        job = await get_job(id, current_user.id)
+        if not job:
+            raise HTTPException(status_code=404, detail="Job not found")
+        return job_to_dict(job)
+
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Database error: {str(e)}")
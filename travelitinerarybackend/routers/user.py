@@ -1,17 +1,22 @@
 import logging
 
 from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi.responses import PlainTextResponse
 from fastapi.security import OAuth2PasswordRequestForm
 from typing_extensions import Annotated
 
-from travelitinerarybackend.database import database, user_table
+from travelitinerarybackend.config import config
+from travelitinerarybackend.database import database, pool_stats, user_table
+from travelitinerarybackend.metrics import registry
 from travelitinerarybackend.models.user import UserIn
 from travelitinerarybackend.security import (
     authenticate_user,
     create_access_token,
-    get_password_hash,
+    get_password_hash_async,
     get_user,
+    invalidate_user,
 )
+from travelitinerarybackend.services.circuit_breaker import get_circuit_breaker
 
 logger = logging.getLogger(__name__)
 
@@ -24,12 +29,13 @@ async def register_user(user: UserIn):
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST, detail="Email already registered"
         )
-    hashed_password = get_password_hash(user.password)
+    hashed_password = await get_password_hash_async(user.password)
 
     query = user_table.insert().values(email=user.email, password=hashed_password)
     print(query)
 
     await database.execute(query)
+    invalidate_user(user.email)
 
     return {"detail": "User registered successfully"}
 
@@ -37,10 +43,25 @@ async def register_user(user: UserIn):
 @router.post("/token")
 async def login(form_data: Annotated[OAuth2PasswordRequestForm, Depends()]):
     user = await authenticate_user(form_data.username, form_data.password)
-    access_token = create_access_token(user.email)
+    access_token = create_access_token(
+        user.email, user_id=user.id if config.JWT_EMBED_USER_ID else None
+    )
     return {"access_token": access_token, "token_type": "bearer"}
 
 
 @router.get("/health")
 async def health():
-    return {"status": "healthy"}
+    # the breaker is reported, not acted on: CRUD still works while Gemini is down
+    return {
+        "status": "healthy",
+        "db_pool": pool_stats(),
+        "gemini_breaker": get_circuit_breaker().stats(),
+    }
+
+
+@router.get("/metrics", response_class=PlainTextResponse)
+async def metrics():
+    """Prometheus text exposition of the metrics of this worker"""
+    return PlainTextResponse(
+        registry.render(), media_type="text/plain; version=0.0.4; charset=utf-8"
+    )
@@ -1,5 +1,8 @@
+import asyncio
 import datetime
 import logging
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional
 
 from fastapi import Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordBearer
@@ -7,10 +10,28 @@ from jose import ExpiredSignatureError, JWTError, jwt
 from passlib.context import CryptContext
 from typing_extensions import Annotated
 
+from travelitinerarybackend.cache import LRUTTLCache
 from travelitinerarybackend.config import config
 from travelitinerarybackend.database import database, user_table
-
-pwd_context = CryptContext(schemes=["argon2"])
+from travelitinerarybackend.metrics import stage_timer
+from travelitinerarybackend.models.user import User
+from travelitinerarybackend.tracing import span
+
+pwd_context = CryptContext(
+    schemes=["argon2"],
+    argon2__time_cost=config.ARGON2_TIME_COST,
+    argon2__memory_cost=config.ARGON2_MEMORY_COST,
+    argon2__parallelism=config.ARGON2_PARALLELISM,
+)
+# Argon2 is CPU bound and releases the GIL, keep it off the event loop
+password_hash_executor = ThreadPoolExecutor(
+    max_workers=config.PASSWORD_HASH_WORKERS, thread_name_prefix="argon2"
+)
+password_hash_pending = 0
+user_cache = LRUTTLCache(
+    max_entries=config.USER_CACHE_MAX_ENTRIES,
+    ttl_seconds=config.USER_CACHE_TTL_SECONDS,
+)
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="token")
 
 credentials_exception = HTTPException(
@@ -25,7 +46,7 @@ def access_token_expire_minute():
     return 30
 
 
-def create_access_token(email: str):
+def create_access_token(email: str, user_id: Optional[int] = None):
     logger.debug(f"Creating access token for email {email}")
 
     expire = datetime.datetime.now(datetime.timezone.utc) + datetime.timedelta(
@@ -33,6 +54,8 @@ def create_access_token(email: str):
     )
 
     jwt_data = {"sub": email, "exp": expire}
+    if user_id is not None:
+        jwt_data["uid"] = user_id
     encoded_jwt = jwt.encode(
         jwt_data, key=config.SECRET_KEY, algorithm=config.ALGORITHM
     )
@@ -47,30 +70,73 @@ def verify_password(plain_password: str, hashed_password: str) -> bool:
     return pwd_context.verify(plain_password, hashed_password)
 
 
+async def run_password_job(fn, *args):
+    """
+    Run a hash/verify call on the password thread pool.
+    Rejects with 503 once PASSWORD_HASH_MAX_PENDING calls are queued,
+    instead of letting a login burst build an unbounded backlog.
+    """
+    global password_hash_pending
+    if password_hash_pending >= config.PASSWORD_HASH_MAX_PENDING:
+        logger.warning("Password hashing pool saturated, rejecting request")
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Too many authentication requests, try again shortly",
+            headers={"Retry-After": "1"},
+        )
+    password_hash_pending += 1
+    try:
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(password_hash_executor, fn, *args)
+    finally:
+        password_hash_pending -= 1
+
+
+async def get_password_hash_async(password: str) -> str:
+    # the span includes the wait for a pool thread
+    with span("password.hash"):
+        return await run_password_job(get_password_hash, password)
+
+
+async def verify_password_async(plain_password: str, hashed_password: str) -> bool:
+    with span("password.verify"):
+        return await run_password_job(verify_password, plain_password, hashed_password)
+
+
 async def get_user(email: str):
+    user = user_cache.get(email)
+    if user is not None:
+        return user
     query = user_table.select().where(user_table.c.email == email)
     user = await database.fetch_one(query)
+    if user:
+        user_cache.set(email, user)
     return user if user else None
 
 
+def invalidate_user(email: str):
+    # call whenever a user row is written
+    user_cache.delete(email)
+
+
 async def authenticate_user(email: str, password: str):
     user = await get_user(email)
     # user is not in the db
     if not user:
         raise credentials_exception
-    if not verify_password(password, user.password):
+    if not await verify_password_async(password, user.password):
         raise credentials_exception
     return user
 
 
-async def get_current_user(token: Annotated[str, Depends(oauth2_scheme)]):
+def decode_access_token(token: str) -> dict:
     try:
         payload = jwt.decode(
             token, key=config.SECRET_KEY, algorithms=[config.ALGORITHM]
         )
-        email = payload.get("sub")
-        if email is None:
+        if payload.get("sub") is None:
             raise credentials_exception
+        return payload
     except ExpiredSignatureError as e:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
@@ -80,7 +146,29 @@ async def get_current_user(token: Annotated[str, Depends(oauth2_scheme)]):
     except JWTError as e:
         raise credentials_exception from e
 
-    user = await get_user(email=email)
+
+async def get_current_user(token: Annotated[str, Depends(oauth2_scheme)]):
+    with stage_timer("auth"):
+        payload = decode_access_token(token)
+        user = await get_user(email=payload["sub"])
     if user is None:
         raise credentials_exception
     return user
+
+
+async def get_current_token_user(
+    token: Annotated[str, Depends(oauth2_scheme)],
+) -> User:
+    """
+    Like get_current_user, but trusts the user id embedded in the token (see
+    JWT_EMBED_USER_ID) instead of looking the user up. Older tokens without
+    an id fall back to the lookup.
+    """
+    with stage_timer("auth"):
+        payload = decode_access_token(token)
+        if payload.get("uid") is not None:
+            return User(id=payload["uid"], email=payload["sub"])
+        user = await get_user(email=payload["sub"])
+    if user is None:
+        raise credentials_exception
+    return User(id=user.id, email=user.email)
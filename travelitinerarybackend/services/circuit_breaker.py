@@ -0,0 +1,165 @@
+import logging
+import time
+from collections import deque
+from functools import lru_cache
+from typing import Callable
+
+from travelitinerarybackend.config import config
+from travelitinerarybackend.metrics import registry
+
+logger = logging.getLogger(__name__)
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+class CircuitOpenError(RuntimeError):
+    """The breaker is open, the call was not attempted"""
+
+    def __init__(self, retry_after: float):
+        super().__init__("Itinerary generation is temporarily unavailable")
+        self.retry_after = retry_after
+
+
+class CircuitBreaker:
+    """
+    Stops calling a degraded upstream instead of waiting out its timeouts.
+    Over the last `window` calls, a call fails when it raises or takes longer than
+    slow_call_seconds. Once at least min_calls are recorded and the failure rate
+    reaches failure_rate, the breaker opens and calls fail fast for open_seconds.
+    Then up to half_open_probes calls go through: success closes it, failure reopens.
+    """
+
+    def __init__(
+        self,
+        window: int = 20,
+        min_calls: int = 10,
+        failure_rate: float = 0.5,
+        slow_call_seconds: float = 30.0,
+        open_seconds: float = 30.0,
+        half_open_probes: int = 1,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self.min_calls = min_calls
+        self.failure_rate = failure_rate
+        self.slow_call_seconds = slow_call_seconds
+        self.open_seconds = open_seconds
+        self.half_open_probes = half_open_probes
+        self._clock = clock
+        self._outcomes: deque = deque(maxlen=window)
+        self._state = CLOSED
+        self._opened_at = 0.0
+        self._probes = 0
+        self.rejected = 0
+
+    @property
+    def state(self) -> str:
+        if self._state == OPEN and self._clock() - self._opened_at >= self.open_seconds:
+            self._state = HALF_OPEN
+            self._probes = 0
+        return self._state
+
+    def retry_after(self) -> float:
+        return max(0.0, self._opened_at + self.open_seconds - self._clock())
+
+    def before_call(self) -> bool:
+        """
+        Raise CircuitOpenError unless the call may go ahead.
+        Returns whether the call is a half-open probe, to pass on to after_call.
+        """
+        if self.state == CLOSED:
+            return False
+        if self.allows_call():
+            self._probes += 1
+            return True
+        raise self.reject()
+
+    def allows_call(self) -> bool:
+        """Whether before_call would let a call through, without taking a probe slot"""
+        state = self.state
+        return state == CLOSED or (
+            state == HALF_OPEN and self._probes < self.half_open_probes
+        )
+
+    def reject(self) -> CircuitOpenError:
+        """Count a call failed fast, returns the error to raise for it"""
+        self.rejected += 1
+        return CircuitOpenError(self.retry_after())
+
+    def after_call(self, success: bool, seconds: float, probe: bool = False) -> None:
+        failed = not success or seconds > self.slow_call_seconds
+        if probe:
+            self._probes -= 1
+            if failed:
+                self._open()
+            else:
+                logger.info("Circuit breaker closed")
+                self._state = CLOSED
+                self._outcomes.clear()
+            return
+        if self._state != CLOSED:
+            # a call started before the breaker opened
+            return
+
+        self._outcomes.append(failed)
+        if (
+            len(self._outcomes) >= self.min_calls
+            and sum(self._outcomes) / len(self._outcomes) >= self.failure_rate
+        ):
+            self._open()
+
+    def release(self, probe: bool) -> None:
+        """A call ended without an outcome, e.g. cancelled: free its probe slot only"""
+        if probe:
+            self._probes -= 1
+
+    def _open(self) -> None:
+        logger.warning(f"Circuit breaker opened for {self.open_seconds}s")
+        self._state = OPEN
+        self._opened_at = self._clock()
+        self._outcomes.clear()
+
+    def stats(self) -> dict:
+        outcomes = list(self._outcomes)
+        return {
+            "state": self.state,
+            "failure_rate": sum(outcomes) / len(outcomes) if outcomes else 0.0,
+            "calls": len(outcomes),
+            "rejected": self.rejected,
+        }
+
+
+@lru_cache()
+def get_circuit_breaker() -> CircuitBreaker:
+    """The breaker guarding Gemini calls of this worker"""
+    return CircuitBreaker(
+        window=config.GEMINI_BREAKER_WINDOW,
+        min_calls=config.GEMINI_BREAKER_MIN_CALLS,
+        failure_rate=config.GEMINI_BREAKER_FAILURE_RATE,
+        slow_call_seconds=config.GEMINI_BREAKER_SLOW_CALL_SECONDS,
+        open_seconds=config.GEMINI_BREAKER_OPEN_SECONDS,
+        half_open_probes=config.GEMINI_BREAKER_HALF_OPEN_PROBES,
+    )
+
+
+def collect_breaker_metrics():
+    stats = get_circuit_breaker().stats()
+    for state in (CLOSED, OPEN, HALF_OPEN):
+        yield (
+            "gemini_breaker_state",
+            "gauge",
+            "1 for the current state of the Gemini circuit breaker",
+            {"state": state},
+            int(stats["state"] == state),
+        )
+    yield (
+        "gemini_breaker_rejected_total",
+        "counter",
+        "Calls failed fast by the Gemini circuit breaker",
+        {},
+        stats["rejected"],
+    )
+
+
+registry.add_collector(collect_breaker_metrics)
@@ -1,24 +1,146 @@
-import json
+import asyncio
+import logging
+import math
+import threading
+import time
+from datetime import datetime, timedelta
 from functools import lru_cache
-from typing import List
-
-import vertexai
-from vertexai.preview.generative_models import GenerativeModel, Part
+from typing import AsyncIterator, Dict, List, Optional, Tuple
 
 from travelitinerarybackend.config import config
+from travelitinerarybackend.metrics import LatencyHistogram, registry, stage_timer
+from travelitinerarybackend.models.itinerary import ItineraryDay, calculate_days
+from travelitinerarybackend.services.circuit_breaker import (
+    CircuitBreaker,
+    CircuitOpenError,
+    get_circuit_breaker,
+)
+from travelitinerarybackend.services.generators import (
+    ItineraryGenerator,
+    get_itinerary_generator,
+)
+from travelitinerarybackend.services.itinerary_cache import (
+    ItineraryCache,
+    get_itinerary_cache,
+    make_cache_key,
+    make_destination_key,
+)
+from travelitinerarybackend.services.itinerary_parser import (
+    IncrementalDayParser,
+    ItineraryParseError,
+    parse_itinerary,
+    validate_day,
+)
+from travelitinerarybackend.services.single_flight import SingleFlight
+from travelitinerarybackend.tracing import span
+
+logger = logging.getLogger(__name__)
+
+
+class ModelCallError(RuntimeError):
+    """The model call failed, as opposed to its answer failing to parse"""
+
 
-# Initialize Vertex AI SDK
-vertexai.init(project=config.GCP_PROJECT_ID, location=config.GCP_REGION)
+def split_days(
+    days_count: int, chunk_days: int, max_segments: Optional[int] = None
+) -> List[Tuple[int, int]]:
+    """
+    Split days 1..days_count into (first_day, last_day) ranges of chunk_days,
+    longer ones when that would make more than max_segments ranges
+    """
+    if max_segments:
+        chunk_days = max(chunk_days, math.ceil(days_count / max_segments))
+    return [
+        (first_day, min(first_day + chunk_days - 1, days_count))
+        for first_day in range(1, days_count + 1, chunk_days)
+    ]
+
+
+def _strip_schema(schema):
+    # Vertex takes an OpenAPI subset, without the titles and extras pydantic adds
+    if isinstance(schema, dict):
+        return {
+            key: _strip_schema(value)
+            for key, value in schema.items()
+            if key not in ("title", "additionalProperties")
+        }
+    if isinstance(schema, list):
+        return [_strip_schema(value) for value in schema]
+    return schema
+
+
+def itinerary_response_schema() -> dict:
+    """Response schema of a `{"itinerary": [ItineraryDay, ...]}` answer"""
+    return {
+        "type": "object",
+        "properties": {
+            "itinerary": {
+                "type": "array",
+                "items": _strip_schema(ItineraryDay.model_json_schema()),
+            }
+        },
+        "required": ["itinerary"],
+    }
 
 
 class GeminiService:
-    def __init__(self):
-        self.model = GenerativeModel("gemini-2.5-flash")
+    def __init__(
+        self,
+        generator: Optional[ItineraryGenerator] = None,
+        max_concurrency: Optional[int] = None,
+        cache: Optional[ItineraryCache] = None,
+        structured_output: Optional[bool] = None,
+        fallback_generators: Optional[List[ItineraryGenerator]] = None,
+        hedge: Optional[bool] = None,
+        breaker: Optional[CircuitBreaker] = None,
+    ):
+        if generator is None:
+            generator = get_itinerary_generator()
+            if fallback_generators is None:
+                fallback_generators = [
+                    get_itinerary_generator(name)
+                    for name in config.GEMINI_FALLBACK_MODELS
+                ]
+        self.generator = generator
+        # generators tried in order on failure, the first one is the primary
+        self.generators = [generator, *(fallback_generators or [])]
+        self.hedge = config.GENERATION_HEDGE_ENABLED if hedge is None else hedge
+        self.latencies: Dict[str, LatencyHistogram] = {
+            g.name: LatencyHistogram() for g in self.generators
+        }
+        self.call_stats: Dict[str, int] = {"hedges": 0, "hedge_wins": 0, "fallbacks": 0}
+        self.cache = cache
+        self.breaker = breaker or CircuitBreaker()
+        if structured_output is None:
+            structured_output = config.GEMINI_STRUCTURED_OUTPUT
+        self.response_schema = (
+            itinerary_response_schema() if structured_output else None
+        )
+        # parse failures per output mode, to compare structured and prompt output
+        self.parse_failures: Dict[str, int] = {"structured": 0, "prompt": 0}
+        self.flight = SingleFlight()
+        # bounds the number of concurrent upstream calls from this worker
+        self._semaphore = asyncio.Semaphore(
+            max_concurrency or config.GEMINI_MAX_CONCURRENCY
+        )
+
+    @property
+    def output_mode(self) -> str:
+        return self.output_mode_of(self.generator)
 
-    def generate_itinerary(
+    def output_mode_of(self, generator: ItineraryGenerator) -> str:
+        """The mode of generator's answers, prompt once it dropped a rejected schema"""
+        if self.response_schema is None:
+            return "prompt"
+        uses_response_schema = getattr(generator, "uses_response_schema", None)
+        if uses_response_schema and not uses_response_schema(self.response_schema):
+            return "prompt"
+        return "structured"
+
+    def build_prompt(
         self, destination: str, start_date: str, end_date: str, interests: List[str]
-    ) -> List[dict]:
-        prompt = f"""
+    ) -> str:
+        return f"""
 You are a travel assistant. Based on the user input below, generate a JSON itinerary.
 
 User input:
@@ -40,16 +162,473 @@ Respond ONLY with a valid JSON object like:
 }}
 """
 
+    def build_segment_prompt(
+        self,
+        destination: str,
+        start_date: str,
+        end_date: str,
+        interests: List[str],
+        first_day: int,
+        last_day: int,
+    ) -> str:
+        days_count = calculate_days(start_date, end_date)
+        start = datetime.strptime(start_date, "%Y-%m-%d").date()
+        segment_start = start + timedelta(days=first_day - 1)
+        segment_end = start + timedelta(days=last_day - 1)
+        if first_day == 1:
+            opening = "Day 1 is the arrival day."
+        else:
+            opening = (
+                f"Day {first_day} continues from day {first_day - 1}, "
+                "do not start with arrival activities."
+            )
+        if last_day == days_count:
+            closing = f"Day {last_day} is the departure day."
+        else:
+            closing = (
+                f"The trip continues after day {last_day}, "
+                "do not end with departure activities."
+            )
+        return f"""
+You are a travel assistant. You are planning one part of a {days_count}-day trip,
+other parts of the trip are planned separately.
+
+Trip:
+{{
+  "destination": "{destination}",
+  "start_date": "{start_date}",
+  "end_date": "{end_date}",
+  "interests": {interests}
+}}
+
+Plan days {first_day} to {last_day} only ({segment_start} to {segment_end}).
+{opening}
+{closing}
+Spread the destination's main sights over the whole trip, a {days_count}-day visit
+should include neighbourhoods and day trips a short visit would skip.
+
+Respond ONLY with a valid JSON object like:
+{{
+  "itinerary": [
+    {{
+      "day": {first_day},
+      "activities": ["Visit the Eiffel Tower", "Lunch at a bistro", "Evening Seine river cruise"]
+    }}
+  ]
+}}
+"""
+
+    def parse_response(self, text: str, mode: str) -> List[dict]:
+        try:
+            with stage_timer("json_parse"):
+                return parse_itinerary(text)
+        except ItineraryParseError:
+            self._count_parse_failure(mode)
+            raise
+
+    def _count_parse_failure(self, mode: str) -> None:
+        self.parse_failures[mode] += 1
+        logger.warning(
+            f"Unparseable Gemini response in {mode} mode "
+            f"({self.parse_failures[mode]} so far)"
+        )
+
+    async def generate_itinerary_async(
+        self, destination: str, start_date: str, end_date: str, interests: List[str]
+    ) -> List[dict]:
+        """
+        Generate the days of a trip, for use inside async handlers.
+        Waits for a free slot when GEMINI_MAX_CONCURRENCY calls are already in flight.
+        Answers from the cache when an equivalent request was generated before,
+        and shares one upstream call between identical requests in flight.
+        While the circuit breaker is open, falls back to the last itinerary cached
+        for the destination, or raises CircuitOpenError.
+        """
+        key = make_cache_key(destination, start_date, end_date, interests)
+        days_count = calculate_days(start_date, end_date)
+        with span(
+            "gemini.generate_itinerary",
+            **{"itinerary.destination": destination, "itinerary.days": days_count},
+        ) as generation_span:
+            if self.cache is not None:
+                cached = await self.cache.get(key)
+                generation_span.set_attribute("cache.hit", cached is not None)
+                if cached is not None:
+                    return cached
+
+            async def generate_and_store() -> List[dict]:
+                itinerary = await self._generate(
+                    destination, start_date, end_date, interests
+                )
+                # a truncated answer is still served, but not kept for everyone else
+                if len(itinerary) >= days_count:
+                    await self._store(key, destination, itinerary)
+                return itinerary
+
+            try:
+                return await self.flight.do(key, generate_and_store)
+            except CircuitOpenError:
+                fallback = await self._destination_fallback(destination, days_count)
+                if fallback is None:
+                    raise
+                return fallback
+
+    async def _store(self, key: str, destination: str, itinerary: List[dict]) -> None:
+        if self.cache is None:
+            return
+        await self.cache.set(key, itinerary)
+        await self.cache.set(make_destination_key(destination), itinerary)
+
+    async def _destination_fallback(
+        self, destination: str, days_count: int
+    ) -> Optional[List[dict]]:
+        """Any itinerary cached for the destination, cut to days_count days"""
+        if self.cache is None:
+            return None
+        cached = await self.cache.get(make_destination_key(destination))
+        if cached is None:
+            return None
+        logger.warning(f"Circuit open, serving a cached {destination} itinerary")
+        return cached[:days_count]
+
+    async def _generate(
+        self, destination: str, start_date: str, end_date: str, interests: List[str]
+    ) -> List[dict]:
+        """
+        One generation, chunked or not, is one call for the circuit breaker, timed
+        by its slowest model call. Waiting for a concurrency slot is not counted.
+        """
+        # CircuitOpenError goes out as is, callers tell it apart from failures
+        probe = self.breaker.before_call()
+        timings: List[float] = []
         try:
-            response = self.model.generate_content([Part.from_text(prompt)])
-            raw_text = response.candidates[0].content.parts[0].text
-            clean_text = raw_text.replace("```json", "").replace("```", "").strip()
-            parsed = json.loads(clean_text)
-            return parsed.get("itinerary", [])
+            if (
+                calculate_days(start_date, end_date)
+                > config.GENERATION_CHUNK_THRESHOLD_DAYS
+            ):
+                itinerary = await self._generate_chunked(
+                    destination, start_date, end_date, interests, timings
+                )
+            else:
+                prompt = self.build_prompt(destination, start_date, end_date, interests)
+                itinerary = await self._call_model(prompt, timings)
+        except ModelCallError:
+            self.breaker.after_call(False, max(timings, default=0.0), probe)
+            raise
+        except Exception:
+            # the model answered, its answer was unusable
+            self.breaker.after_call(True, max(timings, default=0.0), probe)
+            raise
+        except BaseException:
+            # a cancelled call says nothing about the upstream
+            self.breaker.release(probe)
+            raise
+        self.breaker.after_call(True, max(timings, default=0.0), probe)
+        return itinerary
+
+    async def _generate_chunked(
+        self,
+        destination: str,
+        start_date: str,
+        end_date: str,
+        interests: List[str],
+        timings: List[float],
+    ) -> List[dict]:
+        """
+        Generate a long trip as concurrent day ranges and join them back together,
+        so latency follows the segment length rather than the trip length.
+        When one range fails, the calls for the others are cancelled.
+        """
+        segments = split_days(
+            calculate_days(start_date, end_date),
+            config.GENERATION_CHUNK_DAYS,
+            config.GENERATION_MAX_SEGMENTS,
+        )
+        tasks = [
+            asyncio.create_task(
+                self._call_model(
+                    self.build_segment_prompt(
+                        destination, start_date, end_date, interests, first, last
+                    ),
+                    timings,
+                )
+            )
+            for first, last in segments
+        ]
+        try:
+            done, pending = await asyncio.wait(
+                tasks, return_when=asyncio.FIRST_EXCEPTION
+            )
+        finally:
+            for task in tasks:
+                task.cancel()
+        if pending:
+            # a segment failed, the trip cannot be completed without it
+            await asyncio.gather(*pending, return_exceptions=True)
+        errors = [task.exception() for task in done if task.exception() is not None]
+        if errors:
+            raise errors[0]
+        results = [task.result() for task in tasks]
+
+        # number days by position, whatever numbering each segment came back with
+        itinerary = []
+        for (first_day, last_day), days in zip(segments, results):
+            for offset, day in enumerate(days[: last_day - first_day + 1]):
+                itinerary.append({**day, "day": first_day + offset})
+        return itinerary
+
+    async def _call_model(self, prompt: str, timings: List[float]) -> List[dict]:
+        try:
+            with stage_timer("gemini_call"):
+                text, generator = await self._generate_text(prompt, timings)
+        except Exception as e:
+            raise ModelCallError(f"Failed to parse Gemini Vertex response: {e}")
+        try:
+            return self.parse_response(text, self.output_mode_of(generator))
         except Exception as e:
             raise RuntimeError(f"Failed to parse Gemini Vertex response: {e}")
 
+    def hedge_delay(self, generator: ItineraryGenerator) -> float:
+        """How long to wait on a call to generator before hedging it"""
+        histogram = self.latencies[generator.name]
+        if histogram.count < config.GENERATION_HEDGE_MIN_SAMPLES:
+            return config.GENERATION_HEDGE_DELAY_SECONDS
+        return histogram.quantile(config.GENERATION_HEDGE_PERCENTILE / 100)
+
+    async def _attempt(
+        self, generator: ItineraryGenerator, prompt: str, timings: List[float]
+    ) -> str:
+        async with self._semaphore:
+            start = time.perf_counter()
+            with span("gemini.call", **{"gen_ai.request.model": generator.name}):
+                text = await generator.generate(prompt, self.response_schema)
+        elapsed = time.perf_counter() - start
+        self.latencies[generator.name].observe(elapsed)
+        timings.append(elapsed)
+        return text
+
+    async def _generate_text(
+        self, prompt: str, timings: List[float]
+    ) -> Tuple[str, ItineraryGenerator]:
+        """
+        Call the generators in chain order until one answers. A failed call moves
+        on to the next generator; with hedging, so does a call slower than its
+        model's usual latency, and the first answer wins. Losers are cancelled.
+        Returns the answer and the generator that gave it.
+        """
+        chain = list(self.generators)
+        if self.hedge and len(chain) == 1:
+            # nothing to fall back to, hedge with a second call to the same model
+            chain.append(chain[0])
+        pending: Dict[asyncio.Task, ItineraryGenerator] = {}
+        last_error: Optional[BaseException] = None
+
+        def launch() -> asyncio.Task:
+            generator = chain.pop(0)
+            task = asyncio.create_task(self._attempt(generator, prompt, timings))
+            pending[task] = generator
+            return task
+
+        first = launch()
+        latest = pending[first]
+        try:
+            while pending:
+                timeout = self.hedge_delay(latest) if self.hedge and chain else None
+                done, _ = await asyncio.wait(
+                    pending, timeout=timeout, return_when=asyncio.FIRST_COMPLETED
+                )
+                if not done:
+                    self.call_stats["hedges"] += 1
+                    logger.info(f"Hedging slow {latest.name} call")
+                    latest = pending[launch()]
+                    continue
+                for task in done:
+                    generator = pending.pop(task)
+                    if task.exception() is None:
+                        if first in pending:
+                            self.call_stats["hedge_wins"] += 1
+                        return task.result(), generator
+                    last_error = task.exception()
+                    logger.warning(f"{generator.name} call failed: {last_error}")
+                if not pending and chain:
+                    self.call_stats["fallbacks"] += 1
+                    latest = pending[launch()]
+            raise last_error
+        finally:
+            for task in pending:
+                task.cancel()
+
+    async def check_available(
+        self, destination: str, start_date: str, end_date: str, interests: List[str]
+    ) -> None:
+        """
+        Raise CircuitOpenError when the breaker would fail a stream_itinerary call
+        with nothing cached to serve instead, so the caller can answer before
+        streaming. Takes no probe slot, the stream takes its own.
+        """
+        if self.breaker.allows_call():
+            return
+        if self.cache is not None:
+            key = make_cache_key(destination, start_date, end_date, interests)
+            if await self.cache.get(key) is not None:
+                return
+            if await self.cache.get(make_destination_key(destination)) is not None:
+                return
+        raise self.breaker.reject()
+
+    async def stream_itinerary(
+        self, destination: str, start_date: str, end_date: str, interests: List[str]
+    ) -> AsyncIterator[dict]:
+        """
+        Yield each day of the itinerary as soon as the model has finished writing it.
+        Cached itineraries are replayed, complete streams are added to the cache.
+        Follows the circuit breaker like generate_itinerary_async.
+        """
+        key = make_cache_key(destination, start_date, end_date, interests)
+        days_count = calculate_days(start_date, end_date)
+        if self.cache is not None:
+            cached = await self.cache.get(key)
+            if cached is not None:
+                for day in cached:
+                    yield day
+                return
+
+        try:
+            probe = self.breaker.before_call()
+        except CircuitOpenError:
+            fallback = await self._destination_fallback(destination, days_count)
+            if fallback is None:
+                raise
+            for day in fallback:
+                yield day
+            return
+
+        prompt = self.build_prompt(destination, start_date, end_date, interests)
+        chunks: asyncio.Queue = asyncio.Queue()
+        reader = asyncio.create_task(self._read_stream(prompt, probe, chunks))
+        parser = IncrementalDayParser()
+        days = []
+        try:
+            while True:
+                chunk = await chunks.get()
+                if chunk is None:
+                    break
+                if isinstance(chunk, Exception):
+                    raise RuntimeError(
+                        f"Failed to stream Gemini Vertex response: {chunk}"
+                    )
+                for day in parser.feed(chunk):
+                    day = validate_day(day)
+                    if day is not None:
+                        days.append(day)
+                        yield day
+        finally:
+            if not reader.done():
+                # abandoned before the model finished, no outcome to record
+                reader.cancel()
+                self.breaker.release(probe)
+
+        if not parser.complete:
+            self._count_parse_failure(self.output_mode)
+            raise RuntimeError("Gemini Vertex stream ended before the itinerary did")
+        if len(days) >= days_count:
+            await self._store(key, destination, days)
+
+    async def _read_stream(
+        self, prompt: str, probe: bool, chunks: asyncio.Queue
+    ) -> None:
+        """
+        Read the model's stream into chunks, then None, or the error it failed with.
+        Runs as its own task so the concurrency slot is held for the upstream call
+        only: a slow client reads the rest of the answer from the queue.
+        """
+        start = None
+        try:
+            async with self._semaphore:
+                start = time.perf_counter()
+                with (
+                    stage_timer("gemini_call"),
+                    span(
+                        "gemini.stream", **{"gen_ai.request.model": self.generator.name}
+                    ),
+                ):
+                    async for chunk in self.generator.stream(
+                        prompt, self.response_schema
+                    ):
+                        chunks.put_nowait(chunk)
+        except Exception as e:
+            elapsed = 0.0 if start is None else time.perf_counter() - start
+            self.breaker.after_call(False, elapsed, probe)
+            chunks.put_nowait(e)
+            return
+        self.breaker.after_call(True, time.perf_counter() - start, probe)
+        chunks.put_nowait(None)
+
+    def collect_metrics(self):
+        for name, histogram in self.latencies.items():
+            yield (
+                "gemini_model_duration_seconds",
+                "histogram",
+                "Latency of successful calls per model",
+                {"model": name},
+                histogram,
+            )
+        for mode, count in self.parse_failures.items():
+            yield (
+                "gemini_parse_failures_total",
+                "counter",
+                "Unparseable model responses per output mode",
+                {"mode": mode},
+                count,
+            )
+        for event, count in self.call_stats.items():
+            yield (
+                "gemini_call_events_total",
+                "counter",
+                "Hedged calls, hedges answering first and fallbacks to the next model",
+                {"event": event},
+                count,
+            )
+        flight = self.flight.stats()
+        for role in ("leaders", "coalesced"):
+            yield (
+                "generation_single_flight_total",
+                "counter",
+                "Generation requests making the upstream call (leaders) "
+                "or sharing one already in flight (coalesced)",
+                {"role": role},
+                flight[role],
+            )
+        yield (
+            "generation_single_flight_in_flight",
+            "gauge",
+            "Distinct generations in flight",
+            {},
+            flight["in_flight"],
+        )
+        if self.cache is not None:
+            for result, count in self.cache.stats().items():
+                yield (
+                    "generation_cache_total",
+                    "counter",
+                    "Generation cache lookups and errors",
+                    {"result": result},
+                    count,
+                )
+
+
+_gemini_service_lock = threading.Lock()
+
 
 @lru_cache()
+def _build_gemini_service() -> GeminiService:
+    service = GeminiService(cache=get_itinerary_cache(), breaker=get_circuit_breaker())
+    registry.add_collector(service.collect_metrics)
+    return service
+
+
 def get_gemini_service() -> GeminiService:
-    return GeminiService()
+    # lru_cache alone lets a call arriving during the warmup thread's build make a
+    # second service, registering its metrics twice; this one waits for the first
+    with _gemini_service_lock:
+        return _build_gemini_service()
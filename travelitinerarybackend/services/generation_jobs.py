@@ -0,0 +1,343 @@
+import asyncio
+import hashlib
+import hmac
+import ipaddress
+import json
+import logging
+import socket
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Awaitable, Callable, List, Optional
+
+import httpx
+import sqlalchemy
+
+from travelitinerarybackend.config import config
+from travelitinerarybackend.database import (
+    database,
+    generation_job_table,
+    supports_returning,
+)
+from travelitinerarybackend.models.itinerary import UserItineraryIn, calculate_days
+from travelitinerarybackend.services.circuit_breaker import CircuitOpenError
+from travelitinerarybackend.services.gemini_service import (
+    GeminiService,
+    get_gemini_service,
+)
+
+logger = logging.getLogger(__name__)
+
+PENDING = "pending"
+RUNNING = "running"
+SUCCEEDED = "succeeded"
+FAILED = "failed"
+
+
+class CallbackURLError(ValueError):
+    """The callback URL points somewhere the server may not call"""
+
+
+def utcnow() -> datetime:
+    # every job timestamp comes from this clock, naive UTC like the columns
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+
+def job_to_dict(job) -> dict:
+    """Public view of a job row, as served by GET /api/itinerary/jobs/{id}"""
+    result = job.result or {}
+    return {
+        "id": job.id,
+        "status": job.status,
+        "attempts": job.attempts,
+        "days_count": result.get("days_count"),
+        "itinerary": result.get("itinerary"),
+        "error": job.error,
+        "created_at": job.created_at,
+        "updated_at": job.updated_at,
+    }
+
+
+def jsonable_job(job) -> dict:
+    payload = job_to_dict(job)
+    payload["created_at"] = payload["created_at"].isoformat()
+    payload["updated_at"] = payload["updated_at"].isoformat()
+    return payload
+
+
+async def enqueue_job(
+    user_id: int, request: UserItineraryIn, callback_url: Optional[str] = None
+):
+    now = utcnow()
+    values = {
+        "user_id": user_id,
+        "status": PENDING,
+        "request": request.model_dump(include=set(UserItineraryIn.model_fields)),
+        "attempts": 0,
+        "callback_url": callback_url,
+        "run_after": now,
+        "created_at": now,
+        "updated_at": now,
+    }
+    query = generation_job_table.insert().values(**values)
+    if supports_returning():
+        return await database.fetch_one(query.returning(*generation_job_table.c))
+    job_id = await database.execute(query)
+    return await get_job(job_id, user_id)
+
+
+async def get_job(job_id: int, user_id: int):
+    query = generation_job_table.select().where(
+        generation_job_table.c.id == job_id, generation_job_table.c.user_id == user_id
+    )
+    return await database.fetch_one(query)
+
+
+def check_callback_url(url: str) -> None:
+    """Raise CallbackURLError unless url is https, on JOB_CALLBACK_ALLOWED_HOSTS if set"""
+    parsed = httpx.URL(url)
+    if parsed.scheme != "https":
+        raise CallbackURLError("Callback URL must use https")
+    host = parsed.host.lower()
+    allowed = [h.lower() for h in config.JOB_CALLBACK_ALLOWED_HOSTS]
+    if allowed and not any(host == h or host.endswith(f".{h}") for h in allowed):
+        raise CallbackURLError(f"Callback host {host} is not allowed")
+
+
+async def resolve_public_address(host: str, port: int) -> str:
+    """
+    An address of host to connect to, raising CallbackURLError when any address
+    it resolves to is private, loopback, link-local or otherwise not global
+    """
+    try:
+        infos = await asyncio.get_running_loop().getaddrinfo(
+            host, port, type=socket.SOCK_STREAM
+        )
+    except socket.gaierror as e:
+        raise CallbackURLError(f"Callback host {host} does not resolve: {e}") from e
+    addresses = [info[4][0] for info in infos]
+    for address in addresses:
+        if not ipaddress.ip_address(address).is_global:
+            raise CallbackURLError(f"Callback host {host} resolves to {address}")
+    return addresses[0]
+
+
+def sign_callback(body: bytes, timestamp: str, secret: str) -> str:
+    """X-Signature value: HMAC-SHA256 of "<timestamp>.<body>", hex encoded"""
+    message = timestamp.encode() + b"." + body
+    return "sha256=" + hmac.new(secret.encode(), message, hashlib.sha256).hexdigest()
+
+
+async def post_callback(url: str, payload: dict) -> None:
+    """
+    POST payload to a user supplied callback URL. The host is resolved once and
+    connected to by address, so it cannot resolve to a public address for the
+    check and an internal one for the request. Redirects are not followed.
+    With JOB_CALLBACK_SECRET set, X-Signature signs the timestamp and body.
+    """
+    check_callback_url(url)
+    parsed = httpx.URL(url)
+    address = await resolve_public_address(parsed.host, parsed.port or 443)
+    body = json.dumps(payload).encode()
+    headers = {"Content-Type": "application/json", "Host": parsed.netloc.decode()}
+    if config.JOB_CALLBACK_SECRET:
+        timestamp = str(int(time.time()))
+        headers["X-Signature-Timestamp"] = timestamp
+        headers["X-Signature"] = sign_callback(
+            body, timestamp, config.JOB_CALLBACK_SECRET
+        )
+    async with httpx.AsyncClient(timeout=config.JOB_CALLBACK_TIMEOUT_SECONDS) as client:
+        response = await client.post(
+            parsed.copy_with(host=address),
+            content=body,
+            headers=headers,
+            # certificate checked against the original host name
+            extensions={"sni_hostname": parsed.host},
+        )
+        response.raise_for_status()
+
+
+class GenerationJobWorker:
+    """
+    Runs queued generation jobs from the generation_jobs table.
+    Failed attempts are retried with exponential backoff up to JOB_MAX_ATTEMPTS,
+    jobs left running by a dead worker are requeued after JOB_STUCK_AFTER_SECONDS.
+    While the circuit breaker is open, jobs wait for it without using attempts.
+    """
+
+    def __init__(
+        self,
+        gemini_service: Optional[GeminiService] = None,
+        concurrency: int = config.JOB_WORKER_CONCURRENCY,
+        notify: Callable[[str, dict], Awaitable[None]] = post_callback,
+    ):
+        self.gemini_service = gemini_service
+        self.concurrency = concurrency
+        self.notify = notify
+        self._tasks: List[asyncio.Task] = []
+
+    def retry_delay(self, attempts: int) -> float:
+        delay = config.JOB_RETRY_BASE_SECONDS * 2 ** (attempts - 1)
+        return min(delay, config.JOB_RETRY_MAX_SECONDS)
+
+    async def claim(self):
+        """Atomically move the next due job to running, None when nothing is due"""
+        now = utcnow()
+        jobs = generation_job_table
+        next_due = (
+            sqlalchemy.select(jobs.c.id)
+            .where(jobs.c.status == PENDING, jobs.c.run_after <= now)
+            .order_by(jobs.c.run_after, jobs.c.id)
+            .limit(1)
+            .with_for_update(skip_locked=True)
+            .scalar_subquery()
+        )
+        claim_query = (
+            jobs.update()
+            .where(jobs.c.id == next_due, jobs.c.status == PENDING)
+            .values(
+                status=RUNNING,
+                attempts=jobs.c.attempts + 1,
+                locked_at=now,
+                updated_at=now,
+            )
+        )
+        if supports_returning():
+            return await database.fetch_one(claim_query.returning(*jobs.c))
+
+        await database.execute(claim_query)
+        # our claim is the running job locked at exactly our timestamp
+        query = jobs.select().where(jobs.c.status == RUNNING, jobs.c.locked_at == now)
+        return await database.fetch_one(query)
+
+    async def run_once(self) -> bool:
+        """Process one due job, returns False when the queue had nothing to do"""
+        job = await self.claim()
+        if job is None:
+            return False
+        await self.process(job)
+        return True
+
+    async def process(self, job) -> None:
+        request = UserItineraryIn(**job.request)
+        # off the event loop, the first call may wait for the generator to load
+        service = self.gemini_service or await asyncio.to_thread(get_gemini_service)
+        values = {"locked_at": None, "updated_at": utcnow()}
+        try:
+            itinerary = await service.generate_itinerary_async(
+                request.destination,
+                request.start_date,
+                request.end_date,
+                request.interests,
+            )
+            values.update(
+                status=SUCCEEDED,
+                error=None,
+                result={
+                    "days_count": calculate_days(request.start_date, request.end_date),
+                    "itinerary": itinerary,
+                },
+            )
+        except CircuitOpenError as e:
+            # Gemini is down for everyone, wait it out without using up an attempt
+            logger.warning(f"Generation job {job.id} postponed: {e}")
+            values.update(
+                status=PENDING,
+                error=str(e),
+                attempts=job.attempts - 1,
+                run_after=utcnow()
+                + timedelta(
+                    seconds=max(e.retry_after, config.JOB_POLL_INTERVAL_SECONDS)
+                ),
+            )
+        except Exception as e:
+            logger.warning(
+                f"Generation job {job.id} attempt {job.attempts} failed: {e}"
+            )
+            values["error"] = str(e)
+            if job.attempts >= config.JOB_MAX_ATTEMPTS:
+                values["status"] = FAILED
+            else:
+                values["status"] = PENDING
+                values["run_after"] = utcnow() + timedelta(
+                    seconds=self.retry_delay(job.attempts)
+                )
+
+        # a job requeued as stuck meanwhile belongs to another worker now
+        query = (
+            generation_job_table.update()
+            .where(
+                generation_job_table.c.id == job.id,
+                generation_job_table.c.locked_at == job.locked_at,
+            )
+            .values(**values)
+        )
+        await database.execute(query)
+
+        if job.callback_url and values["status"] in (SUCCEEDED, FAILED):
+            finished = await get_job(job.id, job.user_id)
+            try:
+                await self.notify(job.callback_url, jsonable_job(finished))
+            except Exception as e:
+                logger.warning(f"Callback for generation job {job.id} failed: {e}")
+
+    async def recover_stuck_jobs(self) -> int:
+        """Requeue (or fail, when out of attempts) jobs whose worker went away"""
+        now = utcnow()
+        jobs = generation_job_table
+        stuck = sqlalchemy.and_(
+            jobs.c.status == RUNNING,
+            jobs.c.locked_at < now - timedelta(seconds=config.JOB_STUCK_AFTER_SECONDS),
+        )
+        rows = await database.fetch_all(
+            sqlalchemy.select(jobs.c.id, jobs.c.attempts).where(stuck)
+        )
+        failed_ids = [r.id for r in rows if r.attempts >= config.JOB_MAX_ATTEMPTS]
+        retry_ids = [r.id for r in rows if r.attempts < config.JOB_MAX_ATTEMPTS]
+        if failed_ids:
+            await database.execute(
+                jobs.update()
+                .where(stuck, jobs.c.id.in_(failed_ids))
+                .values(
+                    status=FAILED, error="Job timed out", locked_at=None, updated_at=now
+                )
+            )
+        if retry_ids:
+            await database.execute(
+                jobs.update()
+                .where(stuck, jobs.c.id.in_(retry_ids))
+                .values(status=PENDING, run_after=now, locked_at=None, updated_at=now)
+            )
+        if rows:
+            logger.warning(f"Recovered {len(rows)} stuck generation jobs")
+        return len(rows)
+
+    async def _run_loop(self) -> None:
+        while True:
+            try:
+                if not await self.run_once():
+                    await asyncio.sleep(config.JOB_POLL_INTERVAL_SECONDS)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Generation job worker error: {e}")
+                await asyncio.sleep(config.JOB_POLL_INTERVAL_SECONDS)
+
+    async def _recovery_loop(self) -> None:
+        while True:
+            await asyncio.sleep(config.JOB_STUCK_AFTER_SECONDS / 2)
+            try:
+                await self.recover_stuck_jobs()
+            except Exception as e:
+                logger.error(f"Generation job recovery error: {e}")
+
+    def start(self) -> None:
+        self._tasks = [
+            asyncio.create_task(self._run_loop()) for _ in range(self.concurrency)
+        ]
+        self._tasks.append(asyncio.create_task(self._recovery_loop()))
+
+    async def stop(self) -> None:
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
@@ -0,0 +1,250 @@
+import asyncio
+import json
+import logging
+import re
+from typing import AsyncIterator, Dict, Optional, Protocol
+
+from travelitinerarybackend.config import config
+from travelitinerarybackend.metrics import registry
+from travelitinerarybackend.models.itinerary import calculate_days
+
+logger = logging.getLogger(__name__)
+
+
+def count_tokens(model: str, prompt_tokens: int, output_tokens: int) -> None:
+    for kind, tokens in (("prompt", prompt_tokens), ("output", output_tokens)):
+        registry.counter(
+            "gemini_tokens_total", "Tokens used by generation", model=model, kind=kind
+        ).inc(tokens)
+
+
+class ItineraryGenerator(Protocol):
+    """
+    The language model behind GeminiService: a prompt goes in, text comes out.
+    response_schema, when given, asks for JSON matching that schema.
+    name identifies the model in latency metrics.
+    A generator that can drop a schema the model rejects also has
+    uses_response_schema(response_schema), telling whether it still sends it.
+    """
+
+    name: str
+
+    async def generate(
+        self, prompt: str, response_schema: Optional[dict] = None
+    ) -> str: ...
+
+    def stream(
+        self, prompt: str, response_schema: Optional[dict] = None
+    ) -> AsyncIterator[str]: ...
+
+
+class VertexGenerator:
+    """Gemini on Vertex AI"""
+
+    def __init__(self, model_name: Optional[str] = None):
+        # the SDK takes seconds to import, only pay for it once generation is used
+        import vertexai
+        from google.api_core.exceptions import InvalidArgument
+        from vertexai.preview.generative_models import (
+            GenerationConfig,
+            GenerativeModel,
+            Part,
+        )
+
+        vertexai.init(project=config.GCP_PROJECT_ID, location=config.GCP_REGION)
+        self.name = model_name or config.GEMINI_MODEL_NAME
+        self.model = GenerativeModel(self.name)
+        self._generation_config_type = GenerationConfig
+        self._part_type = Part
+        self._invalid_argument_type = InvalidArgument
+        # per response schema, built once, None once the SDK or model rejected it
+        self._generation_configs: Dict[str, object] = {}
+
+    @staticmethod
+    def _schema_key(response_schema: dict) -> str:
+        return json.dumps(response_schema, sort_keys=True)
+
+    def uses_response_schema(self, response_schema: Optional[dict]) -> bool:
+        return self._generation_config(response_schema) is not None
+
+    def _generation_config(self, response_schema: Optional[dict]):
+        if response_schema is None:
+            return None
+        key = self._schema_key(response_schema)
+        if key not in self._generation_configs:
+            try:
+                self._generation_configs[key] = self._generation_config_type(
+                    response_mime_type="application/json",
+                    response_schema=response_schema,
+                )
+            except Exception as e:
+                logger.warning(
+                    f"Structured output unavailable for {self.name}, "
+                    f"using prompt output: {e}"
+                )
+                self._generation_configs[key] = None
+        return self._generation_configs[key]
+
+    @staticmethod
+    def _text(response) -> str:
+        return response.candidates[0].content.parts[0].text
+
+    def _count_usage(self, response) -> None:
+        usage = getattr(response, "usage_metadata", None)
+        if usage is not None:
+            count_tokens(
+                self.name, usage.prompt_token_count, usage.candidates_token_count
+            )
+
+    async def _with_schema_fallback(self, response_schema: Optional[dict], call):
+        """
+        Await call(generation_config) with the config of response_schema. When the
+        model rejects the request and takes it without the schema, prompt output is
+        used from then on, like for a schema the SDK rejects.
+        """
+        generation_config = self._generation_config(response_schema)
+        try:
+            return await call(generation_config)
+        except self._invalid_argument_type as e:
+            if generation_config is None:
+                raise
+            error = e
+        # raises again when the schema was not what the model rejected
+        result = await call(None)
+        logger.warning(
+            f"Structured output rejected by {self.name}, using prompt output: {error}"
+        )
+        self._generation_configs[self._schema_key(response_schema)] = None
+        return result
+
+    async def generate(
+        self, prompt: str, response_schema: Optional[dict] = None
+    ) -> str:
+        async def call(generation_config):
+            return await self.model.generate_content_async(
+                [self._part_type.from_text(prompt)],
+                generation_config=generation_config,
+            )
+
+        response = await self._with_schema_fallback(response_schema, call)
+        self._count_usage(response)
+        return self._text(response)
+
+    async def stream(
+        self, prompt: str, response_schema: Optional[dict] = None
+    ) -> AsyncIterator[str]:
+        async def call(generation_config):
+            responses = await self.model.generate_content_async(
+                [self._part_type.from_text(prompt)],
+                generation_config=generation_config,
+                stream=True,
+            )
+            # a rejected request only fails once the stream is read
+            return await anext(responses, None), responses
+
+        usage, responses = await self._with_schema_fallback(response_schema, call)
+        if usage is None:
+            return
+        yield self._text(usage)
+        async for response in responses:
+            # the usage is a running total, the last chunk has the final one
+            usage = response
+            yield self._text(response)
+        self._count_usage(usage)
+
+
+class LocalGenerator:
+    """
+    Offline stand-in for Vertex, for load tests, benchmarks and CI.
+    Answers every prompt with a deterministic itinerary for the requested days,
+    after latency_seconds plus the time to write the answer at tokens_per_second.
+    """
+
+    # rough size of a model token, for the token-rate simulation
+    CHARS_PER_TOKEN = 4
+    # tokens sent per streamed chunk
+    TOKENS_PER_CHUNK = 8
+
+    def __init__(
+        self,
+        latency_seconds: Optional[float] = None,
+        tokens_per_second: Optional[float] = None,
+        name: str = "local",
+    ):
+        self.name = name
+        self.latency_seconds = (
+            config.LOCAL_GENERATOR_LATENCY_SECONDS
+            if latency_seconds is None
+            else latency_seconds
+        )
+        self.tokens_per_second = (
+            config.LOCAL_GENERATOR_TOKENS_PER_SECOND
+            if tokens_per_second is None
+            else tokens_per_second
+        )
+
+    def answer(self, prompt: str) -> str:
+        destination = re.search(r'"destination": "(.*?)"', prompt)
+        destination = destination.group(1) if destination else "the city"
+        segment = re.search(r"Plan days (\d+) to (\d+)", prompt)
+        if segment:
+            first_day, last_day = map(int, segment.groups())
+        else:
+            dates = re.findall(r'"(?:start|end)_date": "(\d{4}-\d{2}-\d{2})"', prompt)
+            first_day, last_day = 1, calculate_days(*dates) if len(dates) == 2 else 1
+        return json.dumps(
+            {
+                "itinerary": [
+                    {
+                        "day": day,
+                        "activities": [
+                            f"Morning walk through {destination}, day {day}",
+                            "Lunch at a local restaurant",
+                            f"Evening highlights of {destination}",
+                        ],
+                    }
+                    for day in range(first_day, last_day + 1)
+                ]
+            }
+        )
+
+    def _write_seconds(self, text: str) -> float:
+        if not self.tokens_per_second:
+            return 0.0
+        return len(text) / self.CHARS_PER_TOKEN / self.tokens_per_second
+
+    def _count_usage(self, prompt: str, text: str) -> None:
+        count_tokens(
+            self.name,
+            len(prompt) // self.CHARS_PER_TOKEN,
+            len(text) // self.CHARS_PER_TOKEN,
+        )
+
+    async def generate(
+        self, prompt: str, response_schema: Optional[dict] = None
+    ) -> str:
+        text = self.answer(prompt)
+        await asyncio.sleep(self.latency_seconds + self._write_seconds(text))
+        self._count_usage(prompt, text)
+        return text
+
+    async def stream(
+        self, prompt: str, response_schema: Optional[dict] = None
+    ) -> AsyncIterator[str]:
+        text = self.answer(prompt)
+        await asyncio.sleep(self.latency_seconds)
+        size = self.CHARS_PER_TOKEN * self.TOKENS_PER_CHUNK
+        for i in range(0, len(text), size):
+            chunk = text[i : i + size]
+            await asyncio.sleep(self._write_seconds(chunk))
+            yield chunk
+        self._count_usage(prompt, text)
+
+
+def get_itinerary_generator(model_name: Optional[str] = None) -> ItineraryGenerator:
+    """The generator selected by ITINERARY_GENERATOR, for model_name or the default"""
+    if config.ITINERARY_GENERATOR == "local":
+        return LocalGenerator(name=model_name or "local")
+    if config.ITINERARY_GENERATOR == "vertex":
+        return VertexGenerator(model_name)
+    raise ValueError(f"Unknown ITINERARY_GENERATOR: {config.ITINERARY_GENERATOR}")
@@ -0,0 +1,128 @@
+import hashlib
+import json
+import logging
+from typing import List, Optional, Protocol
+
+from travelitinerarybackend.cache import LRUTTLCache
+from travelitinerarybackend.config import config
+from travelitinerarybackend.models.itinerary import calculate_days
+
+logger = logging.getLogger(__name__)
+
+
+def make_cache_key(
+    destination: str, start_date: str, end_date: str, interests: List[str]
+) -> str:
+    """
+    Build a content-addressed key from the normalized request.
+    Trips to the same place with the same interests and length share a key,
+    whatever the actual dates are.
+    """
+    normalized = {
+        "destination": " ".join(destination.lower().split()),
+        "interests": sorted({i.strip().lower() for i in interests if i.strip()}),
+        "days_count": calculate_days(start_date, end_date),
+    }
+    digest = hashlib.sha256(
+        json.dumps(normalized, sort_keys=True).encode("utf8")
+    ).hexdigest()
+    return f"itinerary:v1:{digest}"
+
+
+def make_destination_key(destination: str) -> str:
+    """Key of the latest itinerary generated for a destination, whatever the trip"""
+    normalized = " ".join(destination.lower().split())
+    digest = hashlib.sha256(normalized.encode("utf8")).hexdigest()
+    return f"itinerary:v1:destination:{digest}"
+
+
+class CacheBackend(Protocol):
+    async def get(self, key: str) -> Optional[str]: ...
+
+    async def set(self, key: str, value: str, ttl_seconds: int) -> None: ...
+
+
+class InMemoryCacheBackend:
+    """Per-worker backend, evicts the least recently used entry when full"""
+
+    def __init__(self, max_entries: int):
+        self._cache = LRUTTLCache(max_entries=max_entries, ttl_seconds=0)
+
+    async def get(self, key: str) -> Optional[str]:
+        return self._cache.get(key)
+
+    async def set(self, key: str, value: str, ttl_seconds: int) -> None:
+        self._cache.set(key, value, ttl_seconds=ttl_seconds)
+
+
+class RedisCacheBackend:
+    """
+    Backend for any client exposing the redis.asyncio `get`/`set(..., ex=)` calls.
+    Eviction is left to the server (maxmemory-policy allkeys-lru).
+    """
+
+    def __init__(self, client):
+        self.client = client
+
+    async def get(self, key: str) -> Optional[str]:
+        value = await self.client.get(key)
+        if isinstance(value, bytes):
+            value = value.decode("utf8")
+        return value
+
+    async def set(self, key: str, value: str, ttl_seconds: int) -> None:
+        await self.client.set(key, value, ex=ttl_seconds)
+
+
+class ItineraryCache:
+    def __init__(self, backend: CacheBackend, ttl_seconds: int):
+        self.backend = backend
+        self.ttl_seconds = ttl_seconds
+        self.hits = 0
+        self.misses = 0
+        self.errors = 0
+
+    async def get(self, key: str) -> Optional[List[dict]]:
+        try:
+            value = await self.backend.get(key)
+        except Exception as e:
+            # a broken cache must never fail a generation
+            self.errors += 1
+            logger.warning(f"Itinerary cache read failed: {e}")
+            value = None
+        if value is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return json.loads(value)
+
+    async def set(self, key: str, itinerary: List[dict]) -> None:
+        try:
+            await self.backend.set(key, json.dumps(itinerary), self.ttl_seconds)
+        except Exception as e:
+            self.errors += 1
+            logger.warning(f"Itinerary cache write failed: {e}")
+
+    def stats(self) -> dict:
+        return {"hits": self.hits, "misses": self.misses, "errors": self.errors}
+
+
+def get_itinerary_cache() -> Optional[ItineraryCache]:
+    if config.GENERATION_CACHE_BACKEND == "none":
+        return None
+    if config.GENERATION_CACHE_BACKEND == "memory":
+        backend = InMemoryCacheBackend(config.GENERATION_CACHE_MAX_ENTRIES)
+    elif config.GENERATION_CACHE_BACKEND == "redis":
+        try:
+            import redis.asyncio as redis
+        except ImportError as e:
+            raise RuntimeError(
+                "GENERATION_CACHE_BACKEND=redis requires the redis package"
+            ) from e
+        backend = RedisCacheBackend(redis.from_url(config.REDIS_URL))
+    else:
+        raise ValueError(
+            f"Invalid GENERATION_CACHE_BACKEND: {config.GENERATION_CACHE_BACKEND}. "
+            "Must be one of ['memory', 'redis', 'none']"
+        )
+    return ItineraryCache(backend, ttl_seconds=config.GENERATION_CACHE_TTL_SECONDS)
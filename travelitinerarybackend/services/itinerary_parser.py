@@ -0,0 +1,186 @@
+import json
+import logging
+from typing import List, Optional
+
+from pydantic import ValidationError
+
+from travelitinerarybackend.models.itinerary import ItineraryDay
+
+logger = logging.getLogger(__name__)
+
+
+class ItineraryParseError(ValueError):
+    """The model output holds no usable itinerary"""
+
+
+def strip_trailing_commas(text: str) -> str:
+    """Drop commas directly before a closing bracket, outside of strings"""
+    result = []
+    in_string = escaped = False
+    pending_comma: Optional[int] = None
+    for char in text:
+        if in_string:
+            if escaped:
+                escaped = False
+            elif char == "\\":
+                escaped = True
+            elif char == '"':
+                in_string = False
+        elif char == '"':
+            in_string = True
+        elif char == ",":
+            pending_comma = len(result)
+        elif char in "}]" and pending_comma is not None:
+            del result[pending_comma]
+        if not char.isspace() and char != ",":
+            pending_comma = None
+        result.append(char)
+    return "".join(result)
+
+
+def extract_json(text: str) -> str:
+    """
+    Cut the first JSON object or array out of the model output, skipping
+    preamble, code fences and trailing prose. A truncated value runs to the end.
+    """
+    starts = [i for i in (text.find("{"), text.find("[")) if i != -1]
+    if not starts:
+        raise ItineraryParseError("No JSON found in model output")
+    start = min(starts)
+
+    depth = 0
+    in_string = escaped = False
+    for pos in range(start, len(text)):
+        char = text[pos]
+        if in_string:
+            if escaped:
+                escaped = False
+            elif char == "\\":
+                escaped = True
+            elif char == '"':
+                in_string = False
+        elif char == '"':
+            in_string = True
+        elif char in "{[":
+            depth += 1
+        elif char in "}]":
+            depth -= 1
+            if depth == 0:
+                return text[start : pos + 1]
+    return text[start:]
+
+
+def validate_day(day) -> Optional[dict]:
+    """The day normalized by ItineraryDay, None when it does not match"""
+    try:
+        return ItineraryDay.model_validate(day).model_dump()
+    except ValidationError as e:
+        logger.warning(f"Dropping invalid itinerary day: {e}")
+        return None
+
+
+def validate_days(days: list) -> List[dict]:
+    """Keep the days matching ItineraryDay, fail only when none does"""
+    valid = [day for day in map(validate_day, days) if day is not None]
+    if days and not valid:
+        raise ItineraryParseError("No valid itinerary day in model output")
+    return valid
+
+
+def parse_itinerary(text: str) -> List[dict]:
+    """
+    Parse a complete model answer into validated days.
+    When the JSON is cut off or a day is malformed, the days that parse are kept.
+    """
+    candidate = strip_trailing_commas(extract_json(text))
+    try:
+        parsed = json.loads(candidate)
+    except json.JSONDecodeError as e:
+        parser = IncrementalDayParser()
+        days = parser.feed(text)
+        if not days:
+            raise ItineraryParseError(f"Invalid JSON in model output: {e}") from e
+        logger.warning(f"Recovered {len(days)} days from invalid model output")
+        return validate_days(days)
+
+    if isinstance(parsed, list):
+        return validate_days(parsed)
+    if isinstance(parsed, dict):
+        return validate_days(parsed.get("itinerary", []))
+    raise ItineraryParseError("Model output is not an itinerary")
+
+
+class IncrementalDayParser:
+    """
+    Pulls day objects out of a streamed `{"itinerary": [...]}` payload.
+    Feed it text chunks as they arrive, it returns every day object that was
+    completed by the chunk, without waiting for the rest of the document.
+    """
+
+    def __init__(self):
+        self._buffer = ""
+        self._pos = 0
+        self._in_array = False
+        self._depth = 0
+        self._in_string = False
+        self._escaped = False
+        self._object_start = None
+        self.complete = False
+
+    def feed(self, chunk: str) -> List[dict]:
+        self._buffer += chunk
+        days = []
+        if not self._in_array and not self._find_array_start():
+            return days
+
+        while self._pos < len(self._buffer) and not self.complete:
+            char = self._buffer[self._pos]
+            if self._in_string:
+                if self._escaped:
+                    self._escaped = False
+                elif char == "\\":
+                    self._escaped = True
+                elif char == '"':
+                    self._in_string = False
+            elif char == '"':
+                self._in_string = True
+            elif char in "{[":
+                if self._depth == 0 and char == "{":
+                    self._object_start = self._pos
+                self._depth += 1
+            elif char in "}]":
+                if self._depth == 0 and char == "]":
+                    self.complete = True
+                else:
+                    self._depth -= 1
+                    if self._depth == 0 and self._object_start is not None:
+                        day = self._buffer[self._object_start : self._pos + 1]
+                        try:
+                            days.append(json.loads(strip_trailing_commas(day)))
+                        except ValueError as e:
+                            # one broken day should not cost the days after it
+                            logger.warning(f"Dropping malformed itinerary day: {e}")
+                        self._object_start = None
+            self._pos += 1
+
+        self._discard_consumed()
+        return days
+
+    def _find_array_start(self) -> bool:
+        key = self._buffer.find('"itinerary"')
+        if key == -1:
+            return False
+        bracket = self._buffer.find("[", key)
+        if bracket == -1:
+            return False
+        self._in_array = True
+        self._pos = bracket + 1
+        return True
+
+    def _discard_consumed(self):
+        # keep the buffer small, only the unfinished object has to be retained
+        keep_from = self._object_start if self._object_start is not None else self._pos
+        self._buffer = self._buffer[keep_from:]
+        self._pos -= keep_from
+        if self._object_start is not None:
+            self._object_start = 0
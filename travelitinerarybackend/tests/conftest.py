@@ -1,6 +1,8 @@
 # will contains the test fixtures
 
 
+import asyncio
+import json
 import os
 from typing import AsyncGenerator, Generator
 
@@ -17,6 +19,14 @@ from travelitinerarybackend.database import database, metadata, user_table
 
 # the overwrite has to be before importing app->importing config-> gets test
 from travelitinerarybackend.main import app
+from travelitinerarybackend.rate_limit import get_rate_limiter
+from travelitinerarybackend.security import user_cache
+from travelitinerarybackend.services.circuit_breaker import get_circuit_breaker
+from travelitinerarybackend.services.gemini_service import (
+    GeminiService,
+    get_gemini_service,
+)
+from travelitinerarybackend.tracing import InMemorySpanExporter, get_tracer
 
 # Ensure SQLite file-based DB is created with schema
 if config.DATABASE_URL.startswith("sqlite"):
@@ -44,6 +54,10 @@ def client() -> Generator:
 @pytest.fixture(autouse=True)
 async def db() -> AsyncGenerator:
     await database.connect()
+    # cached users would outlive the rolled back rows
+    user_cache.clear()
+    get_rate_limiter.cache_clear()
+    get_circuit_breaker.cache_clear()
     yield
     await (
         database.disconnect()
@@ -89,3 +103,70 @@ async def logged_in_token(async_client: AsyncClient, registered_user: dict) -> s
     )
 
     return response.json()["access_token"]
+
+
+class FakeGenerator:
+    """ItineraryGenerator answering a fixed text after a fixed delay"""
+
+    def __init__(
+        self,
+        delay: float = 0.0,
+        text: str = None,
+        chunk_size: int = 16,
+        name: str = "fake",
+    ):
+        self.name = name
+        self.delay = delay
+        self.chunk_size = chunk_size
+        self.text = text or json.dumps(
+            {"itinerary": [{"day": 1, "activities": ["Walk around"]}]}
+        )
+        self.calls = 0
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.response_schema = None
+
+    async def generate(self, prompt: str, response_schema: dict = None) -> str:
+        self.calls += 1
+        self.response_schema = response_schema
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        try:
+            await asyncio.sleep(self.delay)
+        finally:
+            self.in_flight -= 1
+        return self.text
+
+    async def stream(self, prompt: str, response_schema: dict = None):
+        self.calls += 1
+        self.response_schema = response_schema
+        # spread the delay over the chunks, like a model writing its answer
+        chunks = [
+            self.text[i : i + self.chunk_size]
+            for i in range(0, len(self.text), self.chunk_size)
+        ]
+        for chunk in chunks:
+            await asyncio.sleep(self.delay / len(chunks))
+            yield chunk
+
+
+@pytest.fixture()
+def fake_generator() -> FakeGenerator:
+    return FakeGenerator(delay=0.5)
+
+
+# swap the real Gemini service for one backed by the fake generator
+@pytest.fixture()
+def gemini_service(fake_generator: FakeGenerator) -> Generator:
+    service = GeminiService(generator=fake_generator, max_concurrency=4)
+    app.dependency_overrides[get_gemini_service] = lambda: service
+    yield service
+    app.dependency_overrides.pop(get_gemini_service, None)
+
+
+# spans recorded by the test config's in-memory exporter, from this test only
+@pytest.fixture()
+def span_exporter() -> InMemorySpanExporter:
+    exporter = get_tracer().exporter
+    exporter.clear()
+    return exporter
@@ -1,6 +1,21 @@
+import asyncio
+import json
+import time
+
 import pytest
 from httpx import AsyncClient
 
+from travelitinerarybackend.config import config
+from travelitinerarybackend.database import database, itinerary_table
+from travelitinerarybackend.main import app
+from travelitinerarybackend.models.itinerary import UserItinerary
+from travelitinerarybackend.rate_limit import (
+    InMemoryRateLimitStore,
+    RateLimiter,
+    get_rate_limiter,
+)
+from travelitinerarybackend.routers import itinerary as itinerary_router
+
 
 # Helper function to generate an itinerary (no save)
 async def generate_itinerary(
@@ -163,6 +178,137 @@ async def test_get_all_itineraries_empty(async_client: AsyncClient, logged_in_to
     assert response.json() == []
 
 
+# Test paging through itineraries
+@pytest.mark.anyio
+async def test_get_itineraries_paginated(async_client: AsyncClient, logged_in_token):
+    """Pages should cover every itinerary once, newest first"""
+    headers = {"Authorization": f"Bearer {logged_in_token}"}
+    saved_ids = []
+    for destination in ["Paris", "Rome", "Cairo", "Tokyo", "Lima"]:
+        generated = await generate_itinerary(
+            destination, "2025-08-01", "2025-08-03", ["food"]
+        )
+        saved = await save_generated_itinerary(generated, async_client, logged_in_token)
+        saved_ids.append(saved["id"])
+
+    seen_ids = []
+    params = {"limit": 2}
+    while True:
+        response = await async_client.get(
+            "/api/itinerary", params=params, headers=headers
+        )
+        assert response.status_code == 200
+        assert len(response.json()) <= 2
+        seen_ids.extend(itinerary["id"] for itinerary in response.json())
+        if "x-next-cursor" not in response.headers:
+            break
+        params["cursor"] = response.headers["x-next-cursor"]
+
+    assert seen_ids == sorted(saved_ids, reverse=True)
+
+
+# Test summary listing
+@pytest.mark.anyio
+async def test_get_itineraries_summary(
+    async_client: AsyncClient, created_itinerary: dict, logged_in_token
+):
+    """Summary mode leaves out the generated itinerary"""
+    response = await async_client.get(
+        "/api/itinerary",
+        params={"summary": True},
+        headers={"Authorization": f"Bearer {logged_in_token}"},
+    )
+    assert response.status_code == 200
+    itineraries = response.json()
+    assert itineraries[0]["id"] == created_itinerary["id"]
+    assert itineraries[0]["generated_itinerary"] is None
+
+
+@pytest.mark.anyio
+async def test_get_itineraries_by_interest(
+    async_client: AsyncClient, created_itinerary: dict, logged_in_token
+):
+    headers = {"Authorization": f"Bearer {logged_in_token}"}
+    response = await async_client.get(
+        "/api/itinerary", params={"interest": "food"}, headers=headers
+    )
+    assert [i["id"] for i in response.json()] == [created_itinerary["id"]]
+
+    response = await async_client.get(
+        "/api/itinerary", params={"interest": "skiing"}, headers=headers
+    )
+    assert response.json() == []
+
+
+@pytest.mark.anyio
+async def test_compressed_itinerary_round_trip(
+    async_client: AsyncClient, logged_in_token, monkeypatch
+):
+    monkeypatch.setattr(config, "ITINERARY_COMPRESSION", "zlib")
+    monkeypatch.setattr(config, "ITINERARY_COMPRESSION_MIN_BYTES", 100)
+    generated = await generate_itinerary("Rome", "2025-08-01", "2025-08-30", ["food"])
+    saved = await save_generated_itinerary(generated, async_client, logged_in_token)
+
+    row = await database.fetch_one(
+        itinerary_table.select().where(itinerary_table.c.id == saved["id"])
+    )
+    assert row["generated_itinerary"] is None
+    assert row["generated_itinerary_compressed"] == saved["generated_itinerary"]
+
+    response = await async_client.get(
+        f"/api/itinerary/{saved['id']}",
+        headers={"Authorization": f"Bearer {logged_in_token}"},
+    )
+    assert response.json() == saved
+    assert len(saved["generated_itinerary"]) == 30
+
+
+# Test listing with a bad cursor
+@pytest.mark.anyio
+async def test_get_itineraries_invalid_cursor(
+    async_client: AsyncClient, logged_in_token
+):
+    response = await async_client.get(
+        "/api/itinerary",
+        params={"cursor": "not-a-cursor"},
+        headers={"Authorization": f"Bearer {logged_in_token}"},
+    )
+    assert response.status_code == 400
+
+
+# Test get one itinerary
+@pytest.mark.anyio
+async def test_get_itinerary(
+    async_client: AsyncClient, created_itinerary: dict, logged_in_token
+):
+    response = await async_client.get(
+        f"/api/itinerary/{created_itinerary['id']}",
+        headers={"Authorization": f"Bearer {logged_in_token}"},
+    )
+    assert response.status_code == 200
+    assert response.json() == created_itinerary
+
+
+@pytest.mark.anyio
+async def test_saved_itinerary_matches_response_model(
+    async_client: AsyncClient, created_itinerary: dict
+):
+    # served without validation, the row must still look like UserItinerary
+    assert set(created_itinerary) == set(UserItinerary.model_fields)
+    assert (
+        UserItinerary.model_validate(created_itinerary).model_dump(mode="json")
+        == created_itinerary
+    )
+
+
+@pytest.mark.anyio
+async def test_get_nonexistent_itinerary(async_client: AsyncClient, logged_in_token):
+    response = await async_client.get(
+        "/api/itinerary/999", headers={"Authorization": f"Bearer {logged_in_token}"}
+    )
+    assert response.status_code == 404
+
+
 # Test delete itinerary
 @pytest.mark.anyio
 async def test_delete_itinerary(
@@ -309,3 +455,383 @@ async def test_update_itinerary_missing_fields(
         headers={"Authorization": f"Bearer {logged_in_token}"},
     )
     assert response.status_code == 422
+
+
+generate_payload = {
+    "destination": "Paris",
+    "start_date": "2025-08-01",
+    "end_date": "2025-08-03",
+    "interests": ["food", "art"],
+}
+
+
+# Test generate endpoint with the fake model
+@pytest.mark.anyio
+async def test_generate_itinerary(
+    async_client: AsyncClient, gemini_service, logged_in_token
+):
+    """Test generating an itinerary preview"""
+    response = await async_client.post(
+        "/api/itinerary/generate",
+        json=generate_payload,
+        headers={"Authorization": f"Bearer {logged_in_token}"},
+    )
+    assert response.status_code == 200
+    assert response.json()["days_count"] == 3
+    assert response.json()["itinerary"][0]["day"] == 1
+
+
+# Test that in-flight generations don't block other requests
+@pytest.mark.anyio
+async def test_generate_does_not_block_crud(
+    async_client: AsyncClient, gemini_service, fake_generator, logged_in_token
+):
+    """CRUD calls should stay fast while slow generations are running"""
+    headers = {"Authorization": f"Bearer {logged_in_token}"}
+    generations = [
+        asyncio.create_task(
+            async_client.post(
+                "/api/itinerary/generate", json=generate_payload, headers=headers
+            )
+        )
+        for _ in range(3)
+    ]
+    await asyncio.sleep(0.05)
+    assert fake_generator.in_flight > 0
+
+    start = time.perf_counter()
+    health = await async_client.get("/health")
+    listing = await async_client.get("/api/itinerary", headers=headers)
+    elapsed = time.perf_counter() - start
+
+    assert health.status_code == 200
+    assert listing.status_code == 200
+    assert elapsed < fake_generator.delay / 2
+    assert fake_generator.in_flight > 0
+
+    responses = await asyncio.gather(*generations)
+    assert all(r.status_code == 200 for r in responses)
+
+
+# Test streaming generation
+@pytest.mark.anyio
+async def test_stream_itinerary(
+    async_client: AsyncClient, gemini_service, fake_generator, logged_in_token
+):
+    """Test streaming an itinerary as NDJSON, one line per day"""
+    days = [{"day": day, "activities": ["Walk around"]} for day in (1, 2, 3)]
+    fake_generator.text = json.dumps({"itinerary": days})
+
+    response = await async_client.post(
+        "/api/itinerary/generate/stream",
+        json=generate_payload,
+        headers={"Authorization": f"Bearer {logged_in_token}"},
+    )
+    assert response.status_code == 200
+    assert response.headers["content-type"] == "application/x-ndjson"
+
+    messages = [json.loads(line) for line in response.text.splitlines()]
+    assert messages[0] == {"type": "meta", "days_count": 3}
+    assert [m["day"] for m in messages[1:-1]] == days
+    assert messages[-1] == {"type": "done"}
+
+
+@pytest.mark.anyio
+async def test_stream_itinerary_error(
+    async_client: AsyncClient, gemini_service, fake_generator, logged_in_token
+):
+    fake_generator.text = '{"itinerary": [{"day": 1, '
+    response = await async_client.post(
+        "/api/itinerary/generate/stream",
+        json=generate_payload,
+        headers={"Authorization": f"Bearer {logged_in_token}"},
+    )
+    messages = [json.loads(line) for line in response.text.splitlines()]
+    assert messages[-1]["type"] == "error"
+
+
+@pytest.fixture()
+async def other_user_token(async_client: AsyncClient) -> str:
+    user_details = {"email": "other.dummy@dummy.com", "password": "123456"}
+    await async_client.post("/register", json=user_details)
+    response = await async_client.post(
+        "/token",
+        data={
+            "username": user_details["email"],
+            "password": user_details["password"],
+            "grant_type": "password",
+        },
+    )
+    return response.json()["access_token"]
+
+
+# Test that itineraries can't be touched by other users
+@pytest.mark.anyio
+async def test_other_user_cannot_modify_itinerary(
+    async_client: AsyncClient, created_itinerary: dict, other_user_token
+):
+    """Another user's itinerary should look like it doesn't exist"""
+    itinerary_id = created_itinerary["id"]
+    headers = {"Authorization": f"Bearer {other_user_token}"}
+    update_data = {
+        "destination": "Rome",
+        "start_date": "2025-09-01",
+        "end_date": "2025-09-05",
+        "interests": ["history"],
+        "generated_itinerary": [],
+        "days_count": 5,
+    }
+
+    get_response = await async_client.get(
+        f"/api/itinerary/{itinerary_id}", headers=headers
+    )
+    update_response = await async_client.patch(
+        f"/api/itinerary/{itinerary_id}", json=update_data, headers=headers
+    )
+    delete_response = await async_client.delete(
+        f"/api/itinerary/{itinerary_id}", headers=headers
+    )
+    assert get_response.status_code == 404
+    assert update_response.status_code == 404
+    assert delete_response.status_code == 404
+
+
+# Test writes on databases without RETURNING support
+@pytest.mark.anyio
+async def test_write_without_returning(
+    async_client: AsyncClient, logged_in_token, other_user_token, monkeypatch
+):
+    monkeypatch.setattr(itinerary_router, "supports_returning", lambda: False)
+    headers = {"Authorization": f"Bearer {logged_in_token}"}
+    generated = await generate_itinerary("Cairo", "2025-08-01", "2025-08-03", ["food"])
+
+    saved = await save_generated_itinerary(generated, async_client, logged_in_token)
+    assert saved["destination"] == "Cairo"
+
+    update_response = await async_client.patch(
+        f"/api/itinerary/{saved['id']}",
+        json={**generated, "destination": "Giza"},
+        headers=headers,
+    )
+    assert update_response.status_code == 200
+    assert update_response.json()["destination"] == "Giza"
+
+    other_delete = await async_client.delete(
+        f"/api/itinerary/{saved['id']}",
+        headers={"Authorization": f"Bearer {other_user_token}"},
+    )
+    assert other_delete.status_code == 404
+
+    delete_response = await async_client.delete(
+        f"/api/itinerary/{saved['id']}", headers=headers
+    )
+    assert delete_response.status_code == 200
+
+
+# Test batch generation
+@pytest.mark.anyio
+async def test_generate_itinerary_batch(
+    async_client: AsyncClient, gemini_service, fake_generator, logged_in_token
+):
+    """Items run concurrently, duplicates once, results in request order"""
+    batch = [
+        {**generate_payload, "destination": destination}
+        for destination in ["Paris", "Rome", "paris ", "Cairo"]
+    ]
+    response = await async_client.post(
+        "/api/itinerary/generate/batch",
+        json=batch,
+        headers={"Authorization": f"Bearer {logged_in_token}"},
+    )
+    assert response.status_code == 200
+    body = response.json()
+
+    assert [r["index"] for r in body["results"]] == [0, 1, 2, 3]
+    assert all(r["itinerary"] and r["error"] is None for r in body["results"])
+    assert all(r["days_count"] == 3 for r in body["results"])
+    # "Paris" and "paris " are the same trip
+    assert fake_generator.calls == 3
+    # about one model round-trip, not three
+    assert body["latency_ms"] < fake_generator.delay * 1000 * 2
+    assert all(r["latency_ms"] >= fake_generator.delay * 1000 for r in body["results"])
+
+
+@pytest.mark.anyio
+async def test_generate_itinerary_batch_item_error(
+    async_client: AsyncClient, gemini_service, fake_generator, logged_in_token
+):
+    fake_generator.text = "not json"
+    response = await async_client.post(
+        "/api/itinerary/generate/batch",
+        json=[generate_payload],
+        headers={"Authorization": f"Bearer {logged_in_token}"},
+    )
+    assert response.status_code == 200
+    result = response.json()["results"][0]
+    assert result["itinerary"] is None
+    assert "Error generating itinerary" in result["error"]
+
+
+@pytest.mark.anyio
+async def test_generate_itinerary_batch_too_large(
+    async_client: AsyncClient, gemini_service, logged_in_token
+):
+    response = await async_client.post(
+        "/api/itinerary/generate/batch",
+        json=[generate_payload] * (config.GENERATION_BATCH_MAX_ITEMS + 1),
+        headers={"Authorization": f"Bearer {logged_in_token}"},
+    )
+    assert response.status_code == 400
+
+
+@pytest.mark.anyio
+async def test_generate_is_rate_limited(
+    async_client: AsyncClient, gemini_service, fake_generator, logged_in_token
+):
+    limiter = RateLimiter(
+        InMemoryRateLimitStore(), per_minute=1, burst=2, max_in_flight=10
+    )
+    app.dependency_overrides[get_rate_limiter] = lambda: limiter
+    fake_generator.delay = 0
+    headers = {"Authorization": f"Bearer {logged_in_token}"}
+    try:
+        for _ in range(2):
+            response = await async_client.post(
+                "/api/itinerary/generate", json=generate_payload, headers=headers
+            )
+            assert response.status_code == 200
+        for path in ("/api/itinerary/generate", "/api/itinerary/generate/stream"):
+            response = await async_client.post(
+                path, json=generate_payload, headers=headers
+            )
+            assert response.status_code == 429
+            assert int(response.headers["Retry-After"]) > 0
+        # every slot was given back
+        assert limiter.in_flight == 0
+    finally:
+        app.dependency_overrides.pop(get_rate_limiter, None)
+
+
+@pytest.mark.anyio
+async def test_generate_fails_fast_when_breaker_is_open(
+    async_client: AsyncClient, gemini_service, fake_generator, logged_in_token
+):
+    for _ in range(gemini_service.breaker.min_calls):
+        gemini_service.breaker.after_call(False, 0.1)
+
+    response = await async_client.post(
+        "/api/itinerary/generate",
+        json=generate_payload,
+        headers={"Authorization": f"Bearer {logged_in_token}"},
+    )
+    assert response.status_code == 503
+    assert int(response.headers["Retry-After"]) > 0
+    assert fake_generator.calls == 0
+
+
+@pytest.mark.anyio
+async def test_stream_fails_fast_when_breaker_is_open(
+    async_client: AsyncClient, gemini_service, fake_generator, logged_in_token
+):
+    for _ in range(gemini_service.breaker.min_calls):
+        gemini_service.breaker.after_call(False, 0.1)
+
+    response = await async_client.post(
+        "/api/itinerary/generate/stream",
+        json=generate_payload,
+        headers={"Authorization": f"Bearer {logged_in_token}"},
+    )
+    assert response.status_code == 503
+    assert int(response.headers["Retry-After"]) > 0
+    assert fake_generator.calls == 0
+    assert get_rate_limiter().in_flight == 0
+
+
+@pytest.mark.anyio
+async def test_health_reports_breaker_state(async_client: AsyncClient):
+    response = await async_client.get("/health")
+    assert response.json()["gemini_breaker"]["state"] == "closed"
+
+
+@pytest.mark.anyio
+async def test_metrics_exposes_request_and_stage_latency(
+    async_client: AsyncClient, gemini_service, fake_generator, logged_in_token
+):
+    fake_generator.delay = 0
+    response = await async_client.post(
+        "/api/itinerary/generate",
+        json=generate_payload,
+        headers={"Authorization": f"Bearer {logged_in_token}"},
+    )
+    assert response.status_code == 200
+
+    response = await async_client.get("/metrics")
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/plain; version=0.0.4")
+    body = response.text
+    assert (
+        'http_request_duration_seconds_count{method="POST",'
+        'route="/api/itinerary/generate",status="200"}'
+    ) in body
+    for stage in ("auth", "db_query", "gemini_call", "json_parse", "serialize"):
+        assert f'app_stage_duration_seconds_count{{stage="{stage}"}}' in body
+    assert 'gemini_breaker_state{state="closed"} 1.0' in body
+    assert "generation_in_flight 0.0" in body
+
+
+@pytest.mark.anyio
+async def test_metrics_labels_routes_by_template(
+    async_client: AsyncClient, logged_in_token
+):
+    await async_client.get(
+        "/api/itinerary/12345",
+        headers={"Authorization": f"Bearer {logged_in_token}"},
+    )
+    body = (await async_client.get("/metrics")).text
+    assert 'route="/api/itinerary/{id}"' in body
+    assert "/api/itinerary/12345" not in body
+
+
+@pytest.mark.anyio
+async def test_generate_request_span_tree(
+    async_client: AsyncClient,
+    gemini_service,
+    fake_generator,
+    logged_in_token,
+    span_exporter,
+):
+    fake_generator.delay = 0
+    span_exporter.clear()
+    response = await async_client.post(
+        "/api/itinerary/generate",
+        json=generate_payload,
+        headers={"Authorization": f"Bearer {logged_in_token}"},
+    )
+    assert response.status_code == 200
+
+    spans = span_exporter.get_finished_spans()
+    by_name = {span.name: span for span in spans}
+    root = by_name["POST /api/itinerary/generate"]
+    assert root.parent_id is None
+    assert root.attributes["correlation_id"] == response.headers["X-Request-ID"]
+    assert root.attributes["http.response.status_code"] == 200
+    generation = by_name["gemini.generate_itinerary"]
+    assert generation.parent_id == root.span_id
+    assert by_name["gemini.call"].parent_id == generation.span_id
+    assert by_name["gemini.call"].attributes["gen_ai.request.model"] == "fake"
+    assert all(span.trace_id == root.trace_id for span in spans)
+
+
+@pytest.mark.anyio
+async def test_register_traces_hashing_and_queries(
+    async_client: AsyncClient, span_exporter
+):
+    response = await async_client.post(
+        "/register", json={"email": "trace@example.com", "password": "secret"}
+    )
+    assert response.status_code == 201
+
+    spans = span_exporter.get_finished_spans()
+    root = next(span for span in spans if span.name == "POST /register")
+    children = {span.name for span in spans if span.parent_id == root.span_id}
+    assert {"password.hash", "db.execute"} <= children
@@ -0,0 +1,75 @@
+import pytest
+from httpx import AsyncClient
+
+from travelitinerarybackend.services.generation_jobs import GenerationJobWorker
+
+job_payload = {
+    "destination": "Paris",
+    "start_date": "2025-08-01",
+    "end_date": "2025-08-21",
+    "interests": ["food", "art"],
+}
+
+
+# Test queueing a job and polling it until done
+@pytest.mark.anyio
+async def test_generation_job(
+    async_client: AsyncClient, gemini_service, logged_in_token
+):
+    headers = {"Authorization": f"Bearer {logged_in_token}"}
+    response = await async_client.post(
+        "/api/itinerary/jobs", json=job_payload, headers=headers
+    )
+    assert response.status_code == 202
+    job = response.json()
+    assert job["status"] == "pending"
+
+    worker = GenerationJobWorker(gemini_service=gemini_service)
+    assert await worker.run_once()
+    assert not await worker.run_once()
+
+    response = await async_client.get(
+        f"/api/itinerary/jobs/{job['id']}", headers=headers
+    )
+    assert response.status_code == 200
+    finished = response.json()
+    assert finished["status"] == "succeeded"
+    assert finished["attempts"] == 1
+    assert finished["days_count"] == 21
+    assert finished["itinerary"][0]["day"] == 1
+
+
+@pytest.mark.anyio
+async def test_generation_job_invalid_callback(
+    async_client: AsyncClient, logged_in_token
+):
+    response = await async_client.post(
+        "/api/itinerary/jobs",
+        json={**job_payload, "callback_url": "not a url"},
+        headers={"Authorization": f"Bearer {logged_in_token}"},
+    )
+    assert response.status_code == 422
+
+
+@pytest.mark.anyio
+async def test_generation_job_plain_http_callback(
+    async_client: AsyncClient, logged_in_token
+):
+    response = await async_client.post(
+        "/api/itinerary/jobs",
+        json={**job_payload, "callback_url": "http://169.254.169.254/latest"},
+        headers={"Authorization": f"Bearer {logged_in_token}"},
+    )
+    assert response.status_code == 422
+    assert response.json()["detail"] == "Callback URL must use https"
+
+
+@pytest.mark.anyio
+async def test_get_nonexistent_generation_job(
+    async_client: AsyncClient, logged_in_token
+):
+    response = await async_client.get(
+        "/api/itinerary/jobs/999",
+        headers={"Authorization": f"Bearer {logged_in_token}"},
+    )
+    assert response.status_code == 404
@@ -0,0 +1,179 @@
+import asyncio
+import json
+
+import pytest
+
+from travelitinerarybackend.services.circuit_breaker import (
+    CLOSED,
+    HALF_OPEN,
+    OPEN,
+    CircuitBreaker,
+    CircuitOpenError,
+)
+from travelitinerarybackend.services.gemini_service import GeminiService
+from travelitinerarybackend.services.itinerary_cache import (
+    InMemoryCacheBackend,
+    ItineraryCache,
+)
+from travelitinerarybackend.tests.conftest import FakeGenerator
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+def make_breaker(**kwargs):
+    clock = FakeClock()
+    options = {"window": 4, "min_calls": 4, "failure_rate": 0.5, "open_seconds": 10}
+    return CircuitBreaker(clock=clock, **{**options, **kwargs}), clock
+
+
+def record(breaker, success: bool, seconds: float = 0.1):
+    probe = breaker.before_call()
+    breaker.after_call(success, seconds, probe)
+
+
+def test_opens_at_failure_rate():
+    breaker, _ = make_breaker()
+    for success in (True, False, True):
+        record(breaker, success)
+    assert breaker.state == CLOSED
+    record(breaker, False)
+    assert breaker.state == OPEN
+    with pytest.raises(CircuitOpenError) as exc_info:
+        breaker.before_call()
+    assert exc_info.value.retry_after == 10
+    assert breaker.stats()["rejected"] == 1
+
+
+def test_slow_calls_count_as_failures():
+    breaker, _ = make_breaker(slow_call_seconds=1.0)
+    for _ in range(4):
+        record(breaker, True, seconds=2.0)
+    assert breaker.state == OPEN
+
+
+def test_half_open_probe_closes_or_reopens():
+    breaker, clock = make_breaker()
+    for _ in range(4):
+        record(breaker, False)
+    clock.now += 10
+    assert breaker.state == HALF_OPEN
+
+    probe = breaker.before_call()
+    assert probe
+    # one probe at a time
+    with pytest.raises(CircuitOpenError):
+        breaker.before_call()
+    breaker.after_call(False, 0.1, probe)
+    assert breaker.state == OPEN
+
+    clock.now += 10
+    record(breaker, True)
+    assert breaker.state == CLOSED
+
+
+def half_open_breaker():
+    breaker, clock = make_breaker()
+    for _ in range(4):
+        record(breaker, False)
+    clock.now += 10
+    return breaker
+
+
+def test_released_probe_records_no_outcome():
+    breaker = half_open_breaker()
+    probe = breaker.before_call()
+    breaker.release(probe)
+    assert breaker.state == HALF_OPEN
+    assert breaker.before_call()
+
+
+@pytest.mark.anyio
+async def test_cancelled_probe_leaves_breaker_half_open():
+    breaker = half_open_breaker()
+    service = GeminiService(generator=FakeGenerator(delay=1), breaker=breaker)
+    call = asyncio.create_task(
+        service._generate("Rome", "2025-08-01", "2025-08-03", [])
+    )
+    await asyncio.sleep(0.01)
+    call.cancel()
+    with pytest.raises(asyncio.CancelledError):
+        await call
+    assert breaker.state == HALF_OPEN
+    assert breaker.before_call()
+
+
+@pytest.mark.anyio
+async def test_abandoned_stream_leaves_breaker_half_open():
+    breaker = half_open_breaker()
+    days = [{"day": day, "activities": ["Walk around"]} for day in (1, 2, 3)]
+    generator = FakeGenerator(delay=1, text=json.dumps({"itinerary": days}))
+    service = GeminiService(generator=generator, breaker=breaker)
+    stream = service.stream_itinerary("Rome", "2025-08-01", "2025-08-03", [])
+    assert await stream.__anext__() == days[0]
+    await stream.aclose()
+    assert breaker.state == HALF_OPEN
+    assert breaker.before_call()
+
+
+@pytest.mark.anyio
+async def test_waiting_for_a_slot_is_not_a_slow_call():
+    breaker, _ = make_breaker(min_calls=1, window=1, slow_call_seconds=0.15)
+    days = [{"day": 1, "activities": ["Walk around"]}]
+    generator = FakeGenerator(delay=0.1, text=json.dumps({"itinerary": days}))
+    service = GeminiService(
+        generator=generator, breaker=breaker, max_concurrency=1, hedge=False
+    )
+    await asyncio.gather(
+        *(
+            service.generate_itinerary_async(city, "2025-08-01", "2025-08-01", [])
+            for city in ("Rome", "Lima", "Oslo")
+        )
+    )
+    assert breaker.state == CLOSED
+
+
+@pytest.mark.anyio
+async def test_chunked_trip_is_a_single_probe():
+    breaker = half_open_breaker()
+    generator = FakeGenerator()
+    service = GeminiService(generator=generator, breaker=breaker)
+    await service.generate_itinerary_async("Rome", "2025-08-01", "2025-08-21", [])
+    assert generator.calls == 3
+    assert breaker.state == CLOSED
+
+
+class FailingGenerator(FakeGenerator):
+    async def generate(self, prompt: str, response_schema: dict = None) -> str:
+        raise RuntimeError("Vertex unavailable")
+
+
+@pytest.mark.anyio
+async def test_open_breaker_serves_cached_destination():
+    cache = ItineraryCache(InMemoryCacheBackend(max_entries=10), ttl_seconds=60)
+    breaker, _ = make_breaker(min_calls=1, window=1)
+    days = [{"day": day, "activities": ["Walk around"]} for day in (1, 2, 3)]
+    healthy = GeminiService(
+        generator=FakeGenerator(text=json.dumps({"itinerary": days})),
+        cache=cache,
+        breaker=breaker,
+    )
+    await healthy.generate_itinerary_async("Rome", "2025-08-01", "2025-08-03", ["art"])
+
+    service = GeminiService(generator=FailingGenerator(), cache=cache, breaker=breaker)
+    with pytest.raises(RuntimeError):
+        await service.generate_itinerary_async("Lima", "2025-08-01", "2025-08-01", [])
+    assert breaker.state == OPEN
+
+    # other interests and length, same destination
+    fallback = await service.generate_itinerary_async(
+        "rome", "2025-09-01", "2025-09-02", ["food"]
+    )
+    assert fallback == days[:2]
+    with pytest.raises(CircuitOpenError):
+        await service.generate_itinerary_async("Lima", "2025-08-01", "2025-08-01", [])
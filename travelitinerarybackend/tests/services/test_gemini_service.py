@@ -0,0 +1,380 @@
+import asyncio
+import json
+import re
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from travelitinerarybackend.config import config
+from travelitinerarybackend.metrics import MetricsRegistry
+from travelitinerarybackend.services import gemini_service
+from travelitinerarybackend.services.gemini_service import (
+    GeminiService,
+    get_gemini_service,
+    itinerary_response_schema,
+    split_days,
+)
+from travelitinerarybackend.tests.conftest import FakeGenerator
+
+
+@pytest.mark.anyio
+async def test_generate_itinerary_async():
+    service = GeminiService(generator=FakeGenerator())
+    itinerary = await service.generate_itinerary_async(
+        "Paris", "2025-08-01", "2025-08-01", ["food"]
+    )
+    assert itinerary == [{"day": 1, "activities": ["Walk around"]}]
+
+
+@pytest.mark.anyio
+async def test_generate_itinerary_async_respects_concurrency_limit():
+    generator = FakeGenerator(delay=0.05)
+    service = GeminiService(generator=generator, max_concurrency=2)
+    await asyncio.gather(
+        *[
+            service.generate_itinerary_async(
+                f"City {i}", "2025-08-01", "2025-08-01", ["food"]
+            )
+            for i in range(6)
+        ]
+    )
+    assert generator.calls == 6
+    assert generator.max_in_flight == 2
+
+
+@pytest.mark.anyio
+async def test_generate_itinerary_async_invalid_json():
+    service = GeminiService(generator=FakeGenerator(text="not json"))
+    with pytest.raises(RuntimeError):
+        await service.generate_itinerary_async(
+            "Paris", "2025-08-01", "2025-08-01", ["food"]
+        )
+
+
+@pytest.mark.anyio
+async def test_coalesced_requests_are_collected_as_metrics():
+    service = GeminiService(generator=FakeGenerator(delay=0.05))
+    await asyncio.gather(
+        *[
+            service.generate_itinerary_async(
+                "Paris", "2025-08-01", "2025-08-01", ["food"]
+            )
+            for _ in range(3)
+        ]
+    )
+    metrics = {
+        (name, tuple(labels.values())): value
+        for name, _, _, labels, value in service.collect_metrics()
+    }
+    assert metrics[("generation_single_flight_total", ("leaders",))] == 1
+    assert metrics[("generation_single_flight_total", ("coalesced",))] == 2
+    assert metrics[("generation_single_flight_in_flight", ())] == 0
+
+
+@pytest.mark.anyio
+async def test_stream_itinerary():
+    days = [{"day": day, "activities": ["Walk around"]} for day in (1, 2, 3)]
+    generator = FakeGenerator(
+        delay=0.5, text=json.dumps({"itinerary": days}), chunk_size=5
+    )
+    service = GeminiService(generator=generator)
+
+    streamed = []
+    start = time.perf_counter()
+    async for day in service.stream_itinerary(
+        "Paris", "2025-08-01", "2025-08-03", ["food"]
+    ):
+        streamed.append((time.perf_counter() - start, day))
+
+    assert [day for _, day in streamed] == days
+    # the first day shows up long before the generator is done
+    assert streamed[0][0] < streamed[-1][0] / 2
+
+
+@pytest.mark.anyio
+async def test_stream_itinerary_truncated():
+    generator = FakeGenerator(text='{"itinerary": [{"day": 1, "activities": []}')
+    service = GeminiService(generator=generator)
+    with pytest.raises(RuntimeError):
+        async for _ in service.stream_itinerary(
+            "Paris", "2025-08-01", "2025-08-03", ["food"]
+        ):
+            pass
+
+
+@pytest.mark.anyio
+async def test_stream_itinerary_skips_malformed_day():
+    text = (
+        '{"itinerary": [{"day": 1, "activities": ["A"]}, '
+        '{"day": 2, "activities": ["B" "C"]}, {"day": 3, "activities": ["D"]}]}'
+    )
+    service = GeminiService(generator=FakeGenerator(text=text, chunk_size=5))
+    streamed = [
+        day
+        async for day in service.stream_itinerary(
+            "Paris", "2025-08-01", "2025-08-03", ["food"]
+        )
+    ]
+    assert [day["day"] for day in streamed] == [1, 3]
+
+
+@pytest.mark.anyio
+async def test_slow_stream_reader_does_not_hold_a_slot():
+    days = [{"day": day, "activities": ["Walk around"]} for day in (1, 2, 3)]
+    generator = FakeGenerator(text=json.dumps({"itinerary": days}))
+    service = GeminiService(generator=generator, max_concurrency=1)
+    stream = service.stream_itinerary("Paris", "2025-08-01", "2025-08-03", ["food"])
+    assert await stream.__anext__() == days[0]
+
+    # the stream's reader stops there, the next call still gets the only slot
+    itinerary = await asyncio.wait_for(
+        service.generate_itinerary_async("Rome", "2025-08-01", "2025-08-03", []),
+        timeout=1,
+    )
+    assert itinerary == days
+    assert [day async for day in stream] == days[1:]
+
+
+class SegmentGenerator(FakeGenerator):
+    """Answers each segment prompt with its own days, numbered from 1"""
+
+    async def generate(self, prompt: str, response_schema: dict = None) -> str:
+        first_day, last_day = map(
+            int, re.search(r"Plan days (\d+) to (\d+)", prompt).groups()
+        )
+        self.text = json.dumps(
+            {
+                "itinerary": [
+                    {"day": day, "activities": [f"Activity {first_day + day - 1}"]}
+                    for day in range(1, last_day - first_day + 2)
+                ]
+            }
+        )
+        return await super().generate(prompt, response_schema)
+
+
+@pytest.mark.anyio
+async def test_structured_output_sends_response_schema():
+    generator = FakeGenerator()
+    service = GeminiService(generator=generator, structured_output=True)
+    await service.generate_itinerary_async("Paris", "2025-08-01", "2025-08-01", [])
+    assert generator.response_schema == itinerary_response_schema()
+    assert service.output_mode == "structured"
+
+
+@pytest.mark.anyio
+async def test_prompt_output_sends_no_response_schema():
+    generator = FakeGenerator()
+    service = GeminiService(generator=generator, structured_output=False)
+    await service.generate_itinerary_async("Paris", "2025-08-01", "2025-08-01", [])
+    assert generator.response_schema is None
+    assert service.output_mode == "prompt"
+
+
+def test_itinerary_response_schema():
+    day_schema = itinerary_response_schema()["properties"]["itinerary"]["items"]
+    assert day_schema["required"] == ["day", "activities"]
+    assert "title" not in json.dumps(day_schema)
+
+
+@pytest.mark.anyio
+async def test_parse_failures_are_counted_per_mode():
+    for structured, mode in ((True, "structured"), (False, "prompt")):
+        service = GeminiService(
+            generator=FakeGenerator(text="not json"), structured_output=structured
+        )
+        with pytest.raises(RuntimeError):
+            await service.generate_itinerary_async(
+                "Paris", "2025-08-01", "2025-08-01", []
+            )
+        assert service.parse_failures == {
+            "structured": int(structured),
+            "prompt": int(not structured),
+        }
+        assert service.parse_failures[mode] == 1
+
+
+class SchemaDroppingGenerator(FakeGenerator):
+    """Like VertexGenerator once the model rejected the response schema"""
+
+    def uses_response_schema(self, response_schema: dict) -> bool:
+        return False
+
+
+@pytest.mark.anyio
+async def test_parse_failures_follow_the_mode_actually_used():
+    service = GeminiService(
+        generator=SchemaDroppingGenerator(text="not json"), structured_output=True
+    )
+    with pytest.raises(RuntimeError):
+        await service.generate_itinerary_async("Paris", "2025-08-01", "2025-08-01", [])
+    assert service.output_mode == "prompt"
+    assert service.parse_failures == {"structured": 0, "prompt": 1}
+
+
+def test_split_days():
+    assert split_days(21, 7) == [(1, 7), (8, 14), (15, 21)]
+    assert split_days(10, 7) == [(1, 7), (8, 10)]
+    assert split_days(3, 7) == [(1, 3)]
+    assert split_days(30, 7, max_segments=3) == [(1, 10), (11, 20), (21, 30)]
+    assert split_days(21, 7, max_segments=4) == [(1, 7), (8, 14), (15, 21)]
+
+
+@pytest.mark.anyio
+async def test_long_trip_is_generated_in_concurrent_segments():
+    generator = SegmentGenerator(delay=0.2)
+    service = GeminiService(generator=generator)
+
+    start = time.perf_counter()
+    itinerary = await service.generate_itinerary_async(
+        "Japan", "2025-08-01", "2025-08-21", ["food"]
+    )
+    elapsed = time.perf_counter() - start
+
+    assert generator.calls == 3
+    assert generator.max_in_flight == 3
+    assert [day["day"] for day in itinerary] == list(range(1, 22))
+    assert itinerary[20]["activities"] == ["Activity 21"]
+    # about one segment round-trip, not three
+    assert elapsed < generator.delay * 2
+
+
+class FailingSegmentGenerator(SegmentGenerator):
+    """Fails the segment starting on day 8 at once, the others take delay"""
+
+    async def generate(self, prompt: str, response_schema: dict = None) -> str:
+        if "Plan days 8 to" in prompt:
+            raise RuntimeError("Vertex unavailable")
+        return await super().generate(prompt, response_schema)
+
+
+@pytest.mark.anyio
+async def test_failed_segment_cancels_the_others():
+    generator = FailingSegmentGenerator(delay=1)
+    service = GeminiService(generator=generator)
+    start = time.perf_counter()
+    with pytest.raises(RuntimeError, match="Vertex unavailable"):
+        await service.generate_itinerary_async(
+            "Japan", "2025-08-01", "2025-08-21", ["food"]
+        )
+    assert time.perf_counter() - start < generator.delay / 2
+    await asyncio.sleep(0.01)
+    assert generator.in_flight == 0
+
+
+@pytest.mark.anyio
+async def test_long_trip_segments_are_capped(monkeypatch):
+    monkeypatch.setattr(config, "GENERATION_MAX_SEGMENTS", 2)
+    generator = SegmentGenerator()
+    service = GeminiService(generator=generator)
+    itinerary = await service.generate_itinerary_async(
+        "Japan", "2025-08-01", "2025-08-30", ["food"]
+    )
+    assert generator.calls == 2
+    assert [day["day"] for day in itinerary] == list(range(1, 31))
+
+
+@pytest.mark.anyio
+async def test_short_trip_is_generated_in_one_call():
+    generator = FakeGenerator()
+    service = GeminiService(generator=generator)
+    await service.generate_itinerary_async(
+        "Paris", "2025-08-01", "2025-08-07", ["food"]
+    )
+    assert generator.calls == 1
+
+
+class FailingGenerator(FakeGenerator):
+    async def generate(self, prompt: str, response_schema: dict = None) -> str:
+        self.calls += 1
+        raise RuntimeError("quota exceeded")
+
+
+@pytest.mark.anyio
+async def test_slow_call_is_hedged_to_the_next_model(monkeypatch):
+    monkeypatch.setattr(config, "GENERATION_HEDGE_DELAY_SECONDS", 0.05)
+    primary = FakeGenerator(delay=1.0, name="primary")
+    fallback = FakeGenerator(delay=0.05, name="fallback")
+    service = GeminiService(
+        generator=primary, fallback_generators=[fallback], hedge=True
+    )
+
+    start = time.perf_counter()
+    await service.generate_itinerary_async("Paris", "2025-08-01", "2025-08-01", [])
+    assert time.perf_counter() - start < primary.delay / 2
+
+    # the slow primary call was cancelled
+    await asyncio.sleep(0)
+    assert primary.in_flight == 0
+    assert service.call_stats == {"hedges": 1, "hedge_wins": 1, "fallbacks": 0}
+    assert service.latencies["fallback"].count == 1
+    assert service.latencies["primary"].count == 0
+
+
+@pytest.mark.anyio
+async def test_fast_call_is_not_hedged(monkeypatch):
+    monkeypatch.setattr(config, "GENERATION_HEDGE_DELAY_SECONDS", 0.5)
+    primary = FakeGenerator(delay=0.01)
+    service = GeminiService(generator=primary, hedge=True)
+    await service.generate_itinerary_async("Paris", "2025-08-01", "2025-08-01", [])
+    assert primary.calls == 1
+    assert service.call_stats["hedges"] == 0
+
+
+@pytest.mark.anyio
+async def test_failed_call_falls_back_to_the_next_model():
+    primary = FailingGenerator(name="primary")
+    fallback = FakeGenerator(name="fallback")
+    service = GeminiService(generator=primary, fallback_generators=[fallback])
+    itinerary = await service.generate_itinerary_async(
+        "Paris", "2025-08-01", "2025-08-01", []
+    )
+    assert itinerary == [{"day": 1, "activities": ["Walk around"]}]
+    assert (primary.calls, fallback.calls) == (1, 1)
+    assert service.call_stats["fallbacks"] == 1
+
+
+@pytest.mark.anyio
+async def test_error_when_every_model_fails():
+    service = GeminiService(
+        generator=FailingGenerator(name="primary"),
+        fallback_generators=[FailingGenerator(name="fallback")],
+    )
+    with pytest.raises(RuntimeError, match="quota exceeded"):
+        await service.generate_itinerary_async("Paris", "2025-08-01", "2025-08-01", [])
+
+
+def test_hedge_delay_follows_recorded_latency(monkeypatch):
+    monkeypatch.setattr(config, "GENERATION_HEDGE_MIN_SAMPLES", 10)
+    monkeypatch.setattr(config, "GENERATION_HEDGE_PERCENTILE", 90)
+    generator = FakeGenerator()
+    service = GeminiService(generator=generator)
+    assert service.hedge_delay(generator) == config.GENERATION_HEDGE_DELAY_SECONDS
+    for latency in range(1, 11):
+        service.latencies["fake"].observe(latency)
+    assert service.hedge_delay(generator) == 10
+
+
+def test_service_is_built_once_under_concurrent_calls(monkeypatch):
+    class SlowService(GeminiService):
+        built = 0
+
+        def __init__(self, **kwargs):
+            # like loading the SDK, long enough for the other calls to arrive
+            time.sleep(0.1)
+            SlowService.built += 1
+            super().__init__(generator=FakeGenerator(), **kwargs)
+
+    registry = MetricsRegistry()
+    monkeypatch.setattr(gemini_service, "GeminiService", SlowService)
+    monkeypatch.setattr(gemini_service, "registry", registry)
+    gemini_service._build_gemini_service.cache_clear()
+    try:
+        with ThreadPoolExecutor(4) as pool:
+            services = list(pool.map(lambda _: get_gemini_service(), range(4)))
+    finally:
+        gemini_service._build_gemini_service.cache_clear()
+    assert SlowService.built == 1
+    assert all(service is services[0] for service in services)
+    assert len(registry._collectors) == 1
@@ -0,0 +1,204 @@
+import json
+from datetime import timedelta
+from functools import partial
+
+import httpx
+import pytest
+
+from travelitinerarybackend.config import config
+from travelitinerarybackend.database import database, generation_job_table
+from travelitinerarybackend.models.itinerary import UserItineraryIn
+from travelitinerarybackend.services import generation_jobs
+from travelitinerarybackend.services.circuit_breaker import CircuitBreaker
+from travelitinerarybackend.services.gemini_service import GeminiService
+from travelitinerarybackend.services.generation_jobs import (
+    CallbackURLError,
+    GenerationJobWorker,
+    check_callback_url,
+    enqueue_job,
+    get_job,
+    post_callback,
+    sign_callback,
+)
+from travelitinerarybackend.tests.conftest import FakeGenerator
+
+request = UserItineraryIn(
+    destination="Paris",
+    start_date="2025-08-01",
+    end_date="2025-08-03",
+    interests=["food"],
+)
+
+
+async def make_due(job_id: int):
+    query = (
+        generation_job_table.update()
+        .where(generation_job_table.c.id == job_id)
+        .values(run_after=generation_jobs.utcnow())
+    )
+    await database.execute(query)
+
+
+@pytest.mark.anyio
+async def test_failed_job_is_retried_with_backoff(registered_user: dict):
+    job = await enqueue_job(registered_user["id"], request)
+    worker = GenerationJobWorker(
+        gemini_service=GeminiService(generator=FakeGenerator(text="not json"))
+    )
+
+    assert await worker.run_once()
+    job = await get_job(job.id, registered_user["id"])
+    assert job.status == "pending"
+    assert job.attempts == 1
+    assert job.error
+    assert job.run_after > generation_jobs.utcnow()
+    # not due yet
+    assert not await worker.run_once()
+
+    for _ in range(config.JOB_MAX_ATTEMPTS - 1):
+        await make_due(job.id)
+        assert await worker.run_once()
+    job = await get_job(job.id, registered_user["id"])
+    assert job.status == "failed"
+    assert job.attempts == config.JOB_MAX_ATTEMPTS
+
+
+def test_retry_delay_is_exponential_and_capped():
+    worker = GenerationJobWorker()
+    assert worker.retry_delay(1) == config.JOB_RETRY_BASE_SECONDS
+    assert worker.retry_delay(2) == config.JOB_RETRY_BASE_SECONDS * 2
+    assert worker.retry_delay(100) == config.JOB_RETRY_MAX_SECONDS
+
+
+@pytest.mark.anyio
+async def test_stuck_job_is_requeued(registered_user: dict):
+    job = await enqueue_job(registered_user["id"], request)
+    worker = GenerationJobWorker(
+        gemini_service=GeminiService(generator=FakeGenerator())
+    )
+    claimed = await worker.claim()
+    assert claimed.id == job.id
+
+    # pretend the worker holding it died long ago
+    query = (
+        generation_job_table.update()
+        .where(generation_job_table.c.id == job.id)
+        .values(
+            locked_at=generation_jobs.utcnow()
+            - timedelta(seconds=config.JOB_STUCK_AFTER_SECONDS + 1)
+        )
+    )
+    await database.execute(query)
+
+    assert await worker.recover_stuck_jobs() == 1
+    assert (await get_job(job.id, registered_user["id"])).status == "pending"
+    assert await worker.run_once()
+    job = await get_job(job.id, registered_user["id"])
+    assert job.status == "succeeded"
+    assert job.attempts == 2
+
+
+@pytest.mark.anyio
+async def test_callback_is_notified(registered_user: dict):
+    notified = []
+
+    async def notify(url, payload):
+        notified.append((url, payload))
+
+    job = await enqueue_job(
+        registered_user["id"], request, callback_url="https://example.com/done"
+    )
+    worker = GenerationJobWorker(
+        gemini_service=GeminiService(generator=FakeGenerator()), notify=notify
+    )
+    assert await worker.run_once()
+
+    url, payload = notified[0]
+    assert url == "https://example.com/done"
+    assert payload["id"] == job.id
+    assert payload["status"] == "succeeded"
+
+
+@pytest.mark.anyio
+async def test_claim_without_returning(registered_user: dict, monkeypatch):
+    monkeypatch.setattr(generation_jobs, "supports_returning", lambda: False)
+    job = await enqueue_job(registered_user["id"], request)
+    worker = GenerationJobWorker(
+        gemini_service=GeminiService(generator=FakeGenerator())
+    )
+    claimed = await worker.claim()
+    assert claimed.id == job.id
+    assert claimed.status == "running"
+    assert await worker.claim() is None
+
+
+@pytest.mark.anyio
+async def test_open_circuit_postpones_job_without_an_attempt(registered_user: dict):
+    breaker = CircuitBreaker(window=1, min_calls=1, open_seconds=30)
+    breaker.after_call(False, 0.1, breaker.before_call())
+    job = await enqueue_job(registered_user["id"], request)
+    worker = GenerationJobWorker(
+        gemini_service=GeminiService(generator=FakeGenerator(), breaker=breaker)
+    )
+    assert await worker.run_once()
+
+    job = await get_job(job.id, registered_user["id"])
+    assert job.status == "pending"
+    assert job.attempts == 0
+    assert job.run_after > generation_jobs.utcnow() + timedelta(seconds=25)
+
+
+def test_check_callback_url(monkeypatch):
+    check_callback_url("https://example.com/done")
+    with pytest.raises(CallbackURLError):
+        check_callback_url("http://example.com/done")
+
+    monkeypatch.setattr(config, "JOB_CALLBACK_ALLOWED_HOSTS", ["example.com"])
+    check_callback_url("https://hooks.example.com/done")
+    for url in ("https://example.org/done", "https://badexample.com/done"):
+        with pytest.raises(CallbackURLError):
+            check_callback_url(url)
+
+
+@pytest.mark.anyio
+async def test_callback_refuses_internal_addresses():
+    for url in (
+        "https://127.0.0.1/done",
+        "https://localhost/done",
+        "https://169.254.169.254/latest/meta-data",
+        "https://[::1]/done",
+        "https://10.0.0.8/done",
+    ):
+        with pytest.raises(CallbackURLError):
+            await post_callback(url, {"id": 1})
+
+
+@pytest.mark.anyio
+async def test_callback_is_signed_and_sent_to_the_checked_address(monkeypatch):
+    sent = []
+
+    def handler(http_request: httpx.Request) -> httpx.Response:
+        sent.append(http_request)
+        return httpx.Response(200)
+
+    async def resolve(host, port):
+        return "93.184.216.34"
+
+    monkeypatch.setattr(generation_jobs, "resolve_public_address", resolve)
+    monkeypatch.setattr(
+        generation_jobs.httpx,
+        "AsyncClient",
+        partial(httpx.AsyncClient, transport=httpx.MockTransport(handler)),
+    )
+    monkeypatch.setattr(config, "JOB_CALLBACK_SECRET", "s3cret")
+    await post_callback("https://example.com/done", {"id": 1})
+
+    [sent_request] = sent
+    assert sent_request.url.host == "93.184.216.34"
+    assert sent_request.headers["Host"] == "example.com"
+    assert sent_request.extensions["sni_hostname"] == "example.com"
+    assert json.loads(sent_request.content) == {"id": 1}
+    timestamp = sent_request.headers["X-Signature-Timestamp"]
+    assert sent_request.headers["X-Signature"] == sign_callback(
+        sent_request.content, timestamp, "s3cret"
+    )
@@ -0,0 +1,183 @@
+import os
+import subprocess
+import sys
+import time
+from types import SimpleNamespace
+
+import pytest
+
+from travelitinerarybackend.metrics import registry
+from travelitinerarybackend.services.gemini_service import (
+    GeminiService,
+    itinerary_response_schema,
+)
+from travelitinerarybackend.services.generators import (
+    LocalGenerator,
+    VertexGenerator,
+    get_itinerary_generator,
+)
+from travelitinerarybackend.services.itinerary_parser import parse_itinerary
+
+
+def test_test_config_selects_local_generator():
+    assert isinstance(get_itinerary_generator(), LocalGenerator)
+
+
+@pytest.mark.anyio
+async def test_local_generator_answers_every_day():
+    service = GeminiService(generator=LocalGenerator(0, 0))
+    prompt = service.build_prompt("Rome", "2025-08-01", "2025-08-03", ["food"])
+    days = parse_itinerary(await service.generator.generate(prompt))
+    assert [day["day"] for day in days] == [1, 2, 3]
+    assert "Rome" in days[0]["activities"][0]
+
+
+@pytest.mark.anyio
+async def test_local_generator_answers_segment_days():
+    service = GeminiService(generator=LocalGenerator(0, 0))
+    prompt = service.build_segment_prompt(
+        "Rome", "2025-08-01", "2025-08-21", ["food"], 8, 14
+    )
+    days = parse_itinerary(await service.generator.generate(prompt))
+    assert [day["day"] for day in days] == list(range(8, 15))
+
+
+@pytest.mark.anyio
+async def test_local_generator_simulates_latency_and_token_rate():
+    generator = LocalGenerator(latency_seconds=0.05, tokens_per_second=2000)
+    prompt = GeminiService(generator=generator).build_prompt(
+        "Rome", "2025-08-01", "2025-08-03", []
+    )
+    expected = 0.05 + len(generator.answer(prompt)) / 4 / 2000
+
+    start = time.perf_counter()
+    await generator.generate(prompt)
+    assert time.perf_counter() - start >= expected
+
+    start = time.perf_counter()
+    chunks = [chunk async for chunk in generator.stream(prompt)]
+    assert time.perf_counter() - start >= expected
+    assert len(chunks) > 1
+    assert "".join(chunks) == generator.answer(prompt)
+
+
+def test_app_import_does_not_load_vertex_sdk():
+    # in a fresh interpreter, other tests may have imported the SDK already
+    code = "import sys, travelitinerarybackend.main; print('vertexai' in sys.modules)"
+    result = subprocess.run(
+        [sys.executable, "-c", code],
+        capture_output=True,
+        text=True,
+        env={**os.environ, "ENV_STATE": "test"},
+        check=True,
+    )
+    assert result.stdout.strip() == "False"
+
+
+@pytest.mark.anyio
+async def test_local_generator_counts_tokens():
+    generator = LocalGenerator(0, 0, name="local-tokens")
+    prompt = GeminiService(generator=generator).build_prompt(
+        "Rome", "2025-08-01", "2025-08-03", []
+    )
+    await generator.generate(prompt)
+    output = registry.counter(
+        "gemini_tokens_total", "", model="local-tokens", kind="output"
+    )
+    assert output.value == len(generator.answer(prompt)) // 4
+
+
+class FakeVertexModel:
+    def __init__(self, reject=None):
+        self.generation_configs = []
+        # raised for requests matching it: a schema is sent / any request
+        self.reject = reject
+
+    def _check(self, generation_config):
+        from google.api_core.exceptions import InvalidArgument
+
+        if self.reject == "schema" and generation_config is not None:
+            raise InvalidArgument("Unsupported response schema")
+        if self.reject == "any":
+            raise InvalidArgument("Prompt too long")
+
+    @staticmethod
+    def _response():
+        part = SimpleNamespace(text='{"itinerary": []}')
+        candidate = SimpleNamespace(content=SimpleNamespace(parts=[part]))
+        return SimpleNamespace(candidates=[candidate], usage_metadata=None)
+
+    async def generate_content_async(
+        self, contents, generation_config=None, stream=False
+    ):
+        self.generation_configs.append(generation_config)
+        if not stream:
+            self._check(generation_config)
+            return self._response()
+
+        async def responses():
+            # like the SDK, a rejected stream fails once it is read
+            self._check(generation_config)
+            yield self._response()
+
+        return responses()
+
+
+@pytest.mark.anyio
+async def test_vertex_generator_falls_back_to_prompt_output():
+    pytest.importorskip("vertexai")
+    generator = VertexGenerator()
+    generator.model = FakeVertexModel()
+    attempts = []
+
+    def reject_schema(**kwargs):
+        attempts.append(kwargs)
+        raise ValueError("Unknown field for Schema: property_ordering")
+
+    generator._generation_config_type = reject_schema
+    for _ in range(2):
+        text = await generator.generate("prompt", itinerary_response_schema())
+        assert text == '{"itinerary": []}'
+    # prompt output, and the schema is only tried once
+    assert generator.model.generation_configs == [None, None]
+    assert len(attempts) == 1
+    assert generator._generation_config(None) is None
+
+
+def vertex_generator(reject=None):
+    pytest.importorskip("vertexai")
+    generator = VertexGenerator()
+    generator.model = FakeVertexModel(reject)
+    generator._generation_config_type = lambda **kwargs: "config"
+    return generator
+
+
+@pytest.mark.anyio
+async def test_vertex_generator_falls_back_when_the_model_rejects_the_schema():
+    generator = vertex_generator(reject="schema")
+    schema = itinerary_response_schema()
+    assert generator.uses_response_schema(schema)
+    for _ in range(2):
+        assert await generator.generate("prompt", schema) == '{"itinerary": []}'
+    # rejected once, then prompt output only
+    assert generator.model.generation_configs == ["config", None, None]
+    assert not generator.uses_response_schema(schema)
+
+
+@pytest.mark.anyio
+async def test_vertex_generator_stream_falls_back_when_the_model_rejects_the_schema():
+    generator = vertex_generator(reject="schema")
+    schema = itinerary_response_schema()
+    chunks = [chunk async for chunk in generator.stream("prompt", schema)]
+    assert chunks == ['{"itinerary": []}']
+    assert generator.model.generation_configs == ["config", None]
+    assert not generator.uses_response_schema(schema)
+
+
+@pytest.mark.anyio
+async def test_vertex_generator_keeps_the_schema_on_other_rejections():
+    generator = vertex_generator(reject="any")
+    schema = itinerary_response_schema()
+    with pytest.raises(generator._invalid_argument_type):
+        await generator.generate("prompt", schema)
+    assert generator.uses_response_schema(schema)
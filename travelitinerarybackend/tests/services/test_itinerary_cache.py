@@ -0,0 +1,84 @@
+import pytest
+
+from travelitinerarybackend.services.gemini_service import GeminiService
+from travelitinerarybackend.services.itinerary_cache import (
+    InMemoryCacheBackend,
+    ItineraryCache,
+    RedisCacheBackend,
+    make_cache_key,
+)
+from travelitinerarybackend.tests.conftest import FakeGenerator
+
+
+class FakeRedis:
+    """Implements the subset of redis.asyncio.Redis used by RedisCacheBackend"""
+
+    def __init__(self):
+        self.store = {}
+
+    async def get(self, key):
+        value = self.store.get(key)
+        return value[0] if value else None
+
+    async def set(self, key, value, ex=None):
+        self.store[key] = (value.encode("utf8"), ex)
+
+
+class BrokenBackend:
+    async def get(self, key):
+        raise ConnectionError("cache down")
+
+    async def set(self, key, value, ttl_seconds):
+        raise ConnectionError("cache down")
+
+
+def test_cache_key_is_normalized():
+    key = make_cache_key("Paris", "2025-08-01", "2025-08-03", ["food", "art"])
+    assert key == make_cache_key(
+        "  paris ", "2025-09-10", "2025-09-12", ["Art", "food", "food"]
+    )
+    assert key != make_cache_key("Paris", "2025-08-01", "2025-08-04", ["food", "art"])
+    assert key != make_cache_key("Paris", "2025-08-01", "2025-08-03", ["food"])
+
+
+@pytest.mark.anyio
+async def test_cache_counts_hits_and_misses():
+    cache = ItineraryCache(InMemoryCacheBackend(max_entries=10), ttl_seconds=60)
+    assert await cache.get("key") is None
+    await cache.set("key", [{"day": 1}])
+    assert await cache.get("key") == [{"day": 1}]
+    assert cache.stats() == {"hits": 1, "misses": 1, "errors": 0}
+
+
+@pytest.mark.anyio
+async def test_redis_backend():
+    redis = FakeRedis()
+    cache = ItineraryCache(RedisCacheBackend(redis), ttl_seconds=60)
+    await cache.set("key", [{"day": 1}])
+    assert redis.store["key"][1] == 60
+    assert await cache.get("key") == [{"day": 1}]
+
+
+@pytest.mark.anyio
+async def test_broken_backend_is_a_miss():
+    cache = ItineraryCache(BrokenBackend(), ttl_seconds=60)
+    await cache.set("key", [{"day": 1}])
+    assert await cache.get("key") is None
+    assert cache.stats() == {"hits": 0, "misses": 1, "errors": 2}
+
+
+@pytest.mark.anyio
+async def test_gemini_service_uses_cache():
+    generator = FakeGenerator()
+    cache = ItineraryCache(InMemoryCacheBackend(max_entries=10), ttl_seconds=60)
+    service = GeminiService(generator=generator, cache=cache)
+
+    first = await service.generate_itinerary_async(
+        "Paris", "2025-08-01", "2025-08-01", ["food"]
+    )
+    second = await service.generate_itinerary_async(
+        "paris", "2025-09-01", "2025-09-01", ["Food"]
+    )
+    assert first == second
+    assert generator.calls == 1
+    assert cache.stats()["hits"] == 1
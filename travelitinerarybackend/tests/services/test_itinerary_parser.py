@@ -0,0 +1,113 @@
+import json
+
+import pytest
+
+from travelitinerarybackend.services.itinerary_parser import (
+    IncrementalDayParser,
+    ItineraryParseError,
+    parse_itinerary,
+)
+
+days = [
+    {"day": 1, "activities": ["Louvre {wing} visit", 'Dinner at "Chez Paul"']},
+    {"day": 2, "activities": [{"time": "Morning", "activity": "Back\\slash [bar]"}]},
+]
+payload = "```json\n" + json.dumps({"itinerary": days}, indent=2) + "\n```"
+
+
+def feed_in_chunks(text: str, size: int) -> tuple[list[dict], IncrementalDayParser]:
+    parser = IncrementalDayParser()
+    parsed = []
+    for i in range(0, len(text), size):
+        parsed.extend(parser.feed(text[i : i + size]))
+    return parsed, parser
+
+
+def test_parse_whole_payload():
+    parsed, parser = feed_in_chunks(payload, len(payload))
+    assert parsed == days
+    assert parser.complete
+
+
+def test_parse_any_chunk_size():
+    for size in (1, 2, 3, 7, 50):
+        parsed, parser = feed_in_chunks(payload, size)
+        assert parsed == days
+        assert parser.complete
+
+
+def test_day_is_emitted_once_complete():
+    first_day_end = payload.index("},")
+    parser = IncrementalDayParser()
+    assert parser.feed(payload[:first_day_end]) == []
+    assert parser.feed(payload[first_day_end : first_day_end + 1]) == [days[0]]
+    assert not parser.complete
+
+
+def test_truncated_payload_is_not_complete():
+    parsed, parser = feed_in_chunks(payload[:-20], 10)
+    assert parsed == days[:1]
+    assert not parser.complete
+
+
+def test_parse_itinerary_flattens_activity_objects():
+    assert parse_itinerary(payload) == [
+        days[0],
+        {"day": 2, "activities": ["Morning: Back\\slash [bar]"]},
+    ]
+
+
+def test_parse_itinerary_skips_surrounding_prose():
+    text = 'Here is your trip!\n{"itinerary": [{"day": 1, "activities": ["A"]}]}\nEnjoy {it}'
+    assert parse_itinerary(text) == [{"day": 1, "activities": ["A"]}]
+
+
+def test_parse_itinerary_repairs_trailing_commas():
+    text = '{"itinerary": [{"day": 1, "activities": ["A, ]", "B",],},],}'
+    assert parse_itinerary(text) == [{"day": 1, "activities": ["A, ]", "B"]}]
+
+
+def test_parse_itinerary_keeps_complete_days_of_truncated_output():
+    assert parse_itinerary(payload[:-20]) == days[:1]
+
+
+def test_parse_itinerary_drops_invalid_days():
+    text = json.dumps(
+        {"itinerary": [{"day": 1, "activities": ["A"]}, {"activities": "oops"}]}
+    )
+    assert parse_itinerary(text) == [{"day": 1, "activities": ["A"]}]
+
+
+def test_parse_itinerary_rejects_unusable_output():
+    for text in ("Sorry, I can't help with that", '{"itinerary": [{"day": "x"}]}'):
+        with pytest.raises(ItineraryParseError):
+            parse_itinerary(text)
+
+
+def test_incremental_parser_repairs_trailing_commas():
+    parser = IncrementalDayParser()
+    assert parser.feed('{"itinerary": [{"day": 1, "activities": ["A",],},') == [
+        {"day": 1, "activities": ["A"]}
+    ]
+
+
+malformed = (
+    '{"itinerary": [{"day": 1, "activities": ["A"]}, '
+    '{"day": 2, "activities": ["B" "C"]}, {"day": 3, "activities": ["D"]}]}'
+)
+
+
+def test_parse_itinerary_skips_malformed_days():
+    assert parse_itinerary(malformed) == [
+        {"day": 1, "activities": ["A"]},
+        {"day": 3, "activities": ["D"]},
+    ]
+
+
+def test_incremental_parser_skips_malformed_days():
+    parsed, parser = feed_in_chunks(malformed, 7)
+    assert parsed == [
+        {"day": 1, "activities": ["A"]},
+        {"day": 3, "activities": ["D"]},
+    ]
+    assert parser.complete
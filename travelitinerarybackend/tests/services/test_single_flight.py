@@ -0,0 +1,73 @@
+import asyncio
+
+import pytest
+
+from travelitinerarybackend.services.gemini_service import GeminiService
+from travelitinerarybackend.services.single_flight import SingleFlight
+from travelitinerarybackend.tests.conftest import FakeGenerator
+
+
+@pytest.mark.anyio
+async def test_concurrent_calls_share_one_upstream_call():
+    calls = 0
+
+    async def fn():
+        nonlocal calls
+        calls += 1
+        await asyncio.sleep(0.05)
+        return calls
+
+    flight = SingleFlight()
+    results = await asyncio.gather(*[flight.do("key", fn) for _ in range(5)])
+    assert results == [1] * 5
+    assert calls == 1
+    assert flight.stats() == {"leaders": 1, "coalesced": 4, "in_flight": 0}
+
+
+@pytest.mark.anyio
+async def test_errors_propagate_to_all_waiters():
+    async def fn():
+        await asyncio.sleep(0.05)
+        raise ValueError("upstream failed")
+
+    flight = SingleFlight()
+    results = await asyncio.gather(
+        *[flight.do("key", fn) for _ in range(3)], return_exceptions=True
+    )
+    assert all(isinstance(r, ValueError) for r in results)
+
+    # a finished call is forgotten, the next one goes upstream again
+    assert flight.stats()["in_flight"] == 0
+
+
+@pytest.mark.anyio
+async def test_cancelled_waiter_does_not_cancel_shared_call():
+    async def fn():
+        await asyncio.sleep(0.05)
+        return "done"
+
+    flight = SingleFlight()
+    first = asyncio.create_task(flight.do("key", fn))
+    second = asyncio.create_task(flight.do("key", fn))
+    await asyncio.sleep(0.01)
+    first.cancel()
+
+    assert await second == "done"
+    assert first.cancelled()
+
+
+@pytest.mark.anyio
+async def test_gemini_service_coalesces_identical_requests():
+    generator = FakeGenerator(delay=0.05)
+    service = GeminiService(generator=generator)
+    results = await asyncio.gather(
+        *[
+            service.generate_itinerary_async(
+                "Paris", "2025-08-01", "2025-08-01", ["food"]
+            )
+            for _ in range(5)
+        ]
+    )
+    assert generator.calls == 1
+    assert all(r == results[0] for r in results)
+    assert service.flight.coalesced == 4
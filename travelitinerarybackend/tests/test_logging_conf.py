@@ -0,0 +1,81 @@
+import logging
+import threading
+
+import pytest
+
+from travelitinerarybackend import logging_conf
+from travelitinerarybackend.logging_conf import (
+    PayloadLimitFilter,
+    SamplingFilter,
+    build_output_handlers,
+    configure_logging,
+    stop_logging,
+)
+
+
+class RecordingHandler(logging.Handler):
+    def __init__(self):
+        super().__init__()
+        self.records = []
+        self.threads = set()
+
+    def emit(self, record):
+        self.records.append(record)
+        self.threads.add(threading.get_ident())
+
+
+def make_record(
+    message: str, level: int = logging.INFO, name: str = "test"
+) -> logging.LogRecord:
+    return logging.LogRecord(name, level, __file__, 1, message, None, None)
+
+
+def test_payload_limit_truncates_long_messages():
+    record = make_record("x" * 50)
+    assert PayloadLimitFilter(max_chars=10).filter(record)
+    assert record.getMessage() == "xxxxxxxxxx... [40 chars truncated]"
+
+
+def test_sampling_keeps_every_warning():
+    sampling = SamplingFilter(rate=0)
+    assert not sampling.filter(make_record("info"))
+    assert sampling.filter(make_record("warning", logging.WARNING))
+
+
+def test_database_errors_stay_out_of_the_log_file(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    console, rotating_file = build_output_handlers(production=False)
+    try:
+        error = make_record("pool closed", logging.ERROR, "databases.backends")
+        assert console.filter(error)
+        assert not rotating_file.filter(error)
+        assert rotating_file.filter(make_record("saved", name="travelitinerarybackend"))
+    finally:
+        rotating_file.close()
+
+
+@pytest.fixture()
+def recording_handler(monkeypatch) -> RecordingHandler:
+    handler = RecordingHandler()
+    monkeypatch.setattr(
+        logging_conf, "build_output_handlers", lambda production: [handler]
+    )
+    yield handler
+    stop_logging()
+    # leave the loggers as the other tests found them
+    for name in ("uvicorn", "travelitinerarybackend", "databases", "asyncpg"):
+        logger = logging.getLogger(name)
+        logger.handlers.clear()
+        logger.propagate = True
+
+
+def test_records_are_written_on_the_listener_thread(recording_handler):
+    configure_logging()
+    logging.getLogger("travelitinerarybackend.test").info("queued")
+    # stopping the listener flushes the queue
+    stop_logging()
+
+    [record] = recording_handler.records
+    assert record.getMessage() == "queued"
+    assert record.correlation_id == "-"
+    assert threading.get_ident() not in recording_handler.threads
@@ -0,0 +1,43 @@
+from travelitinerarybackend.metrics import LatencyHistogram, MetricsRegistry
+
+
+def test_latency_histogram():
+    histogram = LatencyHistogram(buckets=(0.1, 1.0))
+    for seconds in (0.05, 0.1, 0.5, 2.0):
+        histogram.observe(seconds)
+    assert histogram.cumulative_counts() == [(0.1, 2), (1.0, 3), (float("inf"), 4)]
+    assert histogram.count == 4
+    assert histogram.sum == 2.65
+    assert histogram.quantile(0.5) == 0.5
+    assert histogram.quantile(0.99) == 2.0
+
+
+def test_latency_histogram_quantile_uses_recent_window():
+    histogram = LatencyHistogram(window=2)
+    assert histogram.quantile(0.5) is None
+    for seconds in (10.0, 1.0, 1.0):
+        histogram.observe(seconds)
+    assert histogram.quantile(0.99) == 1.0
+    assert histogram.count == 3
+
+
+def test_registry_renders_prometheus_text():
+    registry = MetricsRegistry()
+    registry.counter("jobs_total", "Jobs run", kind='say "hi"').inc(2)
+    registry.histogram("job_seconds", "Job time", buckets=(1.0,)).observe(0.5)
+    registry.add_collector(lambda: [("queue_depth", "gauge", "Queued jobs", {}, 3)])
+
+    assert registry.render().splitlines() == [
+        "# HELP jobs_total Jobs run",
+        "# TYPE jobs_total counter",
+        'jobs_total{kind="say \\"hi\\""} 2.0',
+        "# HELP job_seconds Job time",
+        "# TYPE job_seconds histogram",
+        'job_seconds_bucket{le="1.0"} 1',
+        'job_seconds_bucket{le="+Inf"} 1',
+        "job_seconds_sum 0.5",
+        "job_seconds_count 1",
+        "# HELP queue_depth Queued jobs",
+        "# TYPE queue_depth gauge",
+        "queue_depth 3.0",
+    ]
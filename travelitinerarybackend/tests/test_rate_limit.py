@@ -0,0 +1,144 @@
+import asyncio
+
+import pytest
+from fastapi import HTTPException
+
+from travelitinerarybackend.rate_limit import (
+    InMemoryRateLimitStore,
+    RateLimiter,
+    RedisRateLimitStore,
+    take_tokens,
+)
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+class FakeRedis:
+    """Runs the token bucket script of RedisRateLimitStore in Python"""
+
+    def __init__(self):
+        self.buckets = {}
+
+    async def eval(self, script, numkeys, key, now, rate, capacity, cost):
+        state, wait = take_tokens(self.buckets.get(key), now, rate, capacity, cost)
+        self.buckets[key] = state
+        return str(wait)
+
+
+class BrokenStore:
+    async def take(self, *args):
+        raise ConnectionError("redis down")
+
+
+def make_limiter(store=None, per_minute=60, burst=2, max_in_flight=10):
+    clock = FakeClock()
+    limiter = RateLimiter(
+        store or InMemoryRateLimitStore(),
+        per_minute=per_minute,
+        burst=burst,
+        max_in_flight=max_in_flight,
+        clock=clock,
+    )
+    return limiter, clock
+
+
+def test_take_tokens():
+    state, wait = take_tokens(None, now=0, rate=1, capacity=2, cost=2)
+    assert (state, wait) == ((0, 0), 0)
+    state, wait = take_tokens(state, now=0.5, rate=1, capacity=2, cost=1)
+    assert (state, wait) == ((0.5, 0.5), 0.5)
+    # refills up to the capacity only
+    state, wait = take_tokens(state, now=100, rate=1, capacity=2, cost=1)
+    assert (state, wait) == ((1, 100), 0)
+
+
+@pytest.mark.anyio
+async def test_bucket_is_per_user_and_refills():
+    limiter, clock = make_limiter()
+    await limiter.check(1)
+    await limiter.check(1)
+    with pytest.raises(HTTPException) as exc_info:
+        await limiter.check(1)
+    assert exc_info.value.status_code == 429
+    assert exc_info.value.headers == {"Retry-After": "1"}
+
+    await limiter.check(2)
+    clock.now += 1
+    await limiter.check(1)
+    assert limiter.rejected == {"rate": 1, "concurrency": 0}
+
+
+@pytest.mark.anyio
+async def test_batch_cost_is_capped_at_the_burst():
+    limiter, _ = make_limiter(burst=2)
+    await limiter.check(1, cost=5)
+    with pytest.raises(HTTPException):
+        await limiter.check(1)
+
+
+@pytest.mark.anyio
+async def test_in_flight_cap():
+    limiter, _ = make_limiter(burst=10, max_in_flight=2)
+    first = await limiter.acquire(1)
+    await limiter.acquire(2)
+    with pytest.raises(HTTPException) as exc_info:
+        await limiter.acquire(3)
+    assert exc_info.value.status_code == 429
+
+    first()
+    first()  # releasing twice frees one slot only
+    await limiter.acquire(3)
+    assert limiter.stats() == {
+        "in_flight": 2,
+        "max_in_flight": 2,
+        "rejected": {"rate": 0, "concurrency": 1},
+    }
+
+
+class SlowStore(InMemoryRateLimitStore):
+    async def take(self, *args):
+        await asyncio.sleep(0.01)
+        return await super().take(*args)
+
+
+@pytest.mark.anyio
+async def test_in_flight_cap_holds_for_concurrent_requests():
+    limiter, _ = make_limiter(SlowStore(), burst=10, max_in_flight=2)
+    results = await asyncio.gather(
+        *(limiter.acquire(user_id) for user_id in range(5)), return_exceptions=True
+    )
+    assert sum(not isinstance(result, HTTPException) for result in results) == 2
+    assert limiter.in_flight == 2
+
+
+@pytest.mark.anyio
+async def test_rate_limited_request_gives_its_slot_back():
+    limiter, _ = make_limiter(burst=1, max_in_flight=2)
+    await limiter.acquire(1)
+    with pytest.raises(HTTPException):
+        await limiter.acquire(1)
+    assert limiter.in_flight == 1
+
+
+@pytest.mark.anyio
+async def test_redis_store_is_shared_between_workers():
+    redis = FakeRedis()
+    worker_a, _ = make_limiter(RedisRateLimitStore(redis))
+    worker_b, _ = make_limiter(RedisRateLimitStore(redis))
+    await worker_a.check(1)
+    await worker_b.check(1)
+    with pytest.raises(HTTPException):
+        await worker_a.check(1)
+
+
+@pytest.mark.anyio
+async def test_broken_store_lets_requests_through():
+    limiter, _ = make_limiter(BrokenStore(), burst=1)
+    for _ in range(3):
+        await limiter.check(1)
@@ -1,3 +1,5 @@
+import asyncio
+
 import pytest
 from jose import jwt
 
@@ -69,3 +71,67 @@ async def test_get_current_user(registered_user: dict):
 async def test_get_current_user_invalid_token():
     with pytest.raises(security.HTTPException):
         await security.get_current_user(token="invalid token")
+
+
+@pytest.mark.anyio
+async def test_password_hashes_async():
+    password = "123456"
+    hashed_password = await security.get_password_hash_async(password)
+    assert await security.verify_password_async(password, hashed_password)
+    assert not await security.verify_password_async("wrong", hashed_password)
+
+
+@pytest.mark.anyio
+async def test_password_hashing_rejects_when_saturated(monkeypatch):
+    monkeypatch.setattr(security, "password_hash_pending", 0)
+    monkeypatch.setattr(security.config, "PASSWORD_HASH_MAX_PENDING", 2)
+    results = await asyncio.gather(
+        *[security.get_password_hash_async("123456") for _ in range(3)],
+        return_exceptions=True,
+    )
+    rejected = [r for r in results if isinstance(r, security.HTTPException)]
+    assert len(rejected) == 1
+    assert rejected[0].status_code == 503
+    assert security.password_hash_pending == 0
+
+
+def test_create_access_token_with_user_id():
+    token = security.create_access_token("email", user_id=1)
+    assert {"sub": "email", "uid": 1}.items() <= jwt.decode(
+        token, algorithms=[config.ALGORITHM], key=config.SECRET_KEY
+    ).items()
+
+
+@pytest.mark.anyio
+async def test_get_user_is_cached(registered_user: dict, monkeypatch):
+    await security.get_user(registered_user["email"])
+
+    async def fail_fetch_one(query):
+        raise AssertionError("user should come from the cache")
+
+    monkeypatch.setattr(security.database, "fetch_one", fail_fetch_one)
+    user = await security.get_user(registered_user["email"])
+    assert user.email == registered_user["email"]
+
+
+@pytest.mark.anyio
+async def test_invalidate_user(registered_user: dict):
+    await security.get_user(registered_user["email"])
+    security.invalidate_user(registered_user["email"])
+    assert security.user_cache.get(registered_user["email"]) is None
+
+
+@pytest.mark.anyio
+async def test_get_current_token_user_uses_embedded_id():
+    # no such user in the db, the token alone identifies it
+    token = security.create_access_token("token.only@dummy.com", user_id=42)
+    user = await security.get_current_token_user(token=token)
+    assert user.id == 42
+    assert user.email == "token.only@dummy.com"
+
+
+@pytest.mark.anyio
+async def test_get_current_token_user_falls_back_to_lookup(registered_user: dict):
+    token = security.create_access_token(registered_user["email"])
+    user = await security.get_current_token_user(token=token)
+    assert user.id == registered_user["id"]
@@ -0,0 +1,48 @@
+import asyncio
+
+import pytest
+
+from travelitinerarybackend.tracing import (
+    NOOP_SPAN,
+    InMemorySpanExporter,
+    Tracer,
+)
+
+
+@pytest.mark.anyio
+async def test_spans_nest_across_tasks():
+    exporter = InMemorySpanExporter()
+    tracer = Tracer(exporter)
+
+    async def child(name):
+        with tracer.span(name):
+            await asyncio.sleep(0)
+
+    with tracer.span("root", route="/x") as root:
+        await asyncio.gather(child("a"), child("b"))
+
+    spans = {span.name: span for span in exporter.get_finished_spans()}
+    assert spans["root"].parent_id is None
+    assert spans["root"].attributes == {"route": "/x"}
+    for name in ("a", "b"):
+        assert spans[name].parent_id == root.span_id
+        assert spans[name].trace_id == root.trace_id
+        assert spans[name].duration_seconds >= 0
+    # children end before their parent
+    assert list(spans) == ["a", "b", "root"]
+
+
+def test_span_records_errors():
+    exporter = InMemorySpanExporter()
+    with pytest.raises(KeyError):
+        with Tracer(exporter).span("lookup"):
+            raise KeyError("missing")
+    [span] = exporter.get_finished_spans()
+    assert span.status == "error"
+    assert span.attributes["error.type"] == "KeyError"
+
+
+def test_tracer_without_exporter_records_nothing():
+    with Tracer().span("ignored") as span:
+        span.set_attribute("key", "value")
+    assert span is NOOP_SPAN
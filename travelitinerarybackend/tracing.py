@@ -0,0 +1,219 @@
+import logging
+import random
+import time
+from collections import deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from functools import lru_cache
+from typing import Iterator, List, Optional, Protocol
+
+from asgi_correlation_id import correlation_id
+
+from travelitinerarybackend.config import config
+from travelitinerarybackend.metrics import route_template
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class Span:
+    """
+    A timed operation within a trace. Ids and attribute names follow OpenTelemetry:
+    128 bit trace ids, 64 bit span ids, hex encoded, nanosecond timestamps.
+    """
+
+    name: str
+    trace_id: str
+    span_id: str
+    parent_id: Optional[str] = None
+    attributes: dict = field(default_factory=dict)
+    start_time: int = 0
+    end_time: Optional[int] = None
+    status: str = "ok"
+
+    @property
+    def duration_seconds(self) -> Optional[float]:
+        if self.end_time is None:
+            return None
+        return (self.end_time - self.start_time) / 1e9
+
+    def set_attribute(self, key: str, value) -> None:
+        self.attributes[key] = value
+
+    def update_name(self, name: str) -> None:
+        self.name = name
+
+
+class _NoopSpan:
+    def set_attribute(self, key: str, value) -> None:
+        pass
+
+    def update_name(self, name: str) -> None:
+        pass
+
+
+NOOP_SPAN = _NoopSpan()
+
+_current_span: ContextVar[Optional[Span]] = ContextVar("current_span", default=None)
+
+
+class SpanExporter(Protocol):
+    def export(self, span: Span) -> None:
+        """Receive a span once it has ended"""
+        ...
+
+
+class InMemorySpanExporter:
+    """Keeps the last max_spans finished spans, for tests and debugging"""
+
+    def __init__(self, max_spans: int = 10_000):
+        self._spans: deque = deque(maxlen=max_spans)
+
+    def export(self, span: Span) -> None:
+        self._spans.append(span)
+
+    def get_finished_spans(self) -> List[Span]:
+        return list(self._spans)
+
+    def clear(self) -> None:
+        self._spans.clear()
+
+
+class LoggingSpanExporter:
+    """Logs every finished span at debug level, with its trace and parent ids"""
+
+    def export(self, span: Span) -> None:
+        logger.debug(
+            f"span {span.name} {span.duration_seconds * 1000:.1f}ms "
+            f"trace={span.trace_id} id={span.span_id} parent={span.parent_id} "
+            f"status={span.status} {span.attributes}"
+        )
+
+
+class Tracer:
+    """
+    Records spans nested by the current context: a span started while another
+    one is open, in the same task or in a task started from it, is its child.
+    Root spans carry the request's correlation id.
+    Without an exporter, span() costs next to nothing and records nothing.
+    """
+
+    def __init__(self, exporter: Optional[SpanExporter] = None):
+        self.exporter = exporter
+
+    @contextmanager
+    def span(self, name: str, **attributes) -> Iterator[Span]:
+        if self.exporter is None:
+            yield NOOP_SPAN
+            return
+
+        parent = _current_span.get()
+        if parent is None:
+            trace_id, parent_id = f"{random.getrandbits(128):032x}", None
+            request_id = correlation_id.get()
+            if request_id:
+                attributes["correlation_id"] = request_id
+        else:
+            trace_id, parent_id = parent.trace_id, parent.span_id
+        span = Span(
+            name=name,
+            trace_id=trace_id,
+            span_id=f"{random.getrandbits(64):016x}",
+            parent_id=parent_id,
+            attributes=attributes,
+            start_time=time.time_ns(),
+        )
+        token = _current_span.set(span)
+        try:
+            yield span
+        except BaseException as e:
+            span.status = "error"
+            span.attributes["error.type"] = type(e).__name__
+            raise
+        finally:
+            span.end_time = time.time_ns()
+            try:
+                _current_span.reset(token)
+            except ValueError:
+                # ended from another context, e.g. an async generator closed by the GC
+                _current_span.set(parent)
+            self.exporter.export(span)
+
+
+class OpenTelemetryTracer:
+    """
+    Hands spans to the OpenTelemetry API, exported by whatever SDK the deployment
+    configures (opentelemetry-instrument, a Cloud Trace exporter...).
+    """
+
+    def __init__(self):
+        try:
+            from opentelemetry import trace
+        except ImportError as e:
+            raise RuntimeError(
+                "TRACING_EXPORTER=otel requires the opentelemetry-api package"
+            ) from e
+        self._trace = trace
+        self._tracer = trace.get_tracer("travelitinerarybackend")
+
+    @contextmanager
+    def span(self, name: str, **attributes) -> Iterator[object]:
+        if not self._trace.get_current_span().get_span_context().is_valid:
+            request_id = correlation_id.get()
+            if request_id:
+                attributes["correlation_id"] = request_id
+        with self._tracer.start_as_current_span(name, attributes=attributes) as span:
+            yield span
+
+
+@lru_cache()
+def get_tracer():
+    if config.TRACING_EXPORTER is None:
+        return Tracer()
+    if config.TRACING_EXPORTER == "memory":
+        return Tracer(InMemorySpanExporter())
+    if config.TRACING_EXPORTER == "log":
+        return Tracer(LoggingSpanExporter())
+    if config.TRACING_EXPORTER == "otel":
+        return OpenTelemetryTracer()
+    raise ValueError(
+        f"Invalid TRACING_EXPORTER: {config.TRACING_EXPORTER}. "
+        "Must be one of [None, 'memory', 'log', 'otel']"
+    )
+
+
+def span(name: str, **attributes):
+    """Context manager timing a span named name, child of the current span"""
+    return get_tracer().span(name, **attributes)
+
+
+class TracingMiddleware:
+    """ASGI middleware opening the root span of every HTTP request"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        method = scope["method"]
+        status_code = 500
+
+        async def send_wrapper(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        with span(method, **{"http.request.method": method}) as request_span:
+            try:
+                await self.app(scope, receive, send_wrapper)
+            finally:
+                # the route is only known once the router has matched it
+                route = route_template(scope)
+                request_span.update_name(f"{method} {route}")
+                request_span.set_attribute("http.route", route)
+                request_span.set_attribute("http.response.status_code", status_code)